@@ -0,0 +1,149 @@
+"""
+Benchmark dos tipos de índice ANN: recall@k contra o flat, latência p50/p99
+por consulta e memória residente (anônima x mapeada de arquivo).
+
+Uso:
+    python -m benchmarks.ann_bench --index faiss_index
+    python -m benchmarks.ann_bench --synthetic 200000 --dim 1536 --output ann.json
+
+Cada variante é carregada em um subprocesso próprio, para que a memória
+medida seja só a daquele índice. Com mmap, a parte "file" é page cache
+compartilhado entre workers; a parte "anon" é o custo privado por worker.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from rag_service.ann import INDEX_TYPES, build_ann_index, flat_vectors, load_flat_master, read_index  # noqa: E402
+
+
+def memory_mb() -> dict:
+    values = {}
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("RssAnon", "RssFile"):
+                values[key] = int(rest.split()[0]) / 1024.0
+    return {"rss_anon_mb": round(values.get("RssAnon", 0.0), 1), "rss_file_mb": round(values.get("RssFile", 0.0), 1)}
+
+
+def synthetic_vectors(n: int, dim: int, seed: int = 7) -> np.ndarray:
+    # Vetores agrupados (mistura de gaussianas), mais próximos de embeddings reais que ruído uniforme
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 500), dim)).astype("float32")
+    assignments = rng.integers(0, len(centers), n)
+    return centers[assignments] + 0.3 * rng.standard_normal((n, dim)).astype("float32")
+
+
+def measure_variant(path: str, queries_path: str, truth_path: str, k: int, mmap: bool) -> dict:
+    """Executado no subprocesso: carrega o índice, mede latência, recall e memória."""
+    queries = np.load(queries_path)
+    truth = np.load(truth_path)
+    before = memory_mb()
+    started = time.perf_counter()
+    index = read_index(path, mmap=mmap)
+    load_s = time.perf_counter() - started
+
+    latencies = []
+    found = np.empty((len(queries), k), dtype="int64")
+    for i, query in enumerate(queries):
+        t0 = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - t0)
+        found[i] = ids[0]
+
+    hits = sum(len(set(found[i]) & set(truth[i])) for i in range(len(queries)))
+    after = memory_mb()
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "load_s": round(load_s, 4),
+        f"recall@{k}": round(hits / float(truth.size), 4),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "rss_anon_mb": round(after["rss_anon_mb"] - before["rss_anon_mb"], 1),
+        "rss_file_mb": round(after["rss_file_mb"] - before["rss_file_mb"], 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall x latência x memória dos tipos de índice ANN.")
+    parser.add_argument("--index", default="faiss_index", help="Diretório do índice (usa o flat como referência).")
+    parser.add_argument("--synthetic", type=int, default=0, help="Gera N vetores sintéticos em vez de ler o índice.")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--no-mmap", action="store_true")
+    parser.add_argument("--output", default=None, help="Arquivo JSON com os resultados.")
+    parser.add_argument("--measure", nargs=3, metavar=("INDEX", "QUERIES", "TRUTH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure_variant(*args.measure, k=args.k, mmap=not args.no_mmap)))
+        return
+
+    if args.synthetic:
+        vectors = synthetic_vectors(args.synthetic, args.dim)
+    else:
+        flat = load_flat_master(args.index)
+        if flat is None:
+            raise SystemExit(f"Nenhum índice flat encontrado em '{args.index}'.")
+        vectors = flat_vectors(flat)
+
+    rng = np.random.default_rng(11)
+    picks = rng.integers(0, len(vectors), args.queries)
+    noise = 0.1 * float(np.std(vectors)) * rng.standard_normal((args.queries, vectors.shape[1])).astype("float32")
+    queries = (vectors[picks] + noise).astype("float32")
+
+    reference = faiss.IndexFlatL2(vectors.shape[1])
+    reference.add(vectors)
+    _, truth = reference.search(queries, args.k)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        queries_path = os.path.join(tmp, "queries.npy")
+        truth_path = os.path.join(tmp, "truth.npy")
+        np.save(queries_path, queries)
+        np.save(truth_path, truth)
+
+        for index_type in args.types.split(","):
+            started = time.perf_counter()
+            index = build_ann_index(vectors, index_type)
+            build_s = time.perf_counter() - started
+            path = os.path.join(tmp, f"{index_type}.faiss")
+            faiss.write_index(index, path)
+            del index
+
+            command = [sys.executable, "-m", "benchmarks.ann_bench", "--k", str(args.k),
+                       "--measure", path, queries_path, truth_path]
+            if args.no_mmap:
+                command.append("--no-mmap")
+            output = subprocess.run(command, cwd=BASE_DIR, capture_output=True, text=True, check=True).stdout
+            measured = json.loads(output.strip().splitlines()[-1])
+            results.append({
+                "index_type": index_type,
+                "vectors": len(vectors),
+                "build_s": round(build_s, 3),
+                "file_mb": round(os.path.getsize(path) / 2 ** 20, 2),
+                "mmap": not args.no_mmap,
+                **measured,
+            })
+            print(json.dumps(results[-1]), flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
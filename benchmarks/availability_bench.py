@@ -0,0 +1,95 @@
+"""
+Benchmark do motor de disponibilidade (scheduler_service/availability.py)
+contra a implementação original dos slots.
+
+Uso:
+    python -m benchmarks.availability_bench
+    python -m benchmarks.availability_bench --repeats 50 --seed 7 --output availability.json
+
+Mede o tempo das duas versões para "slots de 90 dias" e "5 primeiros
+horários" (com a agenda livre e com os primeiros 60 dias lotados). A
+implementação original (Reference) fica em tests/availability_reference.py,
+junto da verificação de equivalência (tests/test_availability.py).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time as time_module
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "scheduler_service"))
+
+from availability import AvailabilityEngine, HolidayCalendar, IntervalIndex  # noqa: E402
+from tests.availability_reference import SERVICE_HOURS, TZ, Reference  # noqa: E402
+
+
+def timing(rng: random.Random, repeats: int) -> Dict[str, Any]:
+    holidays = HolidayCalendar()
+    engine = AvailabilityEngine(SERVICE_HOURS, TZ, holidays)
+    reference = Reference(SERVICE_HOURS, holidays)
+    first = date(2030, 1, 1)
+    # Agenda cheia: ~4 compromissos de 1h por dia útil em 90 dias
+    busy = []
+    for i in range(90):
+        for _ in range(4):
+            start = datetime.combine(first + timedelta(days=i), time(11)).replace(tzinfo=TZ)
+            start += timedelta(minutes=30 * rng.randrange(0, 14))
+            busy.append((start, start + timedelta(hours=1)))
+    last = first + timedelta(days=89)
+    after = datetime.combine(first, time(9)).replace(tzinfo=TZ)
+
+    def measure(fn) -> float:
+        started = time_module.perf_counter()
+        for _ in range(repeats):
+            fn()
+        return (time_module.perf_counter() - started) / repeats * 1000
+
+    # Agenda lotada nos primeiros 60 dias: "próximos horários" precisa varrer dois meses
+    booked = busy + [
+        (datetime.combine(first + timedelta(days=i), time(0)).replace(tzinfo=TZ),
+         datetime.combine(first + timedelta(days=i), time(23)).replace(tzinfo=TZ))
+        for i in range(60)
+    ]
+    index = IntervalIndex(busy, TZ)
+    booked_index = IntervalIndex(booked, TZ)
+    return {
+        "busy_intervals": len(busy),
+        "range_90_days_ms": {
+            "reference": round(measure(lambda: [reference.slots_from_busy(first + timedelta(days=i), busy) for i in range(90)]), 3),
+            "engine": round(measure(lambda: engine.slots_between(first, last, index)), 3),
+            "engine_with_index_build": round(measure(lambda: engine.slots_between(first, last, IntervalIndex(busy, TZ))), 3),
+        },
+        "first_5_ms": {
+            "reference": round(measure(lambda: reference.first_available(busy, after, 5, 90)), 3),
+            "engine": round(measure(lambda: engine.first_available(index, after, 5, 90)), 3),
+        },
+        "first_5_after_60_booked_days_ms": {
+            "reference": round(measure(lambda: reference.first_available(booked, after, 5, 90)), 3),
+            "engine": round(measure(lambda: engine.first_available(booked_index, after, 5, 90)), 3),
+        },
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Motor de disponibilidade x implementação original: tempos.")
+    parser.add_argument("--seed", type=int, default=None, help="Semente da agenda sorteada (padrão: aleatória, mostrada no resultado).")
+    parser.add_argument("--repeats", type=int, default=20, help="Repetições de cada medição de tempo.")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 30)
+    result: Dict[str, Any] = {"seed": seed, "timing": timing(random.Random(seed), args.repeats)}
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
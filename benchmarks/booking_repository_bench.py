@@ -0,0 +1,111 @@
+"""
+Benchmark do InMemoryBookingRepository (bookings.py) x a varredura linear que
+o main_mock fazia sobre a lista MOCK_AGENDAMENTOS.
+
+Uso:
+    python -m benchmarks.booking_repository_bench
+    python -m benchmarks.booking_repository_bench --bookings 200000 --planners 200 --queries 5000
+
+Mede a busca do agendamento ativo (reagendar/cancelar) e a consulta de
+sobreposição (conflitos do /bulk/ e slots), conferindo que as duas
+implementações devolvem os mesmos agendamentos.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+from zoneinfo import ZoneInfo
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, "scheduler_service"))
+
+from bookings import STATUS_ACTIVE, STATUS_CANCELED, InMemoryBookingRepository  # noqa: E402
+
+TZ = ZoneInfo("America/Sao_Paulo")
+FIRST = datetime(2030, 1, 7, 11, tzinfo=TZ)
+
+
+def make_rows(n: int, planners: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        start = FIRST + timedelta(days=rng.randrange(365), minutes=rng.randrange(0, 420, 10))
+        rows.append({
+            "id": i + 1,
+            "id_lifeplanner": f"lp-{rng.randrange(planners)}",
+            "cliente_celular": f"55{i:09d}",
+            "start_time": start,
+            "end_time": start + timedelta(minutes=rng.choice((30, 50, 60, 120))),
+            "event_ide_google": f"ev-{i}",
+            "status": STATUS_ACTIVE if rng.random() < 0.8 else STATUS_CANCELED,
+        })
+    return rows
+
+
+def timed(fn, queries: List[Any]) -> float:
+    started = time.perf_counter()
+    for q in queries:
+        fn(*q)
+    return (time.perf_counter() - started) / len(queries)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Repositório em memória indexado x varredura linear.")
+    parser.add_argument("--bookings", type=int, default=50000)
+    parser.add_argument("--planners", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rows = make_rows(args.bookings, args.planners, args.seed)
+    started = time.perf_counter()
+    repo = InMemoryBookingRepository(rows)
+    load_s = time.perf_counter() - started
+
+    rng = random.Random(args.seed + 1)
+    lookups = [(r["id_lifeplanner"], r["cliente_celular"]) for r in rng.sample(rows, min(args.queries, len(rows)))]
+    windows = []
+    for _ in range(args.queries):
+        start = FIRST + timedelta(days=rng.randrange(365), minutes=rng.randrange(0, 420, 10))
+        windows.append((f"lp-{rng.randrange(args.planners)}", start, start + timedelta(minutes=60)))
+
+    def scan_active(lp, phone):
+        return next((r for r in rows if r["id_lifeplanner"] == lp and r["cliente_celular"] == phone
+                     and r["status"] == STATUS_ACTIVE), None)
+
+    def scan_overlapping(lp, start, end):
+        return sorted((r for r in rows if r["id_lifeplanner"] == lp and r["status"] == STATUS_ACTIVE
+                       and r["start_time"] < end and r["end_time"] > start), key=lambda r: (r["start_time"], r["id"]))
+
+    # Mesmos resultados nas duas implementações
+    for lp, phone in lookups[:200]:
+        a, b = repo.find_active(lp, phone), scan_active(lp, phone)
+        assert (a and a["id"]) == (b and b["id"]), (lp, phone)
+    for lp, start, end in windows[:200]:
+        a = [r["id"] for r in repo.overlapping(lp, start, end)]
+        b = [r["id"] for r in scan_overlapping(lp, start, end)]
+        assert a == b, (lp, start, a, b)
+
+    linear_queries = max(1, args.queries // 20)  # a varredura é lenta; amostra menor
+    result = {
+        "bookings": args.bookings,
+        "planners": args.planners,
+        "load_ms": round(load_s * 1000, 1),
+        "find_active_us": {
+            "indexed": round(timed(repo.find_active, lookups) * 1e6, 2),
+            "linear": round(timed(scan_active, lookups[:linear_queries]) * 1e6, 2),
+        },
+        "overlapping_us": {
+            "indexed": round(timed(repo.overlapping, windows) * 1e6, 2),
+            "linear": round(timed(scan_overlapping, windows[:linear_queries]) * 1e6, 2),
+        },
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
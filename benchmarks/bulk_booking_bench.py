@@ -0,0 +1,173 @@
+"""
+Benchmark do agendamento em lote: N chamadas a /agendar/ (uma ida ao
+Google Calendar por agendamento) x uma chamada a /agendar/bulk/ (freebusy +
+lotes do Calendar + uma gravação no Supabase).
+
+Uso:
+    python -m benchmarks.bulk_booking_bench
+    python -m benchmarks.bulk_booking_bench --items 100 --planners 10 --latency 0.08 --concurrency 8 --output bulk.json
+
+O scheduler_service roda em processo (TestClient) com o CalendarClientPool
+real apontado para um FakeCalendarServer local (HTTPS com certificado
+autoassinado, ou HTTP com --no-tls), que atende events, freeBusy e o endpoint
+de lotes multipart (/batch/calendar/v3) com --latency por requisição HTTP. O
+Supabase é o FakeSupabaseClient em memória. O modo 'parallel' manda os N
+agendamentos individuais com --concurrency threads (uma rajada do n8n).
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "scheduler_service"))
+
+_TMP = tempfile.mkdtemp(prefix="bench-bulk-")
+os.environ.setdefault("SUPABASE_OUTBOX_PATH", os.path.join(_TMP, "outbox.sqlite"))
+os.environ.setdefault("CALENDAR_SYNC_REFRESH_SECONDS", "0")
+
+import httplib2  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from google.oauth2.service_account import Credentials  # noqa: E402
+
+from benchmarks.fakes import (  # noqa: E402
+    FakeCalendarServer,
+    FakeSupabaseClient,
+    fake_service_account_file,
+    percentile,
+    self_signed_certificate,
+)
+from calendar_client import CALENDAR_SCOPES, CalendarClientPool  # noqa: E402
+
+MODES = ("sequential", "parallel", "bulk")
+FIRST_DAY = date(2030, 3, 11)  # segunda-feira sem feriado; cada modo usa semanas próprias
+
+
+def booking(index: int, planners: int, week: int) -> Dict[str, Any]:
+    """Agendamento 'index' sem conflitos: um horário livre distinto por life planner."""
+    slot = index // planners
+    day = FIRST_DAY + timedelta(weeks=week, days=slot // 7 % 5 + 7 * (slot // 35))
+    start = datetime(day.year, day.month, day.day, 11 + slot % 7)
+    return {
+        "summary": f"Consulta campanha {index}",
+        "description": "Dia de campanha",
+        "start_time": start.isoformat() + "-03:00",
+        "end_time": (start + timedelta(minutes=50)).isoformat() + "-03:00",
+        "attendee_emails": [],
+        "cliente_id": f"lp-{index % planners}",
+        "cliente_celular": f"5511{index:07d}",
+    }
+
+
+def run_mode(mode: str, client: TestClient, server: FakeCalendarServer, db: FakeSupabaseClient,
+             args: argparse.Namespace, week: int) -> Dict[str, Any]:
+    items = [booking(i, args.planners, week) for i in range(args.items)]
+    before = dict(server.counts)
+    db_before = dict(db.calls)
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    def one(body: Dict[str, Any]) -> None:
+        started = time.perf_counter()
+        response = client.post("/agendar/", json=body)
+        latencies.append(time.perf_counter() - started)
+        key = "success" if response.status_code == 200 else f"http_{response.status_code}"
+        statuses[key] = statuses.get(key, 0) + 1
+
+    started = time.perf_counter()
+    if mode == "sequential":
+        for body in items:
+            one(body)
+    elif mode == "parallel":
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(one, items))
+    else:
+        response = client.post("/agendar/bulk/", json={"agendamentos": items})
+        response.raise_for_status()
+        for result in response.json()["results"]:
+            statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "mode": mode,
+        "items": args.items,
+        "planners": args.planners,
+        "wall_ms": round(elapsed * 1000, 1),
+        "per_item_ms": round(elapsed * 1000 / args.items, 2),
+        "statuses": statuses,
+        "calendar_http_requests": server.counts["requests"] - before["requests"],
+        "calendar_batches": server.counts["batches"] - before["batches"],
+        "calendar_connections": server.counts["connections"] - before["connections"],
+        "supabase_calls": {k: v - db_before.get(k, 0) for k, v in db.calls.items() if v - db_before.get(k, 0)},
+    }
+    if latencies:
+        result["request_p50_ms"] = round(percentile(latencies, 50) * 1000, 2)
+        result["request_p95_ms"] = round(percentile(latencies, 95) * 1000, 2)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Agendamentos individuais x /agendar/bulk/, contra um Calendar falso.")
+    parser.add_argument("--modes", default=",".join(MODES), type=lambda v: v.split(","))
+    parser.add_argument("--items", type=int, default=60)
+    parser.add_argument("--planners", type=int, default=6)
+    parser.add_argument("--latency", type=float, default=0.05, help="Latência do Calendar falso por requisição HTTP (s).")
+    parser.add_argument("--supabase-latency", type=float, default=0.03)
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads do modo 'parallel'.")
+    parser.add_argument("--no-tls", action="store_true")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    invalid = [m for m in args.modes if m not in MODES]
+    if invalid:
+        raise SystemExit(f"Modos inválidos: {', '.join(invalid)}. Use: {', '.join(MODES)}.")
+
+    import supabase_supabase
+    import scheduler_service.main as scheduler
+
+    certfile = keyfile = None
+    if not args.no_tls:
+        certfile, keyfile = self_signed_certificate(_TMP)
+        httplib2.CA_CERTS = certfile
+
+    results = []
+    with FakeCalendarServer(latency=args.latency, certfile=certfile, keyfile=keyfile) as server:
+        service_account_file = fake_service_account_file(os.path.join(_TMP, "sa.json"), f"{server.url}/token")
+        scheduler.calendar_pool = CalendarClientPool(
+            lambda: Credentials.from_service_account_file(service_account_file, scopes=CALENDAR_SCOPES),
+            api_endpoint=f"{server.url}/calendar/v3/",
+        )
+        db = FakeSupabaseClient(latency=args.supabase_latency)
+        db.tables["life_planners"] = [{"id": f"lp-{n}", "email_calendario": f"lp{n}@agenda.fake"} for n in range(args.planners)]
+        supabase_supabase.get_supabase_client = lambda: db
+        scheduler.get_supabase_client = lambda: db
+        for n in range(args.planners):
+            # Agenda existente (o freebusy devolve notFound para agendas desconhecidas)
+            server.calendar.add_event(f"lp{n}@agenda.fake", "2030-01-07T08:00:00-03:00", "2030-01-07T09:00:00-03:00")
+
+        # Um único portal (event loop + threadpool) para todas as requisições, como no uvicorn
+        with TestClient(scheduler.app) as client:
+            # Aquece cliente, token e cache de life planners fora da medição
+            client.post("/agendar/slots/range/", json={"start_date": "2030-01-07", "life_planners": [f"lp-{n}" for n in range(args.planners)]})
+            for week, mode in enumerate(args.modes):
+                result = run_mode(mode, client, server, db, args, week * 20)
+                result["calendar_latency_s"] = args.latency
+                result["tls"] = not args.no_tls
+                results.append(result)
+                print(json.dumps(result), flush=True)
+        if scheduler.outbox is not None:
+            scheduler.outbox.stop()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
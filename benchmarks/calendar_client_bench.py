@@ -0,0 +1,136 @@
+"""
+Benchmark do cliente do Google Calendar: cliente montado a cada chamada (como
+o get_calendar_service antigo) x cliente compartilhado do processo
+(scheduler_service/calendar_client.py).
+
+Uso:
+    python -m benchmarks.calendar_client_bench
+    python -m benchmarks.calendar_client_bench --threads 16 --requests 400 --latency 0.02 --output calendar.json
+
+Sobe um FakeCalendarServer local (HTTPS com certificado autoassinado, ou HTTP
+com --no-tls) com um token_uri OAuth falso e gera uma service account com
+chave RSA nova. Assim os modos percorrem o caminho real: leitura da chave,
+discovery, obtenção do token, handshake TLS e a chamada events.list. O modo
+'delegated' usa um cliente por organizador (LRU) com --organizers agendas.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "scheduler_service"))
+
+import httplib2  # noqa: E402
+from google.oauth2.service_account import Credentials  # noqa: E402
+from googleapiclient.discovery import build  # noqa: E402
+
+from benchmarks.fakes import FakeCalendarServer, fake_service_account_file, percentile, self_signed_certificate  # noqa: E402
+from calendar_client import CALENDAR_SCOPES, CalendarClientPool  # noqa: E402
+
+MODES = ("legacy", "shared", "delegated")
+TIME_MIN = "2030-01-01T11:00:00-03:00"
+TIME_MAX = "2030-01-01T18:00:00-03:00"
+
+
+def legacy_factory(service_account_file: str, endpoint: str) -> Callable[[str], Any]:
+    """O que o get_calendar_service fazia em toda chamada."""
+    def factory(organizer: str) -> Any:
+        creds = Credentials.from_service_account_file(service_account_file, scopes=CALENDAR_SCOPES)
+        return build("calendar", "v3", credentials=creds, client_options={"api_endpoint": endpoint})
+    return factory
+
+
+def run_mode(mode: str, server: FakeCalendarServer, service_account_file: str, args: argparse.Namespace) -> Dict[str, Any]:
+    endpoint = f"{server.url}/calendar/v3/"
+    pool = None
+    if mode == "legacy":
+        factory = legacy_factory(service_account_file, endpoint)
+    else:
+        pool = CalendarClientPool(
+            lambda: Credentials.from_service_account_file(service_account_file, scopes=CALENDAR_SCOPES),
+            api_endpoint=endpoint,
+            delegation=mode == "delegated",
+            max_delegated=args.max_delegated,
+        )
+        factory = pool.client
+
+    before = dict(server.counts)
+    client_s: List[float] = []
+    latencies: List[float] = []
+
+    def one(i: int) -> None:
+        organizer = f"lp{i % args.organizers}@agenda.fake"
+        started = time.perf_counter()
+        service = factory(organizer)
+        client_s.append(time.perf_counter() - started)
+        service.events().list(calendarId=organizer, timeMin=TIME_MIN, timeMax=TIME_MAX,
+                              singleEvents=True, orderBy="startTime").execute()
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(one, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "mode": mode,
+        "threads": args.threads,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "client_ms_mean": round(sum(client_s) / len(client_s) * 1000, 3),
+        "connections_opened": server.counts["connections"] - before["connections"],
+        "token_requests": server.counts["tokens"] - before["tokens"],
+    }
+    if pool is not None:
+        result["pool"] = pool.stats()
+        pool.reset()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Cliente do Calendar por chamada x compartilhado, contra um servidor falso.")
+    parser.add_argument("--modes", default=",".join(MODES), type=lambda v: v.split(","))
+    parser.add_argument("--threads", type=int, default=8, help="Simula o threadpool do FastAPI.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latência do servidor falso por requisição (s).")
+    parser.add_argument("--organizers", type=int, default=8)
+    parser.add_argument("--max-delegated", type=int, default=32)
+    parser.add_argument("--no-tls", action="store_true", help="HTTP puro (sem o custo do handshake TLS).")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    invalid = [m for m in args.modes if m not in MODES]
+    if invalid:
+        raise SystemExit(f"Modos inválidos: {', '.join(invalid)}. Use: {', '.join(MODES)}.")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        certfile = keyfile = None
+        if not args.no_tls:
+            certfile, keyfile = self_signed_certificate(tmp)
+            # Toda conexão httplib2 criada daqui em diante confia no certificado do servidor falso
+            httplib2.CA_CERTS = certfile
+        with FakeCalendarServer(latency=args.latency, certfile=certfile, keyfile=keyfile) as server:
+            service_account_file = fake_service_account_file(os.path.join(tmp, "sa.json"), f"{server.url}/token")
+            for mode in args.modes:
+                result = run_mode(mode, server, service_account_file, args)
+                result["tls"] = not args.no_tls
+                results.append(result)
+                print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
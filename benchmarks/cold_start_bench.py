@@ -0,0 +1,150 @@
+"""
+Benchmark da subida a frio do rag.py: tempo de import, liveness, readiness e
+primeira resposta de um processo novo (como um restart do container).
+
+Uso:
+    python -m benchmarks.cold_start_bench
+    python -m benchmarks.cold_start_bench --runs 5 --llm-latency 0.2 --first-request after-ready
+
+Cada rodada sobe um processo Python novo que importa o rag, entra no lifespan
+(o pré-aquecimento roda em background) e mede, a partir do início do
+processo filho, quando /health/live e /health/ready respondem 200 e quando a
+primeira pergunta do /ask volta. Com --first-request immediate (padrão) a
+pergunta sai junto com o liveness, antes do readiness: mede o caminho sob
+demanda, que reaproveita as cargas em andamento.
+
+Os clientes reais da OpenAI apontam para um FakeOpenAIServer local
+(/v1/completions e /v1/embeddings). Os embeddings usam o OpenAIEmbeddings do
+langchain_openai sem a contagem de tokens: o do langchain_community baixaria
+o encoding do tiktoken, o que não funciona offline.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+METRICS = ("import_s", "live_s", "ready_s", "first_answer_s", "prewarm_s", "prewarm_sequential_s", "wall_s")
+
+
+async def serve_first_request(rag: Any, started: float, first_request: str) -> Dict[str, Any]:
+    import httpx
+
+    timings: Dict[str, Any] = {}
+    async with rag.lifespan(rag.app):
+        transport = httpx.ASGITransport(app=rag.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            response = await client.get("/health/live")
+            assert response.status_code == 200, response.text
+            timings["live_s"] = time.perf_counter() - started
+
+            async def wait_ready() -> None:
+                while (await client.get("/health/ready")).status_code != 200:
+                    await asyncio.sleep(0.005)
+                timings["ready_s"] = time.perf_counter() - started
+
+            async def ask() -> None:
+                response = await client.post("/ask", json={"question": "Qual a carência do seguro de vida?"})
+                timings["first_answer_s"] = time.perf_counter() - started
+                timings["first_answer_status"] = response.status_code
+
+            if first_request == "after-ready":
+                await wait_ready()
+                await ask()
+            else:
+                await asyncio.gather(wait_ready(), ask())
+            stats = rag.prewarm.stats()
+            timings["prewarm_s"] = stats["seconds"]
+            timings["prewarm_sequential_s"] = round(sum(s["seconds"] for s in stats["steps"].values()), 3)
+            timings["prewarm_steps"] = {name: s["seconds"] for name, s in stats["steps"].items()}
+    return timings
+
+
+def child(first_request: str) -> None:
+    started = time.perf_counter()
+    sys.path.insert(0, os.path.join(BASE_DIR, "scheduler_service"))
+    import rag
+
+    imported = time.perf_counter() - started
+
+    def build_embeddings():
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(model=rag.EMBEDDING_MODEL, check_embedding_ctx_length=False, max_retries=0)
+
+    rag.embedding_client.factory = build_embeddings
+    timings = asyncio.run(serve_first_request(rag, started, first_request))
+    timings["import_s"] = imported
+    print("RESULT " + json.dumps(timings))
+
+
+def run_child(server_url: str, first_request: str, tmp: str) -> Dict[str, Any]:
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "fake-key",
+        "OPENAI_API_BASE": server_url,
+        "FAISS_INDEX_POLL_SECONDS": "0",
+        "EMBEDDING_CACHE_PATH": "",
+        "SEMANTIC_CACHE_SIZE": "0",
+        "SUPABASE_OUTBOX_PATH": os.path.join(tmp, f"outbox-{time.time_ns()}.sqlite"),
+        "CALENDAR_SYNC_REFRESH_SECONDS": "0",
+    })
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-m", "benchmarks.cold_start_bench", "--child", "--first-request", first_request],
+                          cwd=BASE_DIR, env=env, capture_output=True, text=True, timeout=300)
+    wall = time.perf_counter() - started
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("RESULT ")]
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"Processo filho falhou ({proc.returncode}):\n{proc.stdout[-2000:]}\n{proc.stderr[-2000:]}")
+    result = json.loads(lines[-1][len("RESULT "):])
+    result["wall_s"] = wall
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Subida a frio: import, liveness, readiness e primeira resposta.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--first-request", choices=("immediate", "after-ready"), default="immediate")
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="grava o resultado em JSON")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.first_request)
+        return
+
+    from benchmarks.fakes import FakeOpenAIServer
+
+    runs: List[Dict[str, Any]] = []
+    with FakeOpenAIServer(latency=args.embed_latency, completion_latency=args.llm_latency, size=1536) as server, \
+            tempfile.TemporaryDirectory(prefix="bench-cold-") as tmp:
+        for _ in range(args.runs):
+            runs.append(run_child(server.url, args.first_request, tmp))
+            if runs[-1]["first_answer_status"] != 200:
+                print(f"ALERTA: primeira resposta com status {runs[-1]['first_answer_status']}")
+
+    result = {
+        "config": {k: v for k, v in vars(args).items() if k != "child"},
+        "median": {m: round(statistics.median(r[m] for r in runs), 3) for m in METRICS},
+        "prewarm_steps_median": {name: round(statistics.median(r["prewarm_steps"][name] for r in runs), 3)
+                                 for name in runs[0]["prewarm_steps"]},
+        "runs": [{m: round(r[m], 3) for m in METRICS} for r in runs],
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark do docstore: index.pkl (pickle completo) x chunks.sqlite (leitura sob demanda).
+
+Uso:
+    python -m benchmarks.docstore_bench --index faiss_index
+    python -m benchmarks.docstore_bench --synthetic 200000 --output docstore.json
+
+Cada formato é aberto em um subprocesso próprio; mede o tempo de abertura,
+a memória anônima adicionada pelo carregamento e a latência de leitura dos
+k chunks de uma consulta.
+"""
+import argparse
+import json
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from benchmarks.ann_bench import memory_mb  # noqa: E402
+from rag_service.chunk_store import CHUNK_STORE_FILE, PICKLE_FILE, ChunkStore, open_docstore, write_chunk_store  # noqa: E402
+
+
+def synthetic_docstore(n: int, seed: int = 5):
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_core.documents import Document
+
+    rng = random.Random(seed)
+    words = ["apólice", "segurado", "cobertura", "carência", "indenização", "beneficiário", "prêmio", "sinistro"]
+    docs, ids = {}, {}
+    for position in range(n):
+        doc_id = f"chunk-{position:08d}"
+        text = " ".join(rng.choice(words) for _ in range(110))[:1000]
+        docs[doc_id] = Document(id=doc_id, page_content=text, metadata={
+            "source": f"./docs/seguro-vida/doc-{position // 40}.pdf", "page": position % 40,
+            "page_label": str(position % 40 + 1), "total_pages": 40,
+        })
+        ids[position] = doc_id
+    return InMemoryDocstore(docs), ids
+
+
+def measure(index_path: str, fmt: str, k: int, queries: int) -> dict:
+    """Executado no subprocesso."""
+    before = memory_mb()
+    started = time.perf_counter()
+    if fmt == "pickle":
+        with open(os.path.join(index_path, PICKLE_FILE), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+    else:
+        docstore, index_to_docstore_id = open_docstore(index_path)
+    open_s = time.perf_counter() - started
+    after = memory_mb()
+
+    n = len(index_to_docstore_id)
+    rng = np.random.default_rng(3)
+    latencies = []
+    for _ in range(queries):
+        positions = rng.choice(n, min(k, n), replace=False)
+        t0 = time.perf_counter()
+        ids = [index_to_docstore_id[int(p)] for p in positions]
+        if isinstance(docstore, ChunkStore):
+            docs = docstore.get_many(ids)
+        else:
+            docs = [docstore.search(doc_id) for doc_id in ids]
+        latencies.append(time.perf_counter() - t0)
+        assert len(docs) == len(ids)
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "format": fmt,
+        "chunks": n,
+        "open_s": round(open_s, 4),
+        "rss_anon_mb": round(after["rss_anon_mb"] - before["rss_anon_mb"], 1),
+        f"top{k}_p50_ms": round(float(np.percentile(latencies_ms, 50)), 4),
+        f"top{k}_p99_ms": round(float(np.percentile(latencies_ms, 99)), 4),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Abertura, memória e leitura: index.pkl x chunks.sqlite.")
+    parser.add_argument("--index", default="faiss_index")
+    parser.add_argument("--synthetic", type=int, default=0, help="Gera N chunks sintéticos em vez de usar o índice.")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--measure", nargs=2, metavar=("INDEX", "FORMAT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure, k=args.k, queries=args.queries)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Os dois formatos lado a lado no diretório temporário, com o mesmo conteúdo
+        if args.synthetic:
+            docstore, index_to_docstore_id = synthetic_docstore(args.synthetic)
+        else:
+            docstore, index_to_docstore_id = open_docstore(args.index)
+            if isinstance(docstore, ChunkStore):
+                docstore, index_to_docstore_id = docstore.to_in_memory()
+        with open(os.path.join(tmp, PICKLE_FILE), "wb") as f:
+            pickle.dump((docstore, index_to_docstore_id), f)
+        write_chunk_store(os.path.join(tmp, CHUNK_STORE_FILE), index_to_docstore_id, docstore)
+        del docstore, index_to_docstore_id
+
+        sizes = {"pickle": PICKLE_FILE, "sqlite": CHUNK_STORE_FILE}
+        for fmt, name in sizes.items():
+            command = [sys.executable, "-m", "benchmarks.docstore_bench", "--k", str(args.k),
+                       "--queries", str(args.queries), "--measure", tmp, fmt]
+            output = subprocess.run(command, cwd=BASE_DIR, capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result["file_mb"] = round(os.path.getsize(os.path.join(tmp, name)) / 2 ** 20, 2)
+            results.append(result)
+            print(json.dumps(result), flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark do micro-batching de embeddings (rag_service/embedding_batcher.py):
+perguntas simultâneas com uma chamada de embed_query cada ('direct') x as
+mesmas perguntas agrupadas em chamadas de embed_documents ('batched').
+
+Uso:
+    python -m benchmarks.embedding_batch_bench
+    python -m benchmarks.embedding_batch_bench --requests 800 --concurrency 64 --latency 0.08 --max-concurrent 8 --window-ms 5
+
+Os dois modos usam o cliente real da OpenAI (langchain_openai) apontado para
+um FakeOpenAIServer local, com --latency por chamada, --per-input por
+texto e no máximo --max-concurrent chamadas atendidas ao mesmo tempo (o rate
+limit do provedor). --concurrency clientes fazem perguntas distintas em
+sequência até completar --requests.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+from langchain_openai import OpenAIEmbeddings  # noqa: E402
+
+from benchmarks.fakes import FakeOpenAIServer, percentile  # noqa: E402
+from rag_service.embedding_batcher import MicroBatchingEmbeddings  # noqa: E402
+
+MODES = ("direct", "batched")
+
+
+async def run_callers(embeddings: Embeddings, requests: int, concurrency: int, mode: str) -> Dict[str, Any]:
+    questions = [f"{mode}: qual a carência do seguro de vida para o cliente {i}?" for i in range(requests)]
+    latencies: List[float] = []
+    errors = 0
+    position = iter(range(requests))
+
+    async def caller() -> None:
+        nonlocal errors
+        for i in position:
+            started = time.perf_counter()
+            try:
+                vector = await embeddings.aembed_query(questions[i])
+                assert len(vector) > 0
+            except Exception as e:
+                errors += 1
+                print(f"ERRO na pergunta {i}: {e}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Embeddings de perguntas: uma chamada por pergunta x micro-batching.")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.05, help="segundos por chamada ao servidor de embeddings")
+    parser.add_argument("--per-input", type=float, default=0.0005, help="segundos adicionais por texto da chamada")
+    parser.add_argument("--max-concurrent", type=int, default=8, help="chamadas simultâneas atendidas (0 = sem limite)")
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--size", type=int, default=256, help="dimensão dos vetores")
+    parser.add_argument("--output", help="grava o resultado em JSON")
+    args = parser.parse_args()
+
+    result: Dict[str, Any] = {"config": vars(args), "modes": {}}
+    with FakeOpenAIServer(latency=args.latency, per_input=args.per_input,
+                          max_concurrent=args.max_concurrent, size=args.size) as server:
+        client = OpenAIEmbeddings(model="text-embedding-3-small", base_url=server.url, api_key="fake",
+                                  check_embedding_ctx_length=False, max_retries=0)
+        for mode in MODES:
+            embeddings: Embeddings = client
+            if mode == "batched":
+                embeddings = MicroBatchingEmbeddings(client, window=args.window_ms / 1000, max_batch=args.max_batch)
+            server.reset_counts()
+            stats = asyncio.run(run_callers(embeddings, args.requests, args.concurrency, mode))
+            stats["server_calls"] = server.requests
+            stats["server_inputs"] = server.inputs
+            stats["batch_sizes"] = dict(sorted(Counter(server.batch_sizes).items()))
+            if mode == "batched":
+                stats["batcher"] = embeddings.stats()
+            result["modes"][mode] = stats
+
+    direct, batched = result["modes"]["direct"], result["modes"]["batched"]
+    result["speedup"] = round(batched["throughput_rps"] / direct["throughput_rps"], 2)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
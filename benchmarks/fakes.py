@@ -0,0 +1,799 @@
+"""
+Backends falsos e determinísticos para rodar o serviço sem credenciais
+(OpenAI, Google Calendar, Supabase). Usados pelos scripts de benchmark
+deste diretório.
+"""
+import asyncio
+import base64
+import contextlib
+import copy
+import email.parser
+import hashlib
+import itertools
+import json
+import math
+import os
+import ssl
+import threading
+import time
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+
+from rag_service.index_manager import configured_embedding_model
+
+
+class FakeLatencyEmbeddings(Embeddings):
+    """
+    Vetores determinísticos (derivados do hash do texto) com latência fixa por
+    chamada. Por padrão se apresenta com o modelo configurado, o mesmo do
+    manifest do faiss_index, para o IndexManager aceitar o índice do repositório.
+    """
+
+    def __init__(self, size: int = 1536, latency: float = 0.02, model: Optional[str] = None):
+        self.size = size
+        self.latency = latency
+        self.model = model or configured_embedding_model()
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.size).astype("float32").tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        await asyncio.sleep(self.latency)
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeLatencyLLM(LLM):
+    """LLM falso com latência configurável; a versão em streaming emite uma palavra por vez."""
+
+    latency: float = 0.2
+    token_latency: float = 0.01
+    response: str = "Resposta simulada com os pontos-chave do contexto fornecido."
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-latency"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.response
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.response
+
+    def _tokens(self) -> List[str]:
+        words = self.response.split(" ")
+        return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        self.calls += 1
+        for token in self._tokens():
+            time.sleep(self.token_latency)
+            yield GenerationChunk(text=token)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        self.calls += 1
+        for token in self._tokens():
+            await asyncio.sleep(self.token_latency)
+            yield GenerationChunk(text=token)
+
+
+# --- Google Calendar ---
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+class FakeRequest:
+    """Equivalente ao HttpRequest do googleapiclient: a operação só roda (com latência) no execute()."""
+
+    def __init__(self, operation: Callable[[], Any], latency: float):
+        self._operation = operation
+        self._latency = latency
+
+    def execute(self, num_retries: int = 0) -> Any:
+        time.sleep(self._latency)
+        return self._operation()
+
+
+class FakeBatch:
+    """Equivalente ao BatchHttpRequest: uma única latência para todas as chamadas do lote."""
+
+    def __init__(self, service: "FakeCalendarService", callback: Optional[Callable[..., None]] = None):
+        self._service = service
+        self._callback = callback
+        self._requests: List[Tuple[str, FakeRequest, Optional[Callable[..., None]]]] = []
+
+    def add(self, request: FakeRequest, callback: Optional[Callable[..., None]] = None,
+            request_id: Optional[str] = None) -> None:
+        self._requests.append((request_id or str(len(self._requests) + 1), request, callback))
+
+    def execute(self) -> None:
+        self._service._count("batch")
+        time.sleep(self._service.latency)
+        for request_id, request, callback in self._requests:
+            response, error = None, None
+            try:
+                response = request._operation()
+            except FakeHttpError as e:
+                error = e
+            (callback or self._callback)(request_id, response, error)
+
+
+class FakeHttpError(Exception):
+    def __init__(self, status: int, reason: str):
+        super().__init__(f"<HttpError {status}: {reason}>")
+        self.status_code = status
+        self.resp = type("Resp", (), {"status": status, "reason": reason})()
+
+
+class FakeCalendarService:
+    """
+    Subconjunto da API v3 do Google Calendar usado pelo scheduler_service
+    (events: list/get/insert/update/delete, freebusy.query e lotes), em memória e
+    thread-safe, com latência fixa por chamada. events.list devolve um
+    nextSyncToken e aceita syncToken (sincronização incremental, com os
+    eventos removidos como status "cancelled" e 410 para token expirado).
+    """
+
+    def __init__(self, latency: float = 0.08, primary_id: str = "primary"):
+        self.latency = latency
+        # ID real da agenda "primary": as duas formas acessam os mesmos eventos
+        self.primary_id = primary_id
+        self.events_by_calendar: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.calls: Dict[str, int] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # Log de alterações para o syncToken: sequência da última alteração de cada evento
+        self._seq = 0
+        self._changes: Dict[str, Dict[str, int]] = {}
+        self._deleted: Dict[str, Dict[str, int]] = {}
+        self._token_floor: Dict[str, int] = {}
+
+    def _key(self, calendar_id: str) -> str:
+        return self.primary_id if calendar_id == "primary" else calendar_id
+
+    def _touch(self, calendar_id: str, event_id: str, deleted: bool = False) -> None:
+        """Registra a alteração (chamado com o lock)."""
+        self._seq += 1
+        if deleted:
+            self._changes.get(calendar_id, {}).pop(event_id, None)
+            self._deleted.setdefault(calendar_id, {})[event_id] = self._seq
+        else:
+            self._changes.setdefault(calendar_id, {})[event_id] = self._seq
+            self._deleted.get(calendar_id, {}).pop(event_id, None)
+
+    def expire_sync_tokens(self, calendar_id: str) -> None:
+        """Invalida os syncTokens já emitidos para a agenda (o próximo uso recebe 410 Gone)."""
+        calendar_id = self._key(calendar_id)
+        with self._lock:
+            self._seq += 1
+            self._token_floor[calendar_id] = self._seq
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+
+    def add_event(self, calendar_id: str, start: str, end: str, summary: str = "Ocupado") -> Dict[str, Any]:
+        calendar_id = self._key(calendar_id)
+        with self._lock:
+            event_id = f"evt{next(self._ids)}"
+            event = {
+                "id": event_id,
+                "summary": summary,
+                "start": {"dateTime": start},
+                "end": {"dateTime": end},
+                "htmlLink": f"https://calendar.fake/{event_id}",
+                "status": "confirmed",
+            }
+            self.events_by_calendar.setdefault(calendar_id, {})[event_id] = event
+            self._touch(calendar_id, event_id)
+            return copy.deepcopy(event)
+
+    def events(self) -> "FakeCalendarService":
+        return self
+
+    def list(self, calendarId: str, timeMin: Optional[str] = None, timeMax: Optional[str] = None,
+             singleEvents: bool = True, orderBy: Optional[str] = None, syncToken: Optional[str] = None,
+             **kwargs: Any) -> FakeRequest:
+        calendarId = self._key(calendarId)
+
+        def run() -> Dict[str, Any]:
+            if syncToken is not None:
+                return incremental()
+            self._count("list")
+            low = _parse_time(timeMin) if timeMin else None
+            high = _parse_time(timeMax) if timeMax else None
+            with self._lock:
+                events = [copy.deepcopy(e) for e in self.events_by_calendar.get(calendarId, {}).values()]
+                next_token = str(self._seq)
+            items = [
+                e for e in events
+                if (high is None or _parse_time(e["start"]["dateTime"]) < high)
+                and (low is None or _parse_time(e["end"]["dateTime"]) > low)
+            ]
+            items.sort(key=lambda e: _parse_time(e["start"]["dateTime"]))
+            return {"kind": "calendar#events", "items": items, "nextSyncToken": next_token}
+
+        def incremental() -> Dict[str, Any]:
+            self._count("list_incremental")
+            since = int(syncToken)
+            with self._lock:
+                if since < self._token_floor.get(calendarId, 0):
+                    raise FakeHttpError(410, "Gone")
+                events = self.events_by_calendar.get(calendarId, {})
+                items = [copy.deepcopy(events[i]) for i, seq in self._changes.get(calendarId, {}).items() if seq > since]
+                items += [{"id": i, "status": "cancelled"} for i, seq in self._deleted.get(calendarId, {}).items()
+                          if seq > since]
+                return {"kind": "calendar#events", "items": items, "nextSyncToken": str(self._seq)}
+        return FakeRequest(run, self.latency)
+
+    def get(self, calendarId: str, eventId: str) -> FakeRequest:
+        calendarId = self._key(calendarId)
+
+        def run() -> Dict[str, Any]:
+            self._count("get")
+            with self._lock:
+                event = self.events_by_calendar.get(calendarId, {}).get(eventId)
+                if event is None:
+                    raise FakeHttpError(404, "Not Found")
+                return copy.deepcopy(event)
+        return FakeRequest(run, self.latency)
+
+    def insert(self, calendarId: str, body: Dict[str, Any], **kwargs: Any) -> FakeRequest:
+        calendarId = self._key(calendarId)
+
+        def run() -> Dict[str, Any]:
+            self._count("insert")
+            with self._lock:
+                event_id = f"evt{next(self._ids)}"
+                event = copy.deepcopy(body)
+                event.update({"id": event_id, "htmlLink": f"https://calendar.fake/{event_id}", "status": "confirmed"})
+                self.events_by_calendar.setdefault(calendarId, {})[event_id] = event
+                self._touch(calendarId, event_id)
+                return copy.deepcopy(event)
+        return FakeRequest(run, self.latency)
+
+    def update(self, calendarId: str, eventId: str, body: Dict[str, Any], **kwargs: Any) -> FakeRequest:
+        calendarId = self._key(calendarId)
+
+        def run() -> Dict[str, Any]:
+            self._count("update")
+            with self._lock:
+                if eventId not in self.events_by_calendar.get(calendarId, {}):
+                    raise FakeHttpError(404, "Not Found")
+                event = copy.deepcopy(body)
+                event["id"] = eventId
+                self.events_by_calendar[calendarId][eventId] = event
+                self._touch(calendarId, eventId)
+                return copy.deepcopy(event)
+        return FakeRequest(run, self.latency)
+
+    def delete(self, calendarId: str, eventId: str, **kwargs: Any) -> FakeRequest:
+        calendarId = self._key(calendarId)
+
+        def run() -> str:
+            self._count("delete")
+            with self._lock:
+                if self.events_by_calendar.get(calendarId, {}).pop(eventId, None) is None:
+                    raise FakeHttpError(410, "Resource has been deleted")
+                self._touch(calendarId, eventId, deleted=True)
+            return ""
+        return FakeRequest(run, self.latency)
+
+    def calendars(self) -> "_FakeCalendars":
+        return _FakeCalendars(self)
+
+    def freebusy(self) -> "FakeCalendarService":
+        return self
+
+    def new_batch_http_request(self, callback: Optional[Callable[..., None]] = None) -> FakeBatch:
+        return FakeBatch(self, callback)
+
+    def query(self, body: Dict[str, Any]) -> FakeRequest:
+        """freebusy().query: intervalos ocupados de várias agendas em uma chamada."""
+        def run() -> Dict[str, Any]:
+            self._count("freebusy")
+            low, high = _parse_time(body["timeMin"]), _parse_time(body["timeMax"])
+            calendars = {}
+            with self._lock:
+                for item in body.get("items", []):
+                    events = self.events_by_calendar.get(self._key(item["id"]))
+                    if events is None:
+                        calendars[item["id"]] = {"busy": [], "errors": [{"domain": "global", "reason": "notFound"}]}
+                        continue
+                    busy = sorted(
+                        ({"start": e["start"]["dateTime"], "end": e["end"]["dateTime"]} for e in events.values()
+                         if _parse_time(e["start"]["dateTime"]) < high and _parse_time(e["end"]["dateTime"]) > low),
+                        key=lambda b: _parse_time(b["start"]),
+                    )
+                    calendars[item["id"]] = {"busy": busy}
+            return {"kind": "calendar#freeBusy", "timeMin": body["timeMin"], "timeMax": body["timeMax"],
+                    "calendars": calendars}
+        return FakeRequest(run, self.latency)
+
+
+class _FakeCalendars:
+    """calendars().get: metadados da agenda; "primary" é resolvida para primary_id."""
+
+    def __init__(self, service: FakeCalendarService):
+        self._service = service
+
+    def get(self, calendarId: str) -> FakeRequest:
+        def run() -> Dict[str, Any]:
+            self._service._count("calendars_get")
+            calendar_id = self._service.primary_id if calendarId == "primary" else calendarId
+            return {"kind": "calendar#calendar", "id": calendar_id, "summary": calendar_id}
+        return FakeRequest(run, self._service.latency)
+
+
+class _CalendarHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: o cliente pode reaproveitar a conexão
+    server: "FakeCalendarServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.count("connections")
+
+    def _reply(self, status: int, payload: Any = None) -> None:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        url = urlsplit(self.path)
+        time.sleep(self.server.latency)
+
+        if url.path == "/token" and method == "POST":
+            self.server.count("tokens")
+            self._reply(200, {"access_token": f"fake-token-{time.time_ns()}", "expires_in": 3600, "token_type": "Bearer"})
+            return
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._reply(401, {"error": {"code": 401, "message": "Login Required."}})
+            return
+        if url.path == "/batch/calendar/v3" and method == "POST":
+            self._batch(raw)
+            return
+        status, payload = self._dispatch(method, self.path, raw)
+        self._reply(status, payload)
+
+    def _dispatch(self, method: str, path: str, raw: bytes) -> Tuple[int, Any]:
+        url = urlsplit(path)
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        body = json.loads(raw) if raw else None
+        events = self.server.calendar.events()
+        if parts == ["calendar", "v3", "freeBusy"] and method == "POST":
+            request = self.server.calendar.freebusy().query(body=body)
+        # calendar/v3/calendars/{calendarId}/events[/{eventId}]
+        elif len(parts) < 5 or parts[:3] != ["calendar", "v3", "calendars"] or parts[4] != "events":
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        else:
+            calendar_id, event_id = parts[3], (parts[5] if len(parts) > 5 else None)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            query.pop("alt", None)
+            if event_id is None and method == "GET":
+                request = events.list(calendarId=calendar_id, **query)
+            elif event_id is None and method == "POST":
+                request = events.insert(calendarId=calendar_id, body=body)
+            elif method == "GET":
+                request = events.get(calendarId=calendar_id, eventId=event_id)
+            elif method == "PUT":
+                request = events.update(calendarId=calendar_id, eventId=event_id, body=body)
+            elif method == "DELETE":
+                request = events.delete(calendarId=calendar_id, eventId=event_id)
+            else:
+                return 405, {"error": {"code": 405, "message": "Method Not Allowed"}}
+        try:
+            result = request.execute()
+        except FakeHttpError as e:
+            return e.status_code, {"error": {"code": e.status_code, "message": e.resp.reason}}
+        self.server.count("requests")
+        return (204, None) if method == "DELETE" else (200, result)
+
+    def _batch(self, raw: bytes) -> None:
+        """Lote multipart/mixed no formato do BatchHttpRequest: uma resposta com uma parte por chamada."""
+        self.server.count("batches")
+        message = email.parser.BytesParser().parsebytes(
+            b"Content-Type: " + self.headers["Content-Type"].encode("ascii") + b"\r\n\r\n" + raw
+        )
+        boundary = f"batch_{time.time_ns()}"
+        chunks = []
+        for part in message.get_payload():
+            # O googleapiclient serializa cada chamada com quebras de linha '\n'
+            inner = part.get_payload(decode=False).replace("\r\n", "\n")
+            head, _, body = inner.partition("\n\n")
+            request_line = head.split("\n", 1)[0]
+            method, path, _ = request_line.split(" ", 2)
+            status, payload = self._dispatch(method, path, body.encode("utf-8"))
+            content = json.dumps(payload) if payload is not None else ""
+            content_id = part["Content-ID"].strip("<>")
+            chunks.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(content.encode('utf-8'))}\r\n\r\n{content}\r\n"
+            )
+        data = ("".join(chunks) + f"--{boundary}--\r\n").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/mixed; boundary={boundary}")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def do_PUT(self) -> None:
+        self._handle("PUT")
+
+    def do_DELETE(self) -> None:
+        self._handle("DELETE")
+
+
+class FakeCalendarServer(ThreadingHTTPServer):
+    """
+    Servidor HTTP(S) local com as rotas de events e freeBusy da API v3 do
+    Calendar, o endpoint de lotes (/batch/calendar/v3) e um token_uri OAuth
+    falso, sobre o estado de um FakeCalendarService. Permite medir o custo
+    real do cliente (discovery, credenciais, TLS, conexões).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, certfile: Optional[str] = None, keyfile: Optional[str] = None):
+        super().__init__(("127.0.0.1", 0), _CalendarHandler)
+        self.latency = latency
+        self.calendar = FakeCalendarService(latency=0)
+        self.counts: Dict[str, int] = {"connections": 0, "tokens": 0, "requests": 0, "batches": 0}
+        self._counts_lock = threading.Lock()
+        self.scheme = "http"
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            # Handshake na thread de cada conexão, não na thread que aceita as conexões
+            self.socket = context.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+            self.scheme = "https"
+        self._thread: Optional[threading.Thread] = None
+
+    def count(self, name: str) -> None:
+        with self._counts_lock:
+            self.counts[name] += 1
+
+    @property
+    def url(self) -> str:
+        return f"{self.scheme}://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self) -> "FakeCalendarServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class _OpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeOpenAIServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _reply(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        path = urlsplit(self.path).path.rstrip("/")
+        if path == "/v1/embeddings":
+            self._embeddings(json.loads(raw))
+        elif path == "/v1/completions":
+            self._completions(json.loads(raw))
+        else:
+            self._reply(404, {"error": {"message": "Not found"}})
+
+    def _completions(self, body: Dict[str, Any]) -> None:
+        prompts = body["prompt"] if isinstance(body["prompt"], list) else [body["prompt"]]
+        server = self.server
+        with server.slots:
+            server.record_completion()
+            time.sleep(server.completion_latency)
+        choices = [{"text": server.completion, "index": i, "logprobs": None, "finish_reason": "stop"}
+                   for i in range(len(prompts))]
+        self._reply(200, {"id": f"cmpl-{time.time_ns()}", "object": "text_completion", "created": int(time.time()),
+                          "model": body.get("model", "fake-completion"), "choices": choices,
+                          "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}})
+
+    def _embeddings(self, body: Dict[str, Any]) -> None:
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        server = self.server
+        with server.slots:
+            server.record(len(inputs))
+            time.sleep(server.latency + server.per_input * len(inputs))
+        data = []
+        for i, text in enumerate(inputs):
+            if not isinstance(text, str):
+                text = json.dumps(text)  # ids de tokens: qualquer texto determinístico serve
+            vector = server.vectors._vector(text)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(np.asarray(vector, dtype="float32").tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        self._reply(200, {"object": "list", "data": data, "model": body.get("model", server.vectors.model),
+                          "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)}})
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    Servidor local compatível com POST /v1/embeddings e /v1/completions da
+    OpenAI: latência fixa por chamada, custo opcional por texto de embedding e
+    um limite de chamadas simultâneas (como o rate limit do provedor). Conta
+    chamadas e textos recebidos.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.05, per_input: float = 0.0, max_concurrent: int = 0, size: int = 1536,
+                 completion_latency: float = 0.05, completion: str = "Resposta simulada com os pontos-chave do contexto."):
+        super().__init__(("127.0.0.1", 0), _OpenAIHandler)
+        self.latency = latency
+        self.per_input = per_input
+        self.completion_latency = completion_latency
+        self.completion = completion
+        self.completions = 0
+        self.vectors = FakeLatencyEmbeddings(size=size, latency=0)
+        self.slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else contextlib.nullcontext()
+        self.requests = 0
+        self.inputs = 0
+        self.batch_sizes: List[int] = []
+        self._counts_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(self, inputs: int) -> None:
+        with self._counts_lock:
+            self.requests += 1
+            self.inputs += inputs
+            self.batch_sizes.append(inputs)
+
+    def record_completion(self) -> None:
+        with self._counts_lock:
+            self.completions += 1
+
+    def reset_counts(self) -> None:
+        with self._counts_lock:
+            self.requests, self.inputs, self.batch_sizes, self.completions = 0, 0, [], 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def self_signed_certificate(directory: str, host: str = "127.0.0.1") -> Tuple[str, str]:
+    """Gera (cert.pem, key.pem) autoassinados para o FakeCalendarServer em HTTPS."""
+    import ipaddress
+    from datetime import timedelta, timezone
+
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host)])
+    now = datetime.now(timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - timedelta(minutes=5))
+        .not_valid_after(now + timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address(host))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+def fake_service_account_file(path: str, token_uri: str) -> str:
+    """JSON de service account com uma chave RSA nova e o token_uri apontando para o servidor falso."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode("ascii")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "type": "service_account",
+            "project_id": "bench",
+            "private_key_id": "bench-key",
+            "private_key": pem,
+            "client_email": "scheduler@bench.iam.gserviceaccount.com",
+            "client_id": "1",
+            "token_uri": token_uri,
+        }, f)
+    return path
+
+
+# --- Supabase (PostgREST) ---
+class FakeResponse:
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+
+
+def _timestamp(value: Any) -> datetime:
+    """Compara horários como o timestamptz do Postgres (sem offset = America/Sao_Paulo, o fuso do serviço)."""
+    dt = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return dt.replace(tzinfo=ZoneInfo("America/Sao_Paulo")) if dt.tzinfo is None else dt
+
+
+class FakeQuery:
+    """
+    Construtor de consulta no estilo do cliente supabase-py: select/insert/
+    update/delete + eq/in_/lt/gt/order/limit + execute (lt/gt comparam horários).
+    """
+
+    def __init__(self, db: "FakeSupabaseClient", table: str):
+        self._db = db
+        self._table = table
+        self._action = "select"
+        self._values: Any = None
+        self._filters: List[Any] = []
+        self._limit: Optional[int] = None
+        self._order: Optional[str] = None
+
+    def select(self, columns: str = "*") -> "FakeQuery":
+        self._action = "select"
+        return self
+
+    def insert(self, values: Any) -> "FakeQuery":
+        self._action, self._values = "insert", values
+        return self
+
+    def update(self, values: Dict[str, Any]) -> "FakeQuery":
+        self._action, self._values = "update", values
+        return self
+
+    def delete(self) -> "FakeQuery":
+        self._action = "delete"
+        return self
+
+    def eq(self, column: str, value: Any) -> "FakeQuery":
+        self._filters.append((column, lambda v: v == value))
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> "FakeQuery":
+        allowed = set(values)
+        self._filters.append((column, lambda v: v in allowed))
+        return self
+
+    def lt(self, column: str, value: Any) -> "FakeQuery":
+        self._filters.append((column, lambda v: v is not None and _timestamp(v) < _timestamp(value)))
+        return self
+
+    def gt(self, column: str, value: Any) -> "FakeQuery":
+        self._filters.append((column, lambda v: v is not None and _timestamp(v) > _timestamp(value)))
+        return self
+
+    def order(self, column: str) -> "FakeQuery":
+        self._order = column
+        return self
+
+    def limit(self, count: int) -> "FakeQuery":
+        self._limit = count
+        return self
+
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        return all(test(row.get(column)) for column, test in self._filters)
+
+    def execute(self) -> FakeResponse:
+        time.sleep(self._db.latency)
+        db = self._db
+        with db.lock:
+            db.calls[self._action] = db.calls.get(self._action, 0) + 1
+            rows = db.tables.setdefault(self._table, [])
+            if self._action == "insert":
+                new_rows = self._values if isinstance(self._values, list) else [self._values]
+                inserted = []
+                for row in new_rows:
+                    row = dict(row)
+                    row.setdefault("id", next(db.ids))
+                    rows.append(row)
+                    inserted.append(dict(row))
+                return FakeResponse(inserted)
+            matched = [row for row in rows if self._matches(row)]
+            if self._action == "update":
+                for row in matched:
+                    row.update(self._values)
+            elif self._action == "delete":
+                db.tables[self._table] = [row for row in rows if not self._matches(row)]
+            if self._order is not None:
+                matched = sorted(matched, key=lambda row: _timestamp(row[self._order]))
+            if self._limit is not None:
+                matched = matched[: self._limit]
+            return FakeResponse([dict(row) for row in matched])
+
+
+class FakeSupabaseClient:
+    """Tabelas em memória com latência fixa por requisição (execute)."""
+
+    def __init__(self, latency: float = 0.03):
+        self.latency = latency
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.calls: Dict[str, int] = {}
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest-rank
+    index = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[index]
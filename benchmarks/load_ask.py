@@ -0,0 +1,101 @@
+"""
+Teste de carga do /ask em processo, com embeddings e LLM falsos.
+
+Uso:
+    python -m benchmarks.load_ask --llm-latency 0.2 --levels 1,4,16,64
+
+Com o caminho assíncrono a vazão cresce com a concorrência (limitada pelo
+RAG_MAX_CONCURRENCY); um caminho bloqueante ficaria estável em ~1/latência.
+
+Com --broadcast todos os workers fazem a mesma pergunta a cada rodada (um
+disparo no WhatsApp): as repetidas em andamento são coalescidas e as
+chamadas ao LLM caem para uma por rodada.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "scheduler_service"))
+
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+os.environ.setdefault("FAISS_INDEX_POLL_SECONDS", "0")
+# Mede o caminho completo: sem cache de embeddings em disco e sem cache semântico
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("SEMANTIC_CACHE_SIZE", "0")
+
+import httpx  # noqa: E402
+
+from benchmarks.fakes import FakeLatencyEmbeddings, FakeLatencyLLM, percentile  # noqa: E402
+
+
+async def run_level(client: httpx.AsyncClient, llm, concurrency: int, requests_per_worker: int, tag: str,
+                    broadcast: bool = False) -> dict:
+    latencies = []
+    statuses = {}
+    coalesced = 0
+    llm_calls = llm.calls
+
+    async def worker(worker_id: int) -> None:
+        nonlocal coalesced
+        for i in range(requests_per_worker):
+            sender = "todos" if broadcast else worker_id
+            question = f"{tag} pergunta {concurrency}-{sender}-{i} sobre cobertura de cirurgia"
+            started = time.perf_counter()
+            response = await client.post("/ask", json={"question": question})
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200 and response.json().get("coalesced"):
+                coalesced += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "llm_calls": llm.calls - llm_calls,
+        "coalesced": coalesced,
+        "statuses": statuses,
+    }
+
+
+async def main_async(args: argparse.Namespace) -> list:
+    import rag
+
+    rag.embedding_batcher.underlying = FakeLatencyEmbeddings(latency=args.embed_latency)
+    llm = FakeLatencyLLM(latency=args.llm_latency)
+    rag.llm_client.set(llm)
+
+    results = []
+    async with rag.lifespan(rag.app):
+        transport = httpx.ASGITransport(app=rag.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for level in args.levels:
+                results.append(await run_level(client, llm, level, args.requests_per_worker,
+                                                f"run{time.time_ns()}", args.broadcast))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Teste de carga do /ask com backends falsos.")
+    parser.add_argument("--levels", default="1,4,16,64", type=lambda v: [int(x) for x in v.split(",")])
+    parser.add_argument("--requests-per-worker", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--broadcast", action="store_true", help="todos os workers fazem a mesma pergunta a cada rodada")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
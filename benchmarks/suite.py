@@ -0,0 +1,282 @@
+"""
+Benchmark offline dos caminhos quentes do RAG e do agendamento.
+
+Uso:
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --scenarios slots,schedule --levels 1,8,32 --calendar-latency 0.12
+    python -m benchmarks.suite --output novo.json --compare bench.json
+
+Roda em processo, via httpx.ASGITransport, o rag.app (/ask) e o app do
+scheduler_service (rotas /agendar/...), com embeddings/LLM falsos e Google
+Calendar/Supabase em memória (benchmarks.fakes). Para cada cenário e nível
+de concorrência registra vazão e latências p50/p95/p99; o JSON gerado pode
+ser comparado com o de outro commit via --compare.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "scheduler_service"))
+
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+os.environ.setdefault("FAISS_INDEX_POLL_SECONDS", "0")
+# Mede o caminho completo: sem cache de embeddings em disco e sem cache semântico
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("SEMANTIC_CACHE_SIZE", "0")
+# Outbox do Supabase em um arquivo temporário (não mistura com o .cache do serviço)
+os.environ.setdefault("SUPABASE_OUTBOX_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-outbox-"), "outbox.sqlite"))
+
+import httpx  # noqa: E402
+
+from benchmarks.fakes import (  # noqa: E402
+    FakeCalendarService,
+    FakeLatencyEmbeddings,
+    FakeLatencyLLM,
+    FakeSupabaseClient,
+    percentile,
+)
+from bookings import STATUS_ACTIVE, TABLE as BOOKINGS_TABLE  # noqa: E402
+
+SCENARIOS = ("ask", "slots", "slots_range", "schedule", "reschedule", "cancel")
+LIFE_PLANNERS = 8
+# slots_range: uma semana para 4 life planners em uma requisição
+RANGE_DAYS = 7
+RANGE_PLANNERS = 4
+
+
+def next_weekday(start: date, weekday: int) -> date:
+    return start + timedelta(days=(weekday - start.weekday()) % 7)
+
+
+# Terça-feira fixa (janela 11h-18h, fora de feriados), para os resultados não dependerem do dia da execução
+BENCH_DAY = next_weekday(date(2030, 1, 2), 1)
+
+
+def slot_iso(hour: int, minutes: int = 0) -> str:
+    return datetime(BENCH_DAY.year, BENCH_DAY.month, BENCH_DAY.day, hour, minutes).isoformat() + "-03:00"
+
+
+# Agendar/reagendar recusam horário já reservado (409): cada requisição recebe uma hora ainda não usada,
+# longe do BENCH_DAY para não alterar os cenários de consulta
+BOOKING_HOURS = itertools.count()
+
+
+def free_slot_iso() -> Tuple[str, str]:
+    start = datetime.combine(BENCH_DAY + timedelta(days=60), datetime.min.time()) + timedelta(hours=next(BOOKING_HOURS))
+    return start.isoformat() + "-03:00", (start + timedelta(hours=1)).isoformat() + "-03:00"
+
+
+class Backends:
+    """Instala os fakes nos pontos de extensão do scheduler_service e semeia os dados de cada cenário."""
+
+    def __init__(self, calendar_latency: float, supabase_latency: float):
+        import supabase_supabase
+        import scheduler_service.main as scheduler
+
+        self.calendar = FakeCalendarService(latency=calendar_latency)
+        self.db = FakeSupabaseClient(latency=supabase_latency)
+        scheduler.get_calendar_service = lambda organizer_email=None: self.calendar
+        scheduler.get_supabase_client = lambda: self.db
+        supabase_supabase.get_supabase_client = lambda: self.db
+
+        self.db.tables["life_planners"] = [
+            {"id": f"lp-{n}", "email_calendario": f"lp{n}@agenda.fake"} for n in range(LIFE_PLANNERS)
+        ]
+        # Agenda "primary" (usada pelo /slots/) com dois compromissos no dia
+        self.calendar.add_event("primary", slot_iso(12), slot_iso(13))
+        self.calendar.add_event("primary", slot_iso(15, 30), slot_iso(16))
+        # Agenda de cada life planner com um compromisso no dia
+        for n in range(LIFE_PLANNERS):
+            self.calendar.add_event(f"lp{n}@agenda.fake", slot_iso(12), slot_iso(13))
+
+    def seed_bookings(self, keys: List[Tuple[str, str]]) -> None:
+        """Um agendamento ativo (Supabase + evento no Calendar) para cada (life planner, celular)."""
+        for lp, phone in keys:
+            email = f"lp{lp.split('-')[1]}@agenda.fake"
+            event = self.calendar.add_event(email, slot_iso(14), slot_iso(15), summary=f"Consulta {phone}")
+            self.db.tables.setdefault(BOOKINGS_TABLE, []).append({
+                "id": f"ag-{phone}",
+                "id_lifeplanner": lp,
+                "cliente_celular": phone,
+                "event_ide_google": event["id"],
+                "start_time": slot_iso(14),
+                "end_time": slot_iso(15),
+                "status": STATUS_ACTIVE,
+            })
+
+
+def request_for(scenario: str, tag: str, worker: int, i: int) -> Tuple[str, Dict[str, Any]]:
+    lp = f"lp-{worker % LIFE_PLANNERS}"
+    phone = f"55{tag}{worker:03d}{i:04d}"
+    if scenario == "ask":
+        return "/ask", {"question": f"{tag} pergunta {worker}-{i} sobre cobertura de cirurgia"}
+    if scenario == "slots":
+        return "/agendar/slots/", {"date": BENCH_DAY.isoformat()}
+    if scenario == "slots_range":
+        return "/agendar/slots/range/", {
+            "start_date": BENCH_DAY.isoformat(),
+            "end_date": (BENCH_DAY + timedelta(days=RANGE_DAYS - 1)).isoformat(),
+            "life_planners": [f"lp-{(worker + n) % LIFE_PLANNERS}" for n in range(RANGE_PLANNERS)],
+        }
+    if scenario == "schedule":
+        start, end = free_slot_iso()
+        return "/agendar/", {
+            "summary": "Reunião de planejamento",
+            "description": "Agendado pelo benchmark",
+            "start_time": start,
+            "end_time": end,
+            "attendee_emails": ["cliente@exemplo.fake"],
+            "cliente_id": lp,
+            "cliente_celular": phone,
+        }
+    if scenario == "reschedule":
+        start, end = free_slot_iso()
+        return "/agendar/reagendar/", {
+            "id_lifeplanner": lp,
+            "cliente_celular": phone,
+            "new_start_time": start,
+            "new_end_time": end,
+        }
+    return "/agendar/cancelar/", {"id_lifeplanner": lp, "cliente_celular": phone}
+
+
+async def run_level(client: httpx.AsyncClient, backends: Backends, scenario: str, concurrency: int,
+                    requests_per_worker: int) -> Dict[str, Any]:
+    tag = str(time.time_ns() % 10 ** 6)
+    if scenario in ("reschedule", "cancel"):
+        keys = []
+        for worker in range(concurrency):
+            for i in range(requests_per_worker):
+                _, body = request_for(scenario, tag, worker, i)
+                keys.append((body["id_lifeplanner"], body["cliente_celular"]))
+        backends.seed_bookings(keys)
+
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+
+    async def worker(worker_id: int) -> None:
+        for i in range(requests_per_worker):
+            path, body = request_for(scenario, tag, worker_id, i)
+            started = time.perf_counter()
+            response = await client.post(path, json=body)
+            latencies.append(time.perf_counter() - started)
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "statuses": statuses,
+    }
+
+
+async def main_async(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    import rag
+    import scheduler_service.main as scheduler
+
+    rag.embedding_batcher.underlying = FakeLatencyEmbeddings(latency=args.embed_latency)
+    rag.llm_client.set(FakeLatencyLLM(latency=args.llm_latency))
+    backends = Backends(args.calendar_latency, args.supabase_latency)
+
+    results = []
+    async with rag.lifespan(rag.app):
+        rag_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=rag.app), base_url="http://bench", timeout=300)
+        # O app do scheduler expõe o router com o prefixo /agendar
+        scheduler_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=scheduler.app),
+                                             base_url="http://bench", timeout=300)
+        async with rag_client, scheduler_client:
+            for scenario in args.scenarios:
+                client = rag_client if scenario == "ask" else scheduler_client
+                for level in args.levels:
+                    result = await run_level(client, backends, scenario, level, args.requests_per_worker)
+                    results.append(result)
+                    print(json.dumps(result), flush=True)
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "desconhecido"
+
+
+def compare(current: List[Dict[str, Any]], baseline_path: str) -> None:
+    """Imprime a variação de vazão e p95 em relação a um JSON anterior (mesmo cenário e concorrência)."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline["results"]}
+    print(f"\nComparação com {baseline_path} (commit {baseline['meta'].get('commit')}):")
+    print(f"{'cenário':<12}{'conc':>6}{'rps antes':>12}{'rps agora':>12}{'Δ rps':>9}{'p95 antes':>12}{'p95 agora':>12}{'Δ p95':>9}")
+    for result in current:
+        old = previous.get((result["scenario"], result["concurrency"]))
+        if old is None:
+            continue
+        d_rps = (result["throughput_rps"] / old["throughput_rps"] - 1) * 100 if old["throughput_rps"] else 0.0
+        d_p95 = (result["p95_ms"] / old["p95_ms"] - 1) * 100 if old["p95_ms"] else 0.0
+        print(f"{result['scenario']:<12}{result['concurrency']:>6}{old['throughput_rps']:>12}{result['throughput_rps']:>12}"
+              f"{d_rps:>8.1f}%{old['p95_ms']:>12}{result['p95_ms']:>12}{d_p95:>8.1f}%")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark offline do /ask e das rotas de agendamento.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), type=lambda v: v.split(","))
+    parser.add_argument("--levels", default="1,4,16,64", type=lambda v: [int(x) for x in v.split(",")])
+    parser.add_argument("--requests-per-worker", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--calendar-latency", type=float, default=0.08)
+    parser.add_argument("--supabase-latency", type=float, default=0.03)
+    parser.add_argument("--output", default=None, help="Arquivo JSON com metadados e resultados.")
+    parser.add_argument("--compare", default=None, help="JSON de uma execução anterior para comparar.")
+    args = parser.parse_args()
+
+    invalid = [s for s in args.scenarios if s not in SCENARIOS]
+    if invalid:
+        raise SystemExit(f"Cenários inválidos: {', '.join(invalid)}. Use: {', '.join(SCENARIOS)}.")
+
+    results = asyncio.run(main_async(args))
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "requests_per_worker": args.requests_per_worker,
+            "latencies_s": {
+                "llm": args.llm_latency,
+                "embeddings": args.embed_latency,
+                "calendar": args.calendar_latency,
+                "supabase": args.supabase_latency,
+            },
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
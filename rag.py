@@ -1,17 +1,28 @@
 import os
-import uvicorn
-from fastapi import FastAPI, HTTPException, Request
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import OpenAIEmbeddings
-from langchain_openai import OpenAI
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request, Header
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from langchain_core.prompts import PromptTemplate
 from fastapi.middleware.cors import CORSMiddleware
 # Precisamos do 'os' para construir o caminho
 from dotenv import load_dotenv 
 
-# Importa o router de agendamento (Certifique-se de que scheduler_service/main.py existe)
-from scheduler_service.main import router as scheduler_router 
+from rag_service.index_manager import IndexManager, configured_embedding_model
+from rag_service.kb_registry import KnowledgeBaseRegistry, parse_knowledge_bases
+from rag_service.embedding_cache import CachedEmbeddings, normalize_text
+from rag_service.embedding_batcher import MicroBatchingEmbeddings
+from rag_service.semantic_cache import SemanticCache
+from rag_service.single_flight import SingleFlight
+from rag_service.startup import LazyClient, LazyEmbeddings, Prewarm
+from rag_service.streaming import stream_answer, sse_event, describe_sources
+from rag_service.context_builder import ContextBuilder, TokenCounter
+from rag_service.retrieval import RETRIEVAL_MODES, retrieve_many
+from rag_service.admission import AdmissionController, AdmissionMiddleware
+from rag_service.metrics import CONTENT_TYPE, REGISTRY, TOKENS, MetricsMiddleware, log_slow, span, start_trace
 
 # --- CORREÇÃO FINAL: FORÇAR A LEITURA DO .ENV ---
 # Isso garante que o Python encontre o .env independentemente do diretório de execução.
@@ -36,7 +47,84 @@ os.environ["OPENAI_API_KEY"] = openai_api_key
 # INICIALIZAÇÃO DO APP E DOS MÓDULOS
 # ----------------------------------------------------------------------
 
-app = FastAPI()
+# Modelos da OpenAI; os clientes são criados no pré-aquecimento do lifespan (ou no primeiro uso), não no import
+LLM_MODEL = os.getenv("OPENAI_LLM_MODEL", "gpt-3.5-turbo-instruct")
+EMBEDDING_MODEL = configured_embedding_model()  # OPENAI_EMBEDDING_MODEL, o mesmo lido pela ingestão
+# Diretório do índice FAISS (index.faiss + chunks.sqlite) e intervalo do watcher de versão
+INDEX_PATH = os.getenv("FAISS_INDEX_PATH", os.path.join(os.path.dirname(__file__), "faiss_index"))
+INDEX_POLL_SECONDS = float(os.getenv("FAISS_INDEX_POLL_SECONDS", "30"))
+# Bases de conhecimento: a padrão usa FAISS_INDEX_PATH; as demais vêm de RAG_KNOWLEDGE_BASES
+# (id=caminho, separados por vírgula) e/ou de subdiretórios de RAG_KB_ROOT (ex.: uma por life planner)
+RAG_DEFAULT_KB = os.getenv("RAG_DEFAULT_KB", "default")
+RAG_KNOWLEDGE_BASES = os.getenv("RAG_KNOWLEDGE_BASES", "")
+RAG_KB_ROOT = os.getenv("RAG_KB_ROOT") or None
+# Memória estimada das bases carregadas; acima dela as menos usadas são descarregadas (a padrão fica).
+# Com FAISS_MMAP=1 as páginas mapeadas do index.faiss (page cache compartilhado) não entram na conta
+RAG_KB_MEMORY_MB = int(os.getenv("RAG_KB_MEMORY_MB", "2048"))
+# index.faiss mapeado em memória (compartilhado entre workers) e parâmetros de busca dos índices ANN
+INDEX_MMAP = os.getenv("FAISS_MMAP", "1") == "1"
+INDEX_SEARCH_PARAMS = {
+    "ef_search": int(os.getenv("FAISS_HNSW_EF_SEARCH", "0")) or None,
+    "nprobe": int(os.getenv("FAISS_IVF_NPROBE", "0")) or None,
+}
+# Token opcional para as rotas administrativas (se vazio, as rotas ficam abertas)
+ADMIN_TOKEN = os.getenv("RAG_ADMIN_TOKEN")
+# Cache de embeddings: entradas no LRU em memória e arquivo SQLite compartilhado (vazio desativa o disco)
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "embeddings.sqlite"))
+# Micro-batching das perguntas que faltam no cache: janela de espera, tamanho máximo do lote (1 desativa) e timeout por pergunta
+EMBED_BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "64"))
+EMBED_BATCH_TIMEOUT_SECONDS = float(os.getenv("EMBED_BATCH_TIMEOUT_SECONDS", "30"))
+# Cache semântico de respostas: similaridade mínima (cosseno), validade e tamanho (0 desativa)
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+# /ask idênticos em andamento (pergunta normalizada, base, versão do índice e retriever) compartilham uma execução
+ASK_SINGLE_FLIGHT = os.getenv("ASK_SINGLE_FLIGHT", "1") == "1"
+# /ask/batch: máximo de perguntas por requisição e gerações simultâneas no LLM
+ASK_BATCH_MAX_QUESTIONS = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", "32"))
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "4"))
+# Chunks candidatos recuperados por pergunta; o ContextBuilder escolhe quais cabem no prompt
+RETRIEVER_K = int(os.getenv("RAG_CONTEXT_CANDIDATES", "8"))
+# Contexto do prompt: limite de tokens, peso relevância x diversidade (MMR) e similaridade de quase-duplicata
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("RAG_CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("RAG_CONTEXT_DUPLICATE_THRESHOLD", "0.85"))
+# Recuperação padrão quando a requisição não informa 'retriever': "hybrid" (BM25 + FAISS) ou "vector"
+RAG_DEFAULT_RETRIEVER = os.getenv("RAG_DEFAULT_RETRIEVER", "hybrid")
+# Controle de admissão das rotas /ask: execuções simultâneas, tamanho da fila e espera máxima
+RAG_MAX_CONCURRENCY = int(os.getenv("RAG_MAX_CONCURRENCY", "32"))
+RAG_MAX_QUEUE = int(os.getenv("RAG_MAX_QUEUE", "64"))
+RAG_QUEUE_TIMEOUT_SECONDS = float(os.getenv("RAG_QUEUE_TIMEOUT_SECONDS", "10"))
+# Requisições /ask, /ask/stream e /ask/batch acima deste tempo geram uma linha JSON com o tempo de cada etapa (0 desativa)
+RAG_SLOW_REQUEST_SECONDS = float(os.getenv("RAG_SLOW_REQUEST_SECONDS", "5"))
+# Threads para o que não tem API assíncrona (busca FAISS, SQLite); usado como executor padrão do loop
+RAG_EXECUTOR_WORKERS = int(os.getenv("RAG_EXECUTOR_WORKERS", "16"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Rotas de agendamento registradas antes de servir (o import do scheduler_service fica fora do import do rag)
+    include_scheduler_router(app)
+    # run_in_executor(None, ...) do LangChain passa a usar um pool de tamanho explícito
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=RAG_EXECUTOR_WORKERS))
+    # Índice padrão, clientes e tiktoken em paralelo e em background: o liveness responde desde já
+    # e o readiness fica pronto quando o índice estiver residente (as demais bases carregam no primeiro uso)
+    prewarm.start()
+    knowledge_bases.start_watcher()
+    yield
+    await prewarm.stop()
+    knowledge_bases.stop_watcher()
+
+app = FastAPI(lifespan=lifespan)
+
+# Admissão global: recusa rápida (429/503) quando saturado em vez de empilhar requisições
+admission = AdmissionController(
+    max_concurrent=RAG_MAX_CONCURRENCY,
+    max_queue=RAG_MAX_QUEUE,
+    queue_timeout=RAG_QUEUE_TIMEOUT_SECONDS,
+)
+app.add_middleware(AdmissionMiddleware, controller=admission, paths=["/ask", "/ask/stream", "/ask/batch"])
 
 # Configuração CORS
 app.add_middleware(
@@ -47,12 +135,43 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# INCLUI O ROUTER DE AGENDAMENTO
-app.include_router(scheduler_router)
+# Mais externo: a duração por rota inclui a espera na fila de admissão e as recusas 429/503
+app.add_middleware(MetricsMiddleware)
+
+# ROUTER DE AGENDAMENTO: scheduler_service.main (Calendar, Supabase, numpy) é importado no lifespan
+# ou no primeiro uso, não no import do rag (Certifique-se de que scheduler_service/main.py existe)
+def scheduler_module():
+    from scheduler_service import main as scheduler_main
+
+    return scheduler_main
+
+def include_scheduler_router(app: FastAPI) -> None:
+    if not getattr(app.state, "scheduler_router_included", False):
+        app.include_router(scheduler_module().router)
+        app.state.scheduler_router_included = True
+
+# Configuração do modelo de linguagem (langchain_openai/openai são importados só ao construir o cliente)
+def build_llm():
+    from langchain_openai import OpenAI
+
+    return OpenAI(model_name=LLM_MODEL, temperature=0)
+
+def build_embeddings():
+    from langchain_community.embeddings import OpenAIEmbeddings
 
-# Configuração do modelo de linguagem
-llm = OpenAI(temperature=0)
-embeddings = OpenAIEmbeddings()
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+
+llm_client = LazyClient("llm", build_llm)
+embedding_client = LazyClient("embeddings", build_embeddings)
+# Perguntas simultâneas que faltam no cache viram uma única chamada de embeddings
+embedding_batcher = MicroBatchingEmbeddings(
+    LazyEmbeddings(embedding_client, EMBEDDING_MODEL),
+    window=EMBED_BATCH_WINDOW_MS / 1000,
+    max_batch=EMBED_BATCH_MAX_SIZE,
+    timeout=EMBED_BATCH_TIMEOUT_SECONDS,
+)
+# Perguntas repetidas (WhatsApp/n8n) não pagam novamente a chamada de embeddings
+embeddings = CachedEmbeddings(embedding_batcher, max_entries=EMBEDDING_CACHE_SIZE, db_path=EMBEDDING_CACHE_PATH or None)
 
 # Define o prompt do sistema para o modelo
 system_prompt = """
@@ -74,6 +193,106 @@ prompt_template = PromptTemplate(
     template=system_prompt + "\n\nContexto: {context}\n\nPergunta do usuário: {question}\n\nResposta:"
 )
 
+# Entre a recuperação e o prompt: dedup, MMR e orçamento de tokens, com rótulos de fonte/página
+token_counter = TokenCounter(LLM_MODEL)
+context_builder = ContextBuilder(
+    token_counter,
+    budget_tokens=CONTEXT_TOKEN_BUDGET,
+    mmr_lambda=CONTEXT_MMR_LAMBDA,
+    duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD,
+)
+
+async def retrieve(snapshot, mode: str, questions, vectors):
+    """Busca FAISS (e BM25 no modo híbrido) com os vetores já calculados, fora do event loop."""
+    with span("rag", "search"):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, retrieve_many, snapshot.vector_store, snapshot.lexical_index, questions, vectors, mode, RETRIEVER_K
+        )
+
+async def build_prompt(question: str, docs):
+    """Monta o contexto (fora do event loop) e o prompt final; retorna (prompt, contexto, usage)."""
+    with span("rag", "context"):
+        built = await asyncio.get_running_loop().run_in_executor(None, context_builder.build, question, docs)
+        prompt = prompt_template.format(context=built.text, question=question)
+        usage = context_builder.record(built, prompt)
+    TOKENS.labels("prompt").inc(built.prompt_tokens)
+    return prompt, built, usage
+
+def count_completion(answer: str) -> None:
+    TOKENS.labels("completion").inc(token_counter.count(answer))
+
+# Paráfrases de perguntas já respondidas não passam pelo LLM (temperature=0)
+semantic_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS,
+    max_entries=SEMANTIC_CACHE_SIZE,
+)
+
+# Broadcast no WhatsApp: a mesma pergunta chegando várias vezes enquanto a primeira ainda está no LLM
+ask_flights = SingleFlight("/ask", enabled=ASK_SINGLE_FLIGHT)
+
+def new_index_manager(kb_id: str, path: str) -> IndexManager:
+    manager = IndexManager(
+        path,
+        embeddings,
+        poll_interval=INDEX_POLL_SECONDS,
+        mmap=INDEX_MMAP,
+        search_params=INDEX_SEARCH_PARAMS,
+    )
+    # Um novo índice invalida as respostas geradas com o anterior (só as desta base)
+    manager.add_listener(lambda snapshot: semantic_cache.invalidate(keep_version=snapshot.version,
+                                                                    namespace_prefix=f"{kb_id}:"))
+    return manager
+
+knowledge_bases = KnowledgeBaseRegistry(
+    new_index_manager,
+    {RAG_DEFAULT_KB: INDEX_PATH, **parse_knowledge_bases(RAG_KNOWLEDGE_BASES, os.path.dirname(os.path.abspath(__file__)))},
+    root=RAG_KB_ROOT,
+    memory_budget_bytes=RAG_KB_MEMORY_MB * 1024 ** 2,
+    pinned=[RAG_DEFAULT_KB],
+    poll_interval=INDEX_POLL_SECONDS,
+)
+# IndexManager da base padrão (as rotas e métricas percorrem todas as bases do registro)
+index_manager = knowledge_bases.manager(RAG_DEFAULT_KB)
+
+# Etapas do pré-aquecimento (ver lifespan); os clientes do agendamento são lidos do módulo na hora,
+# para respeitar substituições feitas pelos benchmarks
+prewarm = Prewarm()
+prewarm.add("index", lambda: knowledge_bases.acquire(RAG_DEFAULT_KB))
+prewarm.add("llm", llm_client.get)
+prewarm.add("embeddings", embedding_client.get)
+prewarm.add("tokenizer", lambda: token_counter.load())
+prewarm.add("calendar", lambda: scheduler_module().calendar_pool.warm())
+prewarm.add("supabase", lambda: scheduler_module().get_supabase_client())
+
+def resolve_kb(body: dict) -> str:
+    kb_id = body.get("kb") or RAG_DEFAULT_KB
+    if not isinstance(kb_id, str):
+        raise HTTPException(status_code=400, detail="Campo 'kb' deve ser o id de uma base de conhecimento.")
+    return kb_id
+
+async def acquire_snapshot(kb_id: str):
+    """Snapshot da base (carregada no primeiro uso, uma única carga para requisições simultâneas)."""
+    try:
+        return await knowledge_bases.aacquire(kb_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Base de conhecimento '{kb_id}' não encontrada.")
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail=f"Índice FAISS não encontrado. Verifique se o arquivo '{knowledge_bases.manager(kb_id).index_path}' existe.")
+    except ValueError as e:
+        # Ex.: índice gerado com outro modelo de embeddings
+        raise HTTPException(status_code=500, detail=str(e))
+
+def resolve_retrieval_mode(body: dict) -> str:
+    mode = body.get("retriever") or RAG_DEFAULT_RETRIEVER
+    if mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"Campo 'retriever' inválido. Use um de: {', '.join(RETRIEVAL_MODES)}.")
+    return mode
+
+def check_admin_token(token: Optional[str]) -> None:
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Token administrativo inválido.")
+
 # Rota principal para a API
 @app.post("/ask")
 async def ask_rag(request: Request):
@@ -82,30 +301,297 @@ async def ask_rag(request: Request):
 
     if not question:
         raise HTTPException(status_code=400, detail="A pergunta não pode estar vazia.")
+    mode = resolve_retrieval_mode(body)
+    kb_id = resolve_kb(body)
+    namespace = f"{kb_id}:{mode}"
+
+    trace = start_trace()
+    try:
+        # Snapshot obtido uma única vez: um reload (ou descarte pelo LRU) concorrente não afeta esta requisição
+        snapshot = await acquire_snapshot(kb_id)
+
+        async def answer_question():
+            # O mesmo vetor serve para o cache semântico e para a busca
+            with span("rag", "embed"):
+                question_vector = await embeddings.aembed_query(question)
+            if semantic_cache.enabled:
+                with span("rag", "cache"):
+                    cached = semantic_cache.lookup(question_vector, snapshot.version, namespace=namespace)
+                if cached:
+                    return {"message": cached["answer"], "kb": kb_id, "index_version": snapshot.version, "retriever": mode,
+                            "cache_hit": True}
 
-    # A base de conhecimento única agora é 'faiss_index', conforme sua decisão
-    index_path = "faiss_index"
+            # APIs assíncronas: a recuperação e a chamada ao OpenAI não bloqueiam o event loop do worker
+            docs = (await retrieve(snapshot, mode, [question], [question_vector]))[0]
+            prompt, _, usage = await build_prompt(question, docs)
+            llm = await llm_client.aget()
+            with span("rag", "generate"):
+                answer = await llm.ainvoke(prompt)
+            count_completion(answer)
+            semantic_cache.store(question, question_vector, answer, snapshot.version, namespace=namespace)
+            return {"message": answer, "kb": kb_id, "index_version": snapshot.version, "retriever": mode, "cache_hit": False,
+                    "usage": usage}
+
+        async def lead():
+            # Os tempos das etapas vão junto com o resultado: os seguidores não passam por elas
+            return await answer_question(), trace.as_ms()
+
+        try:
+            # Perguntas idênticas em andamento aguardam a execução da primeira (que segue mesmo se o cliente dela cair)
+            waiting = time.perf_counter()
+            (result, leader_timings), coalesced = await ask_flights.run(
+                (normalize_text(question), kb_id, snapshot.version, mode), lead
+            )
+            if coalesced:
+                # Etapas do líder, mais o tempo que este seguidor passou aguardando o resultado
+                trace.add("wait", time.perf_counter() - waiting)
+                return {**result, "coalesced": True, "timings_ms": {**leader_timings, **trace.as_ms()}}
+            return {**result, "coalesced": False, "timings_ms": trace.as_ms()}
+        except Exception as e:
+            print(f"Erro ao processar a requisição: {e}")
+            raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {e}")
+    finally:
+        # Todas as saídas: resposta do cache, seguidor coalescido, erro e resposta gerada
+        log_slow("/ask", trace, RAG_SLOW_REQUEST_SECONDS)
+
+# Variante em streaming (Server-Sent Events): metadados da recuperação primeiro, depois os tokens
+@app.post("/ask/stream")
+async def ask_rag_stream(request: Request):
+    body = await request.json()
+    question = body.get("question")
+
+    if not question:
+        raise HTTPException(status_code=400, detail="A pergunta não pode estar vazia.")
+    mode = resolve_retrieval_mode(body)
+    kb_id = resolve_kb(body)
+    namespace = f"{kb_id}:{mode}"
+
+    trace = start_trace()
+
+    async def traced(events):
+        # A geração acontece enquanto o StreamingResponse consome os eventos: o trace termina no último evento
+        try:
+            async for event in events:
+                yield event
+        finally:
+            # Fecha o gerador interno mesmo se o StreamingResponse parar antes (e com ele o stream do LLM)
+            await events.aclose()
+            log_slow("/ask/stream", trace, RAG_SLOW_REQUEST_SECONDS)
 
     try:
-        # Carrega a base de conhecimento a partir do índice FAISS
-        vector_store = FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
-        retriever = vector_store.as_retriever()
-
-        # Cria a cadeia de recuperação de dados
-        chain = RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            chain_type_kwargs={"prompt": prompt_template}
-        )
-        
-        response = chain.invoke({"query": question})
-        return {"message": response["result"]}
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail=f"Índice FAISS não encontrado. Verifique se o arquivo '{index_path}' existe.")
+        snapshot = await acquire_snapshot(kb_id)
+        sse_headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+        try:
+            with span("rag", "embed"):
+                question_vector = await embeddings.aembed_query(question)
+        except Exception as e:
+            print(f"Erro ao processar a requisição: {e}")
+            raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {e}")
+        if semantic_cache.enabled:
+            with span("rag", "cache"):
+                cached = semantic_cache.lookup(question_vector, snapshot.version, namespace=namespace)
+            if cached:
+                async def cached_events():
+                    yield sse_event("metadata", {"kb": kb_id, "index_version": snapshot.version, "retriever": mode, "cache_hit": True, "sources": []})
+                    yield sse_event("token", {"text": cached["answer"]})
+                    yield sse_event("done", {"message": cached["answer"]})
+                return StreamingResponse(traced(cached_events()), media_type="text/event-stream", headers=sse_headers)
+
+        try:
+            docs = (await retrieve(snapshot, mode, [question], [question_vector]))[0]
+            prompt, built, usage = await build_prompt(question, docs)
+            llm = await llm_client.aget()
+        except Exception as e:
+            print(f"Erro ao processar a requisição: {e}")
+            raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {e}")
+    except Exception:
+        # Erro antes do streaming (base inexistente, embeddings, busca): a requisição termina aqui
+        log_slow("/ask/stream", trace, RAG_SLOW_REQUEST_SECONDS)
+        raise
+
+    def remember(answer: str) -> None:
+        count_completion(answer)
+        semantic_cache.store(question, question_vector, answer, snapshot.version, namespace=namespace)
+
+    async def timed_events():
+        with span("rag", "generate"):
+            async for event in stream_answer(
+                llm,
+                prompt,
+                {"kb": kb_id, "index_version": snapshot.version, "retriever": mode, "cache_hit": False,
+                 "sources": describe_sources(built.docs), "usage": usage},
+                request.is_disconnected,
+                on_complete=remember,
+            ):
+                yield event
+
+    return StreamingResponse(traced(timed_events()), media_type="text/event-stream", headers=sse_headers)
+
+# Várias perguntas de uma vez: um único embed_documents, uma busca FAISS multi-consulta e geração concorrente
+@app.post("/ask/batch")
+async def ask_rag_batch(request: Request):
+    body = await request.json()
+    questions = body.get("questions")
+
+    if not isinstance(questions, list) or not questions:
+        raise HTTPException(status_code=400, detail="Campo 'questions' deve ser uma lista não vazia.")
+    if len(questions) > ASK_BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"Máximo de {ASK_BATCH_MAX_QUESTIONS} perguntas por lote.")
+    mode = resolve_retrieval_mode(body)
+    kb_id = resolve_kb(body)
+    namespace = f"{kb_id}:{mode}"
+
+    trace = start_trace()
+    try:
+        snapshot = await acquire_snapshot(kb_id)
+
+        results = [None] * len(questions)
+        valid = []
+        for position, question in enumerate(questions):
+            if isinstance(question, str) and question.strip():
+                valid.append(position)
+            else:
+                results[position] = {"question": question, "error": "A pergunta não pode estar vazia."}
+
+        if valid:
+            try:
+                with span("rag", "embed"):
+                    vectors = await embeddings.aembed_queries([questions[i] for i in valid])
+            except Exception as e:
+                print(f"Erro ao gerar embeddings do lote: {e}")
+                raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {e}")
+
+            pending = []
+            with span("rag", "cache"):
+                for position, vector in zip(valid, vectors):
+                    cached = semantic_cache.lookup(vector, snapshot.version, namespace=namespace)
+                    if cached:
+                        results[position] = {"question": questions[position], "message": cached["answer"], "cache_hit": True}
+                    else:
+                        pending.append((position, vector))
+
+            try:
+                retrieved = await retrieve(snapshot, mode, [questions[p] for p, _ in pending], [v for _, v in pending])
+            except Exception as e:
+                # Uma única busca para todo o lote: só as perguntas que dependiam dela ficam com erro (as do cache já têm resposta)
+                print(f"Erro na busca do lote: {e}")
+                for position, _ in pending:
+                    results[position] = {"question": questions[position], "error": f"Erro interno do servidor: {e}"}
+                pending, retrieved = [], []
+            semaphore = asyncio.Semaphore(max(1, ASK_BATCH_CONCURRENCY))
+
+            async def answer(position: int, vector, docs) -> None:
+                question = questions[position]
+                async with semaphore:
+                    try:
+                        prompt, _, usage = await build_prompt(question, docs)
+                        llm = await llm_client.aget()
+                        with span("rag", "generate"):
+                            message = await llm.ainvoke(prompt)
+                        count_completion(message)
+                        semantic_cache.store(question, vector, message, snapshot.version, namespace=namespace)
+                    except Exception as e:
+                        print(f"Erro ao gerar resposta do lote (item {position}): {e}")
+                        results[position] = {"question": question, "error": f"Erro interno do servidor: {e}"}
+                        return
+                results[position] = {"question": question, "message": message, "cache_hit": False, "usage": usage}
+
+            await asyncio.gather(*(answer(p, v, d) for (p, v), d in zip(pending, retrieved)))
+
+        return {"kb": kb_id, "index_version": snapshot.version, "retriever": mode, "results": results}
+    finally:
+        log_slow("/ask/batch", trace, RAG_SLOW_REQUEST_SECONDS)
+
+# --- Rotas administrativas do índice ---
+def kb_manager(kb_id: Optional[str]) -> IndexManager:
+    try:
+        return knowledge_bases.manager(kb_id or RAG_DEFAULT_KB)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Base de conhecimento '{kb_id}' não encontrada.")
+
+@app.post("/admin/reload-index")
+def reload_index(kb: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    previous = kb_manager(kb).stats()["version"]
+    try:
+        snapshot = knowledge_bases.reload(kb or RAG_DEFAULT_KB)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
-        print(f"Erro ao processar a requisição: {e}")
-        raise HTTPException(status_code=500, detail=f"Erro interno do servidor: {e}")
+        raise HTTPException(status_code=500, detail=f"Falha ao recarregar o índice: {e}")
+    return {"status": "success", "kb": kb or RAG_DEFAULT_KB, "previous_version": previous, "index_version": snapshot.version}
+
+@app.get("/admin/index")
+def index_status(kb: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    return kb_manager(kb).stats()
+
+# Bases de conhecimento: residentes, memória estimada e acertos/cargas/descartes por base
+@app.get("/admin/knowledge-bases")
+def knowledge_base_status(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    return knowledge_bases.stats()
+
+@app.get("/admin/stats")
+def service_stats(x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    return {
+        # Índice de cada base em knowledge_bases.knowledge_bases[<id>].index
+        "knowledge_bases": knowledge_bases.stats(),
+        "embedding_cache": embeddings.stats(),
+        "embedding_batcher": embedding_batcher.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "single_flight": ask_flights.stats(),
+        "context": context_builder.stats(),
+        "admission": admission.stats(),
+    }
+
+# Gauges lidos no momento da coleta
+REGISTRY.gauge_func("rag_admission_requests", "Requisições /ask em execução e na fila de admissão.",
+                    lambda: {"active": admission.active, "waiting": admission.waiting}, "state")
+REGISTRY.gauge_func("rag_cache_hit_ratio", "Taxa de acerto dos caches de embeddings e semântico.",
+                    lambda: {"embedding": embeddings.stats()["hit_rate"], "semantic": semantic_cache.stats()["hit_rate"]},
+                    "cache")
+REGISTRY.gauge_func("rag_index_vectors", "Vetores no índice FAISS de cada base de conhecimento residente.",
+                    lambda: {kb: s["vectors"] for kb, s in knowledge_bases.stats()["knowledge_bases"].items() if s["resident"]},
+                    "kb")
+REGISTRY.gauge_func("rag_kb_memory_bytes", "Memória estimada de cada base de conhecimento residente.",
+                    lambda: {kb: s["memory_bytes"] for kb, s in knowledge_bases.stats()["knowledge_bases"].items() if s["resident"]},
+                    "kb")
+REGISTRY.gauge_func("rag_kb_hit_ratio", "Consultas atendidas por uma base já carregada.",
+                    lambda: {kb: s["hit_rate"] for kb, s in knowledge_bases.stats()["knowledge_bases"].items() if s["hit_rate"] is not None},
+                    "kb")
+
+# Sondas do orquestrador: liveness (o processo responde) separado de readiness (bases fixadas residentes)
+@app.get("/health/live")
+def liveness():
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def readiness():
+    # Só as bases fixadas (a padrão) entram na readiness; as demais carregam no primeiro uso e não a afetam
+    checked = sorted(knowledge_bases.pinned)
+    resident = {kb_id: knowledge_bases.manager(kb_id).snapshot is not None for kb_id in checked}
+    index_resident = all(resident.values())
+    ready = index_resident and prewarm.finished
+    body = {
+        "status": "ready" if ready else "starting",
+        "index_resident": index_resident,
+        "knowledge_bases": {
+            "checked": resident,
+            "not_checked": [kb_id for kb_id in knowledge_bases.ids() if kb_id not in resident],
+        },
+        "prewarm": prewarm.stats(),
+    }
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+# Exposição no formato do Prometheus (latências por etapa/rota, tokens, fila, caches)
+@app.get("/metrics")
+def metrics_endpoint():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE)
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(app, host="0.0.0.0", port=8080)
\ No newline at end of file
@@ -0,0 +1,102 @@
+import asyncio
+from typing import Any, Dict, Iterable, Optional
+
+from starlette.responses import JSONResponse
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class AdmissionController:
+    """
+    Controle global de admissão do caminho RAG.
+
+    No máximo 'max_concurrent' requisições executam ao mesmo tempo; até
+    'max_queue' aguardam na fila por no máximo 'queue_timeout' segundos.
+    Com a fila cheia a requisição é recusada na hora (429) e, se o tempo
+    de espera estourar, recebe 503 — em vez de acumular no worker.
+    """
+
+    def __init__(self, max_concurrent: int = 32, max_queue: int = 64, queue_timeout: float = 10.0):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    async def acquire(self) -> None:
+        semaphore = self._get_semaphore()
+        if self.active >= self.max_concurrent and self.waiting >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(429, "Serviço sobrecarregado: fila de requisições cheia. Tente novamente.")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise AdmissionRejected(503, "Serviço sobrecarregado: tempo de espera na fila esgotado. Tente novamente.")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.admitted += 1
+
+    def release(self) -> None:
+        self.active -= 1
+        self._get_semaphore().release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_timeout": self.rejected_timeout,
+        }
+
+
+class AdmissionMiddleware:
+    """
+    Middleware ASGI que segura uma vaga do AdmissionController durante toda a
+    requisição — inclusive respostas em streaming — e a libera mesmo quando
+    o cliente desconecta (cancelamento).
+    """
+
+    def __init__(self, app: Any, controller: AdmissionController, paths: Iterable[str]):
+        self.app = app
+        self.controller = controller
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].rstrip("/") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.controller.acquire()
+        except AdmissionRejected as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers={"Retry-After": "1"})
+            await response(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release()
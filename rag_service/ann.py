@@ -0,0 +1,237 @@
+"""
+Tipos de índice ANN selecionáveis para o faiss_index.
+
+Uso (converter o índice existente):
+    python -m rag_service.ann --index faiss_index --type hnsw
+
+O índice exato (flat) é preservado em index.flat.faiss sempre que o
+index.faiss servido for de outro tipo: ele é a fonte para atualizações
+incrementais da ingestão e a referência de recall do benchmark.
+
+faiss e numpy são importados dentro das funções: o serviço só paga por eles
+na primeira carga de índice, não no import.
+"""
+import argparse
+import json
+import math
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq_fp16")
+FLAT_MASTER_FILE = "index.flat.faiss"
+
+DEFAULT_HNSW_M = 32
+DEFAULT_HNSW_EF_CONSTRUCTION = 200
+DEFAULT_HNSW_EF_SEARCH = 64
+DEFAULT_IVF_NPROBE = 8
+
+
+def mmap_flags() -> int:
+    """Leitura somente-leitura mapeada em memória: workers compartilham a mesma cópia no page cache."""
+    # IO_FLAG_MMAP_IFC (faiss >= 1.10) mapeia os códigos de qualquer tipo; IO_FLAG_MMAP só as listas do IVF.
+    # Os dois juntos não são aceitos para IVF, então usa-se um ou outro.
+    import faiss
+
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def read_index(path: str, mmap: bool = True) -> Any:
+    import faiss
+
+    return faiss.read_index(path, mmap_flags() if mmap else 0)
+
+
+def index_type_of(index: Any) -> str:
+    import faiss
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        return "sq_fp16"
+    if isinstance(index, faiss.IndexFlat):
+        return "flat"
+    return type(index).__name__
+
+
+def mapped_bytes(index: Any) -> int:
+    """
+    Bytes de um índice lido com mmap_flags() que ficam mapeados (page cache
+    compartilhado, liberável pelo kernel) em vez de copiados para o heap:
+    os códigos dos vetores (flat/SQ, e o armazenamento do HNSW) e as listas
+    invertidas do IVF. O grafo do HNSW e os centróides continuam no heap.
+    """
+    import faiss
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, faiss.IndexIVF):
+        invlists = index.invlists
+        entries = sum(invlists.list_size(i) for i in range(invlists.nlist))
+        return entries * (invlists.code_size + 8)  # códigos + ids (int64)
+    if isinstance(index, faiss.IndexFlatCodes) and hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        return index.ntotal * index.code_size
+    return 0
+
+
+def default_nlist(n_vectors: int) -> int:
+    # Regra usual de ~4*sqrt(n) listas, com pelo menos 39 pontos de treino por centróide
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39 or 1))
+
+
+def default_pq_m(dim: int) -> int:
+    # Subquantizadores precisam dividir a dimensão; 1536 -> 96 (16 dims por sub-vetor)
+    for m in (96, 64, 48, 32, 16, 8, 4, 2):
+        if dim % m == 0 and dim // m >= 8:
+            return m
+    return 1
+
+
+def build_ann_index(vectors: "np.ndarray", index_type: str, metric: Optional[int] = None,
+                    params: Optional[Dict[str, Any]] = None) -> Any:
+    """Constrói um índice do tipo pedido com os vetores na mesma ordem (posições = ids do docstore; métrica padrão L2)."""
+    import faiss
+    import numpy as np
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice inválido: '{index_type}'. Use um de: {', '.join(INDEX_TYPES)}.")
+    params = params or {}
+    metric = faiss.METRIC_L2 if metric is None else metric
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dim = vectors.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlat(dim, metric)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params.get("hnsw_m", DEFAULT_HNSW_M), metric)
+        index.hnsw.efConstruction = params.get("ef_construction", DEFAULT_HNSW_EF_CONSTRUCTION)
+        index.hnsw.efSearch = params.get("ef_search", DEFAULT_HNSW_EF_SEARCH)
+    elif index_type == "sq_fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, metric)
+    else:
+        nlist = params.get("nlist") or default_nlist(n)
+        quantizer = faiss.IndexFlat(dim, metric)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            # Com poucos vetores não há pontos para treinar 256 centróides por subquantizador (~39 por centróide)
+            nbits = params.get("pq_nbits") or min(8, max(2, int(math.log2(max(n, 1) / 39)) if n >= 78 else 2))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, params.get("pq_m") or default_pq_m(dim), nbits, metric)
+        index.train(vectors)
+        index.nprobe = params.get("nprobe", DEFAULT_IVF_NPROBE)
+
+    index.add(vectors)
+    return index
+
+
+def apply_search_params(index: Any, ef_search: Optional[int] = None, nprobe: Optional[int] = None) -> None:
+    """Ajusta os parâmetros de busca do índice carregado (efSearch do HNSW / nprobe do IVF)."""
+    import faiss
+
+    index = faiss.downcast_index(index)
+    if ef_search and isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = ef_search
+    if nprobe and isinstance(index, faiss.IndexIVF):
+        index.nprobe = nprobe
+
+
+def flat_vectors(index: Any) -> "np.ndarray":
+    """Extrai todos os vetores de um índice flat (exatos), na ordem das posições."""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def load_flat_master(index_path: str) -> Optional[Any]:
+    """Retorna o índice exato do diretório: index.flat.faiss, ou o próprio index.faiss se ele for flat."""
+    import faiss
+
+    master = os.path.join(index_path, FLAT_MASTER_FILE)
+    if os.path.exists(master):
+        return faiss.read_index(master)
+    main = os.path.join(index_path, "index.faiss")
+    if os.path.exists(main):
+        index = faiss.read_index(main)
+        if index_type_of(index) == "flat":
+            return index
+    return None
+
+
+def write_variant(flat_index: Any, index_type: str, index_path: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Grava index.faiss no tipo pedido a partir do índice exato, preservando o
+    flat em index.flat.faiss quando o tipo servido não for flat. As trocas
+    usam os.replace, então um worker com o arquivo antigo mapeado continua
+    lendo a versão anterior até recarregar.
+    """
+    import faiss
+
+    main = os.path.join(index_path, "index.faiss")
+    master = os.path.join(index_path, FLAT_MASTER_FILE)
+    tmp = f"{main}.tmp-{os.getpid()}"
+
+    if index_type == "flat":
+        faiss.write_index(flat_index, tmp)
+        os.replace(tmp, main)
+        if os.path.exists(master):
+            os.remove(master)
+        return main
+
+    faiss.write_index(flat_index, f"{master}.tmp-{os.getpid()}")
+    os.replace(f"{master}.tmp-{os.getpid()}", master)
+    variant = build_ann_index(flat_vectors(flat_index), index_type, flat_index.metric_type, params)
+    faiss.write_index(variant, tmp)
+    os.replace(tmp, main)
+    return main
+
+
+def replace_file(path: str, text: str) -> None:
+    """Grava o arquivo inteiro em um temporário e troca com os.replace (leitores nunca veem metade)."""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def main(argv: Optional[list] = None) -> None:
+    parser = argparse.ArgumentParser(description="Converte o index.faiss para outro tipo de índice ANN.")
+    parser.add_argument("--index", default=os.getenv("FAISS_INDEX_PATH", "faiss_index"))
+    parser.add_argument("--type", choices=INDEX_TYPES, required=True)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--pq-m", type=int, default=None)
+    parser.add_argument("--hnsw-m", type=int, default=DEFAULT_HNSW_M)
+    args = parser.parse_args(argv)
+
+    flat_index = load_flat_master(args.index)
+    if flat_index is None:
+        raise SystemExit(f"Nenhum índice exato (flat) encontrado em '{args.index}'.")
+    path = write_variant(flat_index, args.type, args.index, {"nlist": args.nlist, "pq_m": args.pq_m, "hnsw_m": args.hnsw_m})
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{args.type}"
+
+    # O manifest registra o tipo convertido: sem isso a próxima ingestão voltaria ao tipo anterior
+    from rag_service.index_manager import MANIFEST_FILE, VERSION_FILE
+
+    manifest_path = os.path.join(args.index, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest["index_type"] = args.type
+        manifest["version"] = version
+        replace_file(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2))
+    else:
+        print(f"ALERTA: '{manifest_path}' não encontrado; a próxima ingestão usará o tipo padrão ou --index-type.")
+
+    # VERSION por último (criado se não existir), como na ingestão: o watcher do serviço recarrega o índice convertido
+    replace_file(os.path.join(args.index, VERSION_FILE), version)
+    print(f"'{path}' gravado como '{args.type}' ({flat_index.ntotal} vetores), versão {version}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Docstore em SQLite lido sob demanda, no lugar do index.pkl.
+
+Uso (migração única de um índice existente):
+    python -m rag_service.chunk_store --index faiss_index
+
+O index.pkl guarda o docstore inteiro como objetos Python: cada worker
+desserializa todos os chunks na inicialização (tempo e heap) e o pickle
+executa código arbitrário se o arquivo for adulterado. Aqui o texto e os
+metadados (JSON) de cada chunk ficam em uma tabela indexada pela posição
+no FAISS; abrir o arquivo lê apenas o cabeçalho (tabela meta) e cada
+consulta busca só os k chunks retornados.
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from langchain_community.docstore.base import Docstore
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+CHUNK_STORE_FILE = "chunks.sqlite"
+PICKLE_FILE = "index.pkl"
+CHUNK_STORE_FORMAT = 1
+
+# Limite de parâmetros por consulta IN (...) do SQLite
+_MAX_PARAMS = 500
+
+
+def ids_digest(doc_ids: Iterable[str]) -> str:
+    """Assinatura da lista ordenada de ids (posição -> id), usada para validar arquivos derivados."""
+    h = hashlib.sha1()
+    for doc_id in doc_ids:
+        h.update(doc_id.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+# --- Escrita ---
+def write_chunk_store(path: str, index_to_docstore_id: Dict[int, str], docstore: Any) -> int:
+    """Grava o docstore em 'path' (substituído atomicamente). Retorna o número de chunks."""
+    tmp = f"{path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE chunks (position INTEGER PRIMARY KEY, doc_id TEXT NOT NULL UNIQUE, "
+            "page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        rows = []
+        for position, doc_id in sorted(index_to_docstore_id.items()):
+            doc = docstore.search(doc_id)
+            if doc is None or isinstance(doc, str):
+                raise ValueError(f"Chunk '{doc_id}' (posição {position}) ausente do docstore.")
+            rows.append((int(position), doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)))
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", rows)
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ("format", str(CHUNK_STORE_FORMAT)),
+            ("count", str(len(rows))),
+            ("ids_digest", ids_digest(row[1] for row in rows)),
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, path)
+    return len(rows)
+
+
+# --- Leitura ---
+class ChunkStore(Docstore):
+    """
+    Docstore somente leitura sobre o chunks.sqlite.
+
+    O arquivo é aberto com immutable=1: a ingestão nunca altera o arquivo no
+    lugar (sempre os.replace), então o SQLite dispensa locks e o descritor
+    aberto continua lendo a versão antiga até o snapshot ser trocado.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        if int(meta.get("format", 0)) != CHUNK_STORE_FORMAT:
+            raise ValueError(f"Formato de chunk store não suportado em '{path}': {meta.get('format')}.")
+        self.count = int(meta["count"])
+        self.ids_digest = meta["ids_digest"]
+        self.reads = 0
+
+    @staticmethod
+    def _to_document(doc_id: str, page_content: str, metadata: str) -> Document:
+        return Document(id=doc_id, page_content=page_content, metadata=json.loads(metadata))
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT doc_id, page_content, metadata FROM chunks WHERE doc_id = ?", (search,)
+            ).fetchone()
+            self.reads += 1
+        if row is None:
+            return f"ID {search} not found."
+        return self._to_document(*row)
+
+    def get_many(self, doc_ids: Sequence[str]) -> List[Document]:
+        """Busca vários chunks em uma consulta, na ordem pedida (ids inexistentes são ignorados)."""
+        found: Dict[str, Document] = {}
+        with self._lock:
+            for start in range(0, len(doc_ids), _MAX_PARAMS):
+                block = list(doc_ids[start:start + _MAX_PARAMS])
+                placeholders = ",".join("?" * len(block))
+                for row in self._conn.execute(
+                    f"SELECT doc_id, page_content, metadata FROM chunks WHERE doc_id IN ({placeholders})", block
+                ):
+                    found[row[0]] = self._to_document(*row)
+            self.reads += 1
+        return [found[doc_id] for doc_id in doc_ids if doc_id in found]
+
+    def doc_id_at(self, position: int) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT doc_id FROM chunks WHERE position = ?", (int(position),)).fetchone()
+        return row[0] if row else None
+
+    def id_items(self) -> List[Tuple[int, str]]:
+        with self._lock:
+            return self._conn.execute("SELECT position, doc_id FROM chunks ORDER BY position").fetchall()
+
+    def iter_documents(self) -> Iterator[Tuple[str, Document]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT doc_id, page_content, metadata FROM chunks ORDER BY position").fetchall()
+        for row in rows:
+            yield row[0], self._to_document(*row)
+
+    def to_in_memory(self) -> Tuple[InMemoryDocstore, Dict[int, str]]:
+        """Carrega tudo em um InMemoryDocstore (usado pela ingestão, que altera o docstore)."""
+        docs = dict(self.iter_documents())
+        return InMemoryDocstore(docs), dict(self.id_items())
+
+    def delete(self, ids: List) -> None:
+        raise NotImplementedError("ChunkStore é somente leitura; use a ingestão para alterar o índice.")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class LazyIdMap(Mapping):
+    """
+    Substitui o dict index_to_docstore_id do FAISS: posição -> id lido do
+    ChunkStore só quando a posição aparece em um resultado de busca.
+    """
+
+    def __init__(self, store: ChunkStore):
+        self.store = store
+
+    def __getitem__(self, position: int) -> str:
+        doc_id = self.store.doc_id_at(position)
+        if doc_id is None:
+            raise KeyError(position)
+        return doc_id
+
+    def __iter__(self) -> Iterator[int]:
+        return (position for position, _ in self.store.id_items())
+
+    def __len__(self) -> int:
+        return self.store.count
+
+    # Leituras completas em uma única consulta em vez de uma por posição
+    def items(self) -> List[Tuple[int, str]]:  # type: ignore[override]
+        return self.store.id_items()
+
+    def values(self) -> List[str]:  # type: ignore[override]
+        return [doc_id for _, doc_id in self.store.id_items()]
+
+
+def open_docstore(index_path: str) -> Tuple[Any, Any]:
+    """
+    Retorna (docstore, index_to_docstore_id) do diretório do índice: o
+    chunks.sqlite quando existe, senão o index.pkl legado (carregado inteiro).
+    """
+    store_path = os.path.join(index_path, CHUNK_STORE_FILE)
+    if os.path.exists(store_path):
+        store = ChunkStore(store_path)
+        return store, LazyIdMap(store)
+    pickle_path = os.path.join(index_path, PICKLE_FILE)
+    print(f"ALERTA: '{index_path}' ainda usa {PICKLE_FILE}; migre com 'python -m rag_service.chunk_store'.")
+    with open(pickle_path, "rb") as f:
+        return pickle.load(f)
+
+
+def docstore_ids_digest(vector_store: Any) -> str:
+    mapping = vector_store.index_to_docstore_id
+    if isinstance(mapping, LazyIdMap):
+        return mapping.store.ids_digest
+    return ids_digest(doc_id for _, doc_id in sorted(mapping.items()))
+
+
+# --- Migração index.pkl -> chunks.sqlite ---
+def migrate(index_path: str, keep_pickle: bool = False) -> Dict[str, Any]:
+    pickle_path = os.path.join(index_path, PICKLE_FILE)
+    if not os.path.exists(pickle_path):
+        raise FileNotFoundError(f"'{pickle_path}' não encontrado.")
+
+    started = time.perf_counter()
+    with open(pickle_path, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    pickle_load_s = time.perf_counter() - started
+
+    store_path = os.path.join(index_path, CHUNK_STORE_FILE)
+    count = write_chunk_store(store_path, index_to_docstore_id, docstore)
+
+    started = time.perf_counter()
+    store = ChunkStore(store_path)
+    open_s = time.perf_counter() - started
+    if store.ids_digest != ids_digest(doc_id for _, doc_id in sorted(index_to_docstore_id.items())):
+        raise RuntimeError("Chunk store gravado não confere com o index.pkl.")
+    store.close()
+
+    report = {
+        "chunks": count,
+        "pickle_mb": round(os.path.getsize(pickle_path) / 2 ** 20, 2),
+        "chunk_store_mb": round(os.path.getsize(store_path) / 2 ** 20, 2),
+        "pickle_load_s": round(pickle_load_s, 4),
+        "chunk_store_open_s": round(open_s, 4),
+    }
+    if not keep_pickle:
+        os.remove(pickle_path)
+    report["pickle_removed"] = not keep_pickle
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Migra o docstore do index.pkl para o chunks.sqlite.")
+    parser.add_argument("--index", default=os.getenv("FAISS_INDEX_PATH", "faiss_index"))
+    parser.add_argument("--keep-pickle", action="store_true", help="Mantém o index.pkl após a migração.")
+    args = parser.parse_args(argv)
+    print(json.dumps(migrate(args.index, keep_pickle=args.keep_pickle), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Montagem do contexto do prompt com orçamento de tokens.
+
+Fica entre a recuperação e o prompt_template: recebe os chunks candidatos
+na ordem do retriever, descarta duplicatas e quase-duplicatas (mesmo
+folheto indexado duas vezes, chunks vizinhos com o overlap do splitter),
+diversifica com MMR e empacota os melhores dentro de um limite de tokens,
+cada um rotulado com arquivo e página.
+"""
+import hashlib
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+
+from rag_service.lexical import STOPWORDS
+
+# Menor trecho repetido entre dois chunks que é tratado como overlap do splitter
+MIN_OVERLAP_CHARS = 40
+MAX_OVERLAP_CHARS = 400
+_WORD_RE = re.compile(r"\w+")
+
+# Estimativa usada quando o tiktoken não consegue carregar o encoding (ex.: sem rede no primeiro uso)
+CHARS_PER_TOKEN_ESTIMATE = 3.5
+
+
+class TokenCounter:
+    """Contagem de tokens com o tiktoken do modelo; o encoding é carregado no primeiro uso."""
+
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding: Any = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                import tiktoken
+                try:
+                    self._encoding = tiktoken.encoding_for_model(self.model)
+                except KeyError:
+                    self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"ALERTA: encoding do tiktoken indisponível para '{self.model}' ({e}); usando estimativa.")
+                self._encoding = None
+            self._loaded = True
+
+    @property
+    def name(self) -> str:
+        if not self._loaded:
+            self.load()
+        return self._encoding.name if self._encoding is not None else "estimate"
+
+    def count(self, text: str) -> int:
+        if not self._loaded:
+            self.load()
+        if not text:
+            return 0
+        if self._encoding is None:
+            return max(1, int(round(len(text) / CHARS_PER_TOKEN_ESTIMATE)))
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+@dataclass
+class BuiltContext:
+    text: str
+    docs: List[Document]
+    context_tokens: int
+    retrieved: int
+    retrieved_tokens: int
+    duplicates_dropped: int = 0
+    overlaps_trimmed: int = 0
+    over_budget: int = 0
+    prompt_tokens: Optional[int] = None
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "context_tokens": self.context_tokens,
+            "retrieved_tokens": self.retrieved_tokens,
+            "chunks_retrieved": self.retrieved,
+            "chunks_used": len(self.docs),
+            "duplicates_dropped": self.duplicates_dropped,
+            "overlaps_trimmed": self.overlaps_trimmed,
+            "over_budget": self.over_budget,
+        }
+
+
+def source_label(doc: Document) -> str:
+    source = os.path.basename(str(doc.metadata.get("source") or "desconhecido"))
+    page = doc.metadata.get("page_label") or (
+        doc.metadata["page"] + 1 if isinstance(doc.metadata.get("page"), int) else None
+    )
+    return f"[Fonte: {source}, p. {page}]" if page is not None else f"[Fonte: {source}]"
+
+
+@lru_cache(maxsize=4096)
+def chunk_features(text: str) -> Tuple[str, FrozenSet[str], FrozenSet[str]]:
+    """
+    (hash normalizado, shingles de 3 palavras, termos) de um chunk. Os chunks
+    de uma versão do índice não mudam, então o cálculo é memorizado por texto.
+    """
+    words = _WORD_RE.findall(text.lower())
+    digest = hashlib.sha1(" ".join(words).encode("utf-8")).hexdigest()
+    shingles = frozenset(" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2)))
+    terms = frozenset(w for w in words if w not in STOPWORDS and len(w) > 1)
+    return digest, shingles, terms
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / float(len(a | b))
+
+
+def strip_overlap(text: str, previous: str) -> str:
+    """Remove de 'text' o trecho que repete o fim (ou o início) de 'previous', como no overlap do splitter."""
+    if len(text) < MIN_OVERLAP_CHARS or len(previous) < MIN_OVERLAP_CHARS:
+        return text
+    # Início de 'text' = fim de 'previous' ('text' vem depois no documento)
+    head = text[:MIN_OVERLAP_CHARS]
+    start = previous.find(head, max(0, len(previous) - MAX_OVERLAP_CHARS))
+    while start != -1:
+        if text.startswith(previous[start:]):
+            return text[len(previous) - start:].lstrip()
+        start = previous.find(head, start + 1)
+    # Fim de 'text' = início de 'previous' ('text' vem antes no documento)
+    tail = text[-MIN_OVERLAP_CHARS:]
+    end = previous.rfind(tail, 0, MAX_OVERLAP_CHARS)
+    while end != -1:
+        size = end + MIN_OVERLAP_CHARS
+        if text.endswith(previous[:size]):
+            return text[:-size].rstrip()
+        end = previous.rfind(tail, 0, size - 1)
+    return text
+
+
+class ContextBuilder:
+    """
+    Seleciona e formata os chunks que vão para o prompt.
+
+    Relevância = posição no ranking do retriever; diversidade = Jaccard entre
+    os conjuntos de termos de cada chunk (sem stopwords). MMR escolhe a cada passo
+    o chunk com maior lambda * relevância - (1 - lambda) * similaridade máxima
+    com os já escolhidos, e o chunk só entra se couber no orçamento.
+    """
+
+    def __init__(self, counter: TokenCounter, budget_tokens: int = 1500, mmr_lambda: float = 0.7,
+                 duplicate_threshold: float = 0.85, separator: str = "\n\n"):
+        self.counter = counter
+        self.budget_tokens = budget_tokens
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.separator = separator
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.context_tokens = 0
+        self.retrieved_tokens = 0
+        self.duplicates_dropped = 0
+        self.overlaps_trimmed = 0
+
+    def _deduplicate(self, docs: List[Document]) -> List[Document]:
+        kept: List[Document] = []
+        seen_hashes: Set[str] = set()
+        kept_shingles: List[FrozenSet[str]] = []
+        for doc in docs:
+            digest, shingles, _ = chunk_features(doc.page_content)
+            if digest in seen_hashes or any(_jaccard(shingles, s) >= self.duplicate_threshold for s in kept_shingles):
+                continue
+            seen_hashes.add(digest)
+            kept_shingles.append(shingles)
+            kept.append(doc)
+        return kept
+
+    def build(self, question: str, docs: List[Document]) -> BuiltContext:
+        retrieved_tokens = sum(self.counter.count(doc.page_content) for doc in docs)
+        candidates = self._deduplicate(docs)
+        duplicates = len(docs) - len(candidates)
+
+        terms = [chunk_features(doc.page_content)[2] for doc in candidates]
+        n = len(candidates)
+        relevance = [1.0 - i / float(n) for i in range(n)]
+        remaining = list(range(n))
+        selected: List[int] = []
+        pieces: List[str] = []
+        used_docs: List[Document] = []
+        used_tokens = 0
+        trimmed = 0
+        over_budget = 0
+        separator_tokens = self.counter.count(self.separator)
+
+        while remaining:
+            def mmr(i: int) -> float:
+                redundancy = max((_jaccard(terms[i], terms[j]) for j in selected), default=0.0)
+                return self.mmr_lambda * relevance[i] - (1.0 - self.mmr_lambda) * redundancy
+
+            best = max(remaining, key=mmr)
+            remaining.remove(best)
+            doc = candidates[best]
+
+            # Chunks vizinhos da mesma página repetem o overlap do splitter: só o trecho novo entra
+            text = doc.page_content
+            for previous in used_docs:
+                if previous.metadata.get("source") == doc.metadata.get("source"):
+                    stripped = strip_overlap(text, previous.page_content)
+                    if stripped != text:
+                        text = stripped
+                        trimmed += 1
+                        break
+            if not text.strip():
+                duplicates += 1
+                continue
+
+            piece = f"{source_label(doc)}\n{text}"
+            cost = self.counter.count(piece) + (separator_tokens if pieces else 0)
+            if used_tokens + cost > self.budget_tokens:
+                over_budget += 1
+                continue
+            used_tokens += cost
+            selected.append(best)
+            pieces.append(piece)
+            used_docs.append(doc)
+
+        text = self.separator.join(pieces)
+        return BuiltContext(
+            text=text,
+            docs=used_docs,
+            context_tokens=self.counter.count(text),
+            retrieved=len(docs),
+            retrieved_tokens=retrieved_tokens,
+            duplicates_dropped=duplicates,
+            overlaps_trimmed=trimmed,
+            over_budget=over_budget,
+        )
+
+    def record(self, built: BuiltContext, prompt: str) -> Dict[str, Any]:
+        """Conta os tokens do prompt final e acumula as métricas; retorna o 'usage' da requisição."""
+        built.prompt_tokens = self.counter.count(prompt)
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += built.prompt_tokens
+            self.context_tokens += built.context_tokens
+            self.retrieved_tokens += built.retrieved_tokens
+            self.duplicates_dropped += built.duplicates_dropped
+            self.overlaps_trimmed += built.overlaps_trimmed
+        return built.usage()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tokenizer": self.counter.name,
+            "budget_tokens": self.budget_tokens,
+            "mmr_lambda": self.mmr_lambda,
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "context_tokens": self.context_tokens,
+            "retrieved_tokens": self.retrieved_tokens,
+            "tokens_saved": self.retrieved_tokens - self.context_tokens,
+            "avg_prompt_tokens": round(self.prompt_tokens / self.requests, 1) if self.requests else None,
+            "duplicates_dropped": self.duplicates_dropped,
+            "overlaps_trimmed": self.overlaps_trimmed,
+        }
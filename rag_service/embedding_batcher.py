@@ -0,0 +1,189 @@
+"""
+Micro-batching dos embeddings de perguntas.
+
+No pico, dezenas de /ask chegam em poucos milissegundos e cada um faria a
+sua própria chamada HTTP de embed_query. O MicroBatchingEmbeddings junta as
+perguntas concorrentes por até 'window' segundos (ou até 'max_batch'
+textos), faz um único embed_documents e devolve a cada requisição o seu
+vetor. Fica abaixo do CachedEmbeddings: só as faltas do cache entram nos
+lotes, e textos repetidos dentro de um lote são enviados uma vez.
+
+Isolamento por requisição: cada uma espera com o seu próprio timeout, e quem
+desiste (timeout ou cliente desconectado) sai do lote sem afetar os demais.
+Se a chamada do lote falha, cada texto é reenviado sozinho e só recebe erro
+quem tem o texto problemático.
+
+O lote vai para o modelo com embed_documents em uma thread do executor: o
+OpenAIEmbeddings do langchain_community implementa aembed_documents de forma
+síncrona, o que bloquearia o event loop durante a chamada HTTP.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor
+from typing import Any, Dict, List, Optional, Set
+
+from langchain_core.embeddings import Embeddings
+
+from rag_service.metrics import EMBED_BATCH_SIZE, EMBED_QUEUE_WAIT
+
+
+class _Waiter:
+    __slots__ = ("text", "future", "enqueued_at")
+
+    def __init__(self, text: str, future: asyncio.Future):
+        self.text = text
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    def __init__(self, underlying: Embeddings, window: float = 0.005, max_batch: int = 64,
+                 timeout: float = 30.0, executor: Optional[Executor] = None):
+        self.underlying = underlying
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.executor = executor
+
+        # Estado do lote aberto; só é tocado pelo event loop (um por worker)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[_Waiter] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.texts_sent = 0
+        self.deduplicated = 0
+        self.largest_batch = 0
+        self.wait_seconds = 0.0
+        self.batch_errors = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.abandoned = 0
+
+    @property
+    def model(self) -> str:
+        # Mesma chave de cache do modelo envolvido
+        return getattr(self.underlying, "model", type(self.underlying).__name__)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch > 1
+
+    # --- Interface Embeddings ---
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.underlying.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Já é um lote (ex.: /ask/batch): vai direto, fora do event loop
+        return await self._send(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if not self.enabled:
+            return (await self._send([text]))[0]
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Primeiro uso neste event loop (ou um novo loop, como nos testes)
+            self._loop, self._pending, self._timer = loop, [], None
+        waiter = _Waiter(text, loop.create_future())
+        self._pending.append(waiter)
+        with self._lock:
+            self.requests += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        try:
+            # Timeout ou cancelamento cancelam só o future desta requisição
+            return await asyncio.wait_for(waiter.future, self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Embedding da pergunta não ficou pronto em {self.timeout:.1f}s.")
+
+    # --- Lotes ---
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        live = [w for w in batch if not w.future.done()]
+        if len(live) < len(batch):
+            with self._lock:
+                self.abandoned += len(batch) - len(live)
+        if live:
+            task = self._loop.create_task(self._run(live))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, texts: List[str]) -> List[List[float]]:
+        vectors = await asyncio.get_running_loop().run_in_executor(self.executor, self.underlying.embed_documents, texts)
+        if len(vectors) != len(texts):
+            raise ValueError(f"O modelo de embeddings devolveu {len(vectors)} vetores para {len(texts)} textos.")
+        return vectors
+
+    async def _run(self, batch: List[_Waiter]) -> None:
+        sent_at = time.perf_counter()
+        texts = list(dict.fromkeys(w.text for w in batch))
+        waits = [sent_at - w.enqueued_at for w in batch]
+        for wait in waits:
+            EMBED_QUEUE_WAIT.observe(wait)
+        EMBED_BATCH_SIZE.observe(len(texts))
+        with self._lock:
+            self.batches += 1
+            self.texts_sent += len(texts)
+            self.deduplicated += len(batch) - len(texts)
+            self.largest_batch = max(self.largest_batch, len(texts))
+            self.wait_seconds += sum(waits)
+
+        results: Dict[str, Any] = {}
+        try:
+            results = dict(zip(texts, await self._send(texts)))
+        except Exception as e:
+            if len(texts) == 1:
+                results = {texts[0]: e}
+            else:
+                # Um texto problemático não derruba os demais: cada um é reenviado sozinho
+                print(f"ALERTA: lote de {len(texts)} embeddings falhou ({e}); reenviando os textos individualmente.")
+                with self._lock:
+                    self.batch_errors += 1
+                singles = await asyncio.gather(*(self._send([t]) for t in texts), return_exceptions=True)
+                results = {t: (r if isinstance(r, BaseException) else r[0]) for t, r in zip(texts, singles)}
+
+        for waiter in batch:
+            if waiter.future.done():
+                continue  # desistiu enquanto o lote estava no modelo
+            result = results[waiter.text]
+            if isinstance(result, BaseException):
+                with self._lock:
+                    self.errors += 1
+                waiter.future.set_exception(result)
+            else:
+                waiter.future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "window_ms": round(self.window * 1000, 2),
+                "max_batch": self.max_batch,
+                "requests": self.requests,
+                "batches": self.batches,
+                "texts_sent": self.texts_sent,
+                "deduplicated": self.deduplicated,
+                "mean_batch_size": round(self.texts_sent / self.batches, 2) if self.batches else None,
+                "largest_batch": self.largest_batch,
+                "mean_wait_ms": round(self.wait_seconds / (self.texts_sent + self.deduplicated) * 1000, 3)
+                if self.batches else None,
+                "batch_errors": self.batch_errors,
+                "errors": self.errors,
+                "timeouts": self.timeouts,
+                "abandoned": self.abandoned,
+                "in_flight_batches": len(self._tasks),
+            }
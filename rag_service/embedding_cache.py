@@ -0,0 +1,239 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """Normaliza a pergunta para a chave do cache: Unicode NFKC, espaços colapsados e sem diferença de caixa."""
+    return " ".join(unicodedata.normalize("NFKC", text).split()).casefold()
+
+
+def cache_key(model: str, text: str) -> str:
+    """Chave de uma pergunta: variações de caixa e espaços da mesma pergunta compartilham o vetor."""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+def document_cache_key(model: str, text: str) -> str:
+    """Chave de um chunk de documento: o texto exato (só NFKC); chunks que diferem na caixa têm vetores próprios."""
+    return hashlib.sha256(f"{model}\0doc\0{unicodedata.normalize('NFKC', text)}".encode("utf-8")).hexdigest()
+
+
+# --- Camada persistente (SQLite em modo WAL, compartilhada entre workers) ---
+class SQLiteEmbeddingStore:
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            # Limite de variáveis do SQLite: consulta em blocos
+            for i in range(0, len(keys), 500):
+                block = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(block))})", block
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, array("f", vector).tobytes(), now) for key, vector in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings (key, vector, created_at) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Envolve um modelo de embeddings com cache em dois níveis:
+    LRU em memória (por processo) e SQLite em disco (sobrevive a restarts e
+    é compartilhado entre workers). Serve tanto para perguntas quanto para
+    chunks de documentos na ingestão: embed_query/embed_queries usam a chave
+    normalizada da pergunta (cache_key) e embed_documents o texto exato
+    (document_cache_key).
+    """
+
+    def __init__(self, underlying: Embeddings, max_entries: int = 2048, db_path: Optional[str] = None,
+                 model_name: Optional[str] = None):
+        self.underlying = underlying
+        self.model = model_name or getattr(underlying, "model", type(underlying).__name__)
+        self.max_entries = max_entries
+        self.store = SQLiteEmbeddingStore(db_path) if db_path else None
+
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- LRU em memória ---
+    def _memory_get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+            return vector
+
+    def _memory_put(self, key: str, vector: List[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    def _keys(self, texts: List[str], query: bool) -> List[str]:
+        key = cache_key if query else document_cache_key
+        return [key(self.model, t) for t in texts]
+
+    def _lookup_memory(self, keys: List[str]) -> Tuple[Dict[str, List[float]], List[str]]:
+        found: Dict[str, List[float]] = {}
+        pending = []
+        for key in keys:
+            if key in found or key in pending:
+                continue
+            vector = self._memory_get(key)
+            if vector is not None:
+                found[key] = vector
+            else:
+                pending.append(key)
+        return found, pending
+
+    def _lookup_disk(self, pending: List[str], found: Dict[str, List[float]]) -> None:
+        from_disk = self.store.get_many(pending)
+        for key, vector in from_disk.items():
+            found[key] = vector
+            self._memory_put(key, vector)
+        with self._lock:
+            self.disk_hits += len(from_disk)
+
+    def _lookup(self, texts: List[str], query: bool) -> Tuple[List[str], Dict[str, List[float]]]:
+        """Resolve o que for possível pelos caches e retorna as chaves e os vetores encontrados."""
+        keys = self._keys(texts, query)
+        found, pending = self._lookup_memory(keys)
+        if pending and self.store is not None:
+            self._lookup_disk(pending, found)
+        return keys, found
+
+    def _missing(self, texts: List[str], keys: List[str], found: Dict[str, List[float]]) -> Tuple[List[str], List[str]]:
+        miss_keys, miss_texts = [], []
+        for key, text in zip(keys, texts):
+            if key not in found and key not in miss_keys:
+                miss_keys.append(key)
+                miss_texts.append(text)
+        with self._lock:
+            self.misses += len(miss_keys)
+        return miss_keys, miss_texts
+
+    def _remember(self, miss_keys: List[str], vectors: List[List[float]], found: Dict[str, List[float]]) -> None:
+        computed = dict(zip(miss_keys, vectors))
+        for key, vector in computed.items():
+            self._memory_put(key, vector)
+        if self.store is not None:
+            self.store.put_many(computed)
+        found.update(computed)
+
+    # --- Interface Embeddings ---
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed_many(texts, query=False)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Várias perguntas em uma chamada (embed_documents do modelo), com a chave de cache das perguntas."""
+        return self._embed_many(texts, query=True)
+
+    def _embed_many(self, texts: List[str], query: bool) -> List[List[float]]:
+        keys, found = self._lookup(texts, query)
+        miss_keys, miss_texts = self._missing(texts, keys, found)
+        if miss_texts:
+            self._remember(miss_keys, self.underlying.embed_documents(miss_texts), found)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        keys, found = self._lookup([text], query=True)
+        if keys[0] in found:
+            return found[keys[0]]
+        miss_keys, _ = self._missing([text], keys, found)
+        self._remember(miss_keys, [self.underlying.embed_query(text)], found)
+        return found[keys[0]]
+
+    # Nas versões assíncronas o acesso ao SQLite vai para o executor, fora do event loop
+    async def _alookup(self, texts: List[str], query: bool) -> Tuple[List[str], Dict[str, List[float]]]:
+        keys = self._keys(texts, query)
+        found, pending = self._lookup_memory(keys)
+        if pending and self.store is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._lookup_disk, pending, found)
+        return keys, found
+
+    async def _aremember(self, miss_keys: List[str], vectors: List[List[float]], found: Dict[str, List[float]]) -> None:
+        if self.store is None:
+            self._remember(miss_keys, vectors, found)
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, self._remember, miss_keys, vectors, found)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed_many(texts, query=False)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await self._aembed_many(texts, query=True)
+
+    async def _aembed_many(self, texts: List[str], query: bool) -> List[List[float]]:
+        keys, found = await self._alookup(texts, query)
+        miss_keys, miss_texts = self._missing(texts, keys, found)
+        if miss_texts:
+            await self._aremember(miss_keys, await self.underlying.aembed_documents(miss_texts), found)
+        return [found[k] for k in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        keys, found = await self._alookup([text], query=True)
+        if keys[0] in found:
+            return found[keys[0]]
+        miss_keys, _ = self._missing([text], keys, found)
+        await self._aremember(miss_keys, [await self.underlying.aembed_query(text)], found)
+        return found[keys[0]]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "model": self.model,
+            "memory_entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "disk_path": self.store.path if self.store else None,
+        }
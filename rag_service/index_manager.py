@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from rag_service.ann import apply_search_params, index_type_of, read_index
+from rag_service.chunk_store import CHUNK_STORE_FILE, PICKLE_FILE, docstore_ids_digest, open_docstore
+from rag_service.lexical import LexicalIndex
+from rag_service.metrics import span
+
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+# Arquivos que compõem o índice: vetores + docstore (chunks.sqlite, ou o index.pkl legado)
+INDEX_FILES = ("index.faiss", CHUNK_STORE_FILE, PICKLE_FILE)
+# Arquivo opcional escrito pelo pipeline de ingestão com a versão explícita do índice
+VERSION_FILE = "VERSION"
+# Manifest da ingestão; settings.embedding_model registra o modelo usado nos vetores do índice
+MANIFEST_FILE = "manifest.json"
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+def configured_embedding_model() -> str:
+    """Modelo de embeddings do serviço e da ingestão (perguntas e chunks precisam estar no mesmo espaço vetorial)."""
+    return os.getenv("OPENAI_EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+
+
+def index_embedding_model(index_path: str) -> Optional[str]:
+    """Modelo registrado no manifest do índice (None para índices sem manifest)."""
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f).get("settings", {}).get("embedding_model")
+
+
+# --- Versão do índice ---
+def compute_index_version(index_path: str) -> Optional[str]:
+    """Retorna a versão do índice em disco (arquivo VERSION ou assinatura de mtime/tamanho)."""
+    version_file = os.path.join(index_path, VERSION_FILE)
+    if os.path.exists(version_file):
+        with open(version_file, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        if version:
+            return version
+
+    present = [name for name in INDEX_FILES if os.path.exists(os.path.join(index_path, name))]
+    if "index.faiss" not in present or len(present) < 2:
+        return None
+    signature = []
+    for name in present:
+        st = os.stat(os.path.join(index_path, name))
+        signature.append(f"{name}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha1("|".join(signature).encode("utf-8")).hexdigest()[:12]
+
+
+# --- Carregamento do vector store ---
+def load_vector_store(index_path: str, embeddings: Any, mmap: bool = True,
+                      search_params: Optional[Dict[str, Any]] = None) -> "FAISS":
+    """
+    Equivalente a FAISS.load_local, mas lê o index.faiss mapeado em memória
+    (somente leitura), aplica os parâmetros de busca do tipo de índice e usa
+    o chunks.sqlite como docstore, sem desserializar os chunks. O FAISS do
+    LangChain só é importado aqui, na primeira carga, e não no import do serviço.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    index = read_index(os.path.join(index_path, "index.faiss"), mmap=mmap)
+    apply_search_params(index, **(search_params or {}))
+    docstore, index_to_docstore_id = open_docstore(index_path)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+# --- Snapshot imutável de um índice carregado ---
+@dataclass(frozen=True)
+class IndexSnapshot:
+    """Tudo que uma requisição precisa para recuperar os chunks: o índice vetorial e o lexical já carregados."""
+    version: str
+    path: str
+    vector_store: Any
+    lexical_index: Any
+    loaded_at: float = field(default_factory=time.time)
+
+
+class IndexManager:
+    """
+    Mantém o índice FAISS carregado uma única vez por processo.
+
+    Um novo índice é carregado por completo fora da seção crítica e só então
+    substitui o anterior com uma única atribuição de referência; requisições
+    em andamento continuam usando o snapshot que já tinham em mãos.
+    """
+
+    def __init__(
+        self,
+        index_path: str,
+        embeddings: Any,
+        poll_interval: float = 30.0,
+        mmap: bool = True,
+        search_params: Optional[Dict[str, Any]] = None,
+    ):
+        self.index_path = index_path
+        self.embeddings = embeddings
+        self.poll_interval = poll_interval
+        self.mmap = mmap
+        self.search_params = search_params or {}
+
+        self._snapshot: Optional[IndexSnapshot] = None
+        self._load_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._listeners: List[Callable[[IndexSnapshot], None]] = []
+        self.last_error: Optional[str] = None
+
+    @property
+    def current(self) -> IndexSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise FileNotFoundError(f"Índice FAISS ainda não carregado a partir de '{self.index_path}'.")
+        return snapshot
+
+    @property
+    def snapshot(self) -> Optional[IndexSnapshot]:
+        """Snapshot carregado, ou None (ainda não carregado ou descarregado)."""
+        return self._snapshot
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._snapshot is not None
+
+    def unload(self) -> bool:
+        """Solta o snapshot (requisições em andamento seguem com o que já têm). Retorna True se havia um."""
+        snapshot, self._snapshot = self._snapshot, None
+        return snapshot is not None
+
+    def add_listener(self, callback: Callable[[IndexSnapshot], None]) -> None:
+        """Registra uma função chamada após cada troca de snapshot (ex.: invalidar caches)."""
+        self._listeners.append(callback)
+
+    def _notify(self, snapshot: IndexSnapshot) -> None:
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                print(f"ERRO em listener de troca do índice '{self.index_path}': {e}")
+
+    def _build_snapshot(self, version: str) -> IndexSnapshot:
+        vector_store = load_vector_store(self.index_path, self.embeddings, self.mmap, self.search_params)
+
+        # Índice lexical pré-calculado pela ingestão; se ausente ou de outro docstore, é montado em memória
+        lexical_index = LexicalIndex.load(self.index_path)
+        if lexical_index is None or lexical_index.ids_digest() != docstore_ids_digest(vector_store):
+            lexical_index = LexicalIndex.from_vector_store(vector_store)
+
+        return IndexSnapshot(
+            version=version,
+            path=self.index_path,
+            vector_store=vector_store,
+            lexical_index=lexical_index,
+        )
+
+    def load(self, force: bool = False) -> IndexSnapshot:
+        """Carrega o índice do disco e faz a troca atômica. Sem 'force', só recarrega se a versão mudou."""
+        with self._load_lock:
+            version = compute_index_version(self.index_path)
+            if version is None:
+                raise FileNotFoundError(f"Índice FAISS não encontrado em '{self.index_path}'.")
+
+            current = self._snapshot
+            if not force and current is not None and current.version == version:
+                return current
+
+            # Vetores de outro modelo não dão erro na busca, só resultados sem sentido: recusa a carga
+            indexed_model = index_embedding_model(self.index_path)
+            query_model = getattr(self.embeddings, "model", None)
+            if indexed_model and query_model and indexed_model != query_model:
+                raise ValueError(
+                    f"Índice '{self.index_path}' foi gerado com o modelo de embeddings '{indexed_model}', "
+                    f"mas as perguntas usam '{query_model}' (OPENAI_EMBEDDING_MODEL). Refaça a ingestão."
+                )
+
+            started = time.perf_counter()
+            with span("rag", "load"):
+                snapshot = self._build_snapshot(version)
+            self._snapshot = snapshot
+            self.last_error = None
+            print(f"Índice FAISS '{self.index_path}' carregado (versão {version}) em {time.perf_counter() - started:.2f}s")
+            self._notify(snapshot)
+            return snapshot
+
+    def reload_if_changed(self) -> bool:
+        """Recarrega quando a versão em disco difere da carregada. Retorna True se houve troca."""
+        current = self._snapshot
+        version = compute_index_version(self.index_path)
+        if version is None or (current is not None and current.version == version):
+            return False
+        try:
+            return self.load() is not current
+        except Exception as e:
+            # Índice possivelmente escrito pela metade: mantém o snapshot atual e tenta no próximo ciclo
+            self.last_error = str(e)
+            print(f"ERRO ao recarregar índice FAISS '{self.index_path}': {e}")
+            return False
+
+    # --- Watcher em background ---
+    def _watch(self) -> None:
+        while not self._stop_event.wait(self.poll_interval):
+            self.reload_if_changed()
+
+    def start_watcher(self) -> None:
+        if self.poll_interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, name="faiss-index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop_event.set()
+        if self._watcher:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "path": self.index_path,
+            "version": snapshot.version if snapshot else None,
+            "loaded_at": snapshot.loaded_at if snapshot else None,
+            "index_type": index_type_of(snapshot.vector_store.index) if snapshot else None,
+            "vectors": snapshot.vector_store.index.ntotal if snapshot else None,
+            "mmap": self.mmap,
+            "docstore": type(snapshot.vector_store.docstore).__name__ if snapshot else None,
+            "last_error": self.last_error,
+        }
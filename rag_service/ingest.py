@@ -0,0 +1,436 @@
+"""
+Pipeline de ingestão incremental: docs/seguro-vida -> faiss_index.
+
+Uso:
+    python -m rag_service.ingest --docs docs/seguro-vida --index faiss_index
+    python -m rag_service.ingest --seed-manifest   # índice anterior ao manifest
+
+Mantém um manifest.json dentro do diretório do índice com o hash de cada
+arquivo e de cada chunk. Em execuções seguintes apenas chunks novos ou
+alterados são enviados para a API de embeddings; vetores de arquivos
+removidos são apagados do índice.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from rag_service.ann import (FLAT_MASTER_FILE, INDEX_TYPES, index_type_of, load_flat_master, read_index, replace_file,
+                             write_variant)
+from rag_service.chunk_store import CHUNK_STORE_FILE, PICKLE_FILE, ChunkStore, open_docstore, write_chunk_store
+from rag_service.index_manager import MANIFEST_FILE, VERSION_FILE, configured_embedding_model
+from rag_service.lexical import LEXICAL_FILE, LexicalIndex
+
+MANIFEST_FORMAT = 1
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_OVERLAP = 200
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_CONCURRENCY = 4
+
+
+# --- Hashes ---
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(rel_path: str, position: int, text_hash: str) -> str:
+    """ID determinístico do chunk no docstore (estável entre execuções)."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{rel_path}#{position}#{text_hash}"))
+
+
+# --- Parsing (executado no pool de processos) ---
+def parse_and_chunk_pdf(path: str, source: str, chunk_size: int, chunk_overlap: int) -> List[Dict[str, Any]]:
+    """Extrai o texto página a página e divide em chunks. Roda em um processo do pool."""
+    from pypdf import PdfReader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    reader = PdfReader(path)
+    total_pages = len(reader.pages)
+    try:
+        page_labels = list(reader.page_labels)
+    except Exception:
+        page_labels = [str(i + 1) for i in range(total_pages)]
+
+    chunks = []
+    for page_number, page in enumerate(reader.pages):
+        try:
+            text = page.extract_text() or ""
+        except Exception as e:
+            print(f"ALERTA: falha ao extrair a página {page_number} de '{source}': {e}")
+            continue
+        if not text.strip():
+            continue
+        for piece in splitter.split_text(text):
+            chunks.append({
+                "text": piece,
+                "metadata": {
+                    "source": source,
+                    "page": page_number,
+                    "page_label": page_labels[page_number] if page_number < len(page_labels) else str(page_number + 1),
+                    "total_pages": total_pages,
+                },
+            })
+    return chunks
+
+
+# --- Manifest ---
+def load_manifest(index_path: str) -> Optional[Dict[str, Any]]:
+    manifest_path = os.path.join(index_path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != MANIFEST_FORMAT:
+        return None
+    return manifest
+
+
+def manifest_version(files: Dict[str, Any], index_type: str) -> str:
+    digest_input = {"files": files, "index_type": index_type}
+    digest = hashlib.sha256(json.dumps(digest_input, sort_keys=True).encode("utf-8")).hexdigest()[:8]
+    return f"{time.strftime('%Y%m%d%H%M%S')}-{digest}"
+
+
+def list_documents(docs_path: str) -> List[str]:
+    found = []
+    for root, _, files in os.walk(docs_path):
+        for name in files:
+            if name.lower().endswith(".pdf"):
+                found.append(os.path.relpath(os.path.join(root, name), docs_path).replace("\\", "/"))
+    return sorted(found)
+
+
+# --- Embeddings em lotes concorrentes e limitados ---
+def embed_in_batches(embeddings: Any, texts: List[str], batch_size: int, concurrency: int) -> List[List[float]]:
+    if not texts:
+        return []
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    vectors: List[List[float]] = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        # executor.map preserva a ordem dos lotes
+        for batch_vectors in executor.map(embeddings.embed_documents, batches):
+            vectors.extend(batch_vectors)
+    return vectors
+
+
+def existing_vectors_by_hash(vector_store: Any) -> Dict[str, List[float]]:
+    """Mapeia hash do texto -> vetor já presente no índice, para reaproveitar sem nova chamada à API."""
+    pool = {}
+    for position, doc_id in vector_store.index_to_docstore_id.items():
+        doc = vector_store.docstore.search(doc_id)
+        if doc is None or isinstance(doc, str):
+            continue
+        pool.setdefault(chunk_sha256(doc.page_content), vector_store.index.reconstruct(int(position)).tolist())
+    return pool
+
+
+def write_index(vector_store: Any, manifest: Dict[str, Any], index_path: str) -> None:
+    """
+    Grava index.faiss + chunks.sqlite (o index.pkl não é mais gerado). Os
+    arquivos são gerados em um diretório temporário e movidos com os.replace;
+    VERSION é o último, então o watcher do serviço só enxerga a nova versão
+    quando tudo já está no lugar.
+    """
+    tmp_path = f"{index_path.rstrip('/')}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    try:
+        # index.faiss no tipo ANN escolhido (o exato fica em index.flat.faiss)
+        write_variant(vector_store.index, manifest["index_type"], tmp_path)
+        write_chunk_store(os.path.join(tmp_path, CHUNK_STORE_FILE),
+                          vector_store.index_to_docstore_id, vector_store.docstore)
+        # Índice BM25 gravado junto, para o retriever híbrido não precisar reconstruí-lo no load
+        LexicalIndex.from_vector_store(vector_store).save(tmp_path)
+        with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        with open(os.path.join(tmp_path, VERSION_FILE), "w", encoding="utf-8") as f:
+            f.write(manifest["version"])
+
+        os.makedirs(index_path, exist_ok=True)
+        master = os.path.join(index_path, FLAT_MASTER_FILE)
+        if os.path.exists(os.path.join(tmp_path, FLAT_MASTER_FILE)):
+            os.replace(os.path.join(tmp_path, FLAT_MASTER_FILE), master)
+        elif os.path.exists(master):
+            os.remove(master)
+        for name in ("index.faiss", CHUNK_STORE_FILE, LEXICAL_FILE, MANIFEST_FILE, VERSION_FILE):
+            os.replace(os.path.join(tmp_path, name), os.path.join(index_path, name))
+        # O docstore legado só é apagado depois que a nova versão está publicada
+        if os.path.exists(os.path.join(index_path, PICKLE_FILE)):
+            os.remove(os.path.join(index_path, PICKLE_FILE))
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+
+def load_for_update(index_path: str, embeddings: Any) -> Optional[Any]:
+    """
+    Carrega o índice existente em memória para edição: o índice exato (flat)
+    e o docstore completo (chunks.sqlite, ou o index.pkl legado).
+    """
+    from langchain_community.vectorstores import FAISS
+
+    # Atualizações incrementais sempre partem do índice exato (flat)
+    flat_index = load_flat_master(index_path)
+    if flat_index is None:
+        return None
+    store_path = os.path.join(index_path, CHUNK_STORE_FILE)
+    if os.path.exists(store_path):
+        store = ChunkStore(store_path)
+        try:
+            docstore, index_to_docstore_id = store.to_in_memory()
+        finally:
+            store.close()
+    elif os.path.exists(os.path.join(index_path, PICKLE_FILE)):
+        docstore, index_to_docstore_id = open_docstore(index_path)
+    else:
+        return None
+    return FAISS(embeddings, flat_index, docstore, index_to_docstore_id)
+
+
+def seed_manifest(docs_path: str, index_path: str, embedding_model: str,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE, chunk_overlap: int = DEFAULT_CHUNK_OVERLAP) -> Dict[str, Any]:
+    """
+    Gera manifest.json e VERSION para um índice sem manifest (gerado antes da
+    ingestão incremental ou migrado do index.pkl) a partir do chunks.sqlite,
+    sem chamar a API. Sem o manifest a primeira ingestão trata o docstore
+    inteiro como obsoleto, e o serviço versiona o índice pela assinatura de
+    mtime. Chunks de arquivos que não existem mais em docs_path entram sem
+    sha256 e saem na próxima ingestão.
+    """
+    if os.path.exists(os.path.join(index_path, MANIFEST_FILE)):
+        raise FileExistsError(f"'{index_path}' já tem {MANIFEST_FILE}; use a ingestão normal ou --full.")
+    store = ChunkStore(os.path.join(index_path, CHUNK_STORE_FILE))
+    try:
+        documents = list(store.iter_documents())
+    finally:
+        store.close()
+
+    files: Dict[str, Dict[str, Any]] = {}
+    for doc_id, doc in documents:
+        rel = os.path.relpath(doc.metadata["source"], docs_path).replace("\\", "/")
+        if rel not in files:
+            path = os.path.join(docs_path, rel)
+            files[rel] = {"sha256": file_sha256(path) if os.path.exists(path) else None, "chunks": []}
+        files[rel]["chunks"].append({"id": doc_id, "sha256": chunk_sha256(doc.page_content),
+                                     "page": doc.metadata.get("page")})
+
+    index_type = index_type_of(read_index(os.path.join(index_path, "index.faiss")))
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "version": manifest_version(files, index_type),
+        "settings": {"embedding_model": embedding_model, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap},
+        "index_type": index_type,
+        "files": files,
+    }
+    replace_file(os.path.join(index_path, MANIFEST_FILE), json.dumps(manifest, ensure_ascii=False, indent=2))
+    # VERSION por último: o watcher do serviço troca a assinatura de mtime pela versão do manifest
+    replace_file(os.path.join(index_path, VERSION_FILE), manifest["version"])
+    return {
+        "version": manifest["version"],
+        "index_type": index_type,
+        "files": len(files),
+        "files_missing": sorted(rel for rel, entry in files.items() if entry["sha256"] is None),
+        "chunks": len(documents),
+    }
+
+
+# --- Execução principal ---
+def run_ingestion(
+    docs_path: str,
+    index_path: str,
+    embeddings: Any,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    workers: Optional[int] = None,
+    full_rebuild: bool = False,
+    index_type: Optional[str] = None,
+) -> Dict[str, Any]:
+    from langchain_community.vectorstores import FAISS
+
+    started = time.perf_counter()
+    model = getattr(embeddings, "model", type(embeddings).__name__)
+    settings = {"embedding_model": model, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap}
+
+    # 1. Estado anterior (índice + manifest), descartado se o modelo de embeddings mudou
+    manifest = None if full_rebuild else load_manifest(index_path)
+    vector_store = None
+    if not full_rebuild and os.path.exists(os.path.join(index_path, "index.faiss")):
+        if manifest is None or manifest.get("settings", {}).get("embedding_model") == model:
+            vector_store = load_for_update(index_path, embeddings)
+    if vector_store is None:
+        manifest = None
+    index_type = index_type or (manifest or {}).get("index_type", "flat")
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice inválido: '{index_type}'. Use um de: {', '.join(INDEX_TYPES)}.")
+    same_settings = manifest is not None and manifest.get("settings") == settings
+    previous_files = manifest["files"] if manifest else {}
+
+    # 2. Classifica os arquivos por hash de conteúdo
+    current_files = list_documents(docs_path)
+    file_hashes = {rel: file_sha256(os.path.join(docs_path, rel)) for rel in current_files}
+    unchanged = [rel for rel in current_files
+                 if same_settings and previous_files.get(rel, {}).get("sha256") == file_hashes[rel]]
+    changed = [rel for rel in current_files if rel not in unchanged]
+    removed = [rel for rel in previous_files if rel not in file_hashes]
+
+    # Sem manifest, todo o docstore existente é substituído pelos chunks recalculados
+    if vector_store is not None and manifest is None:
+        stale_ids = list(vector_store.index_to_docstore_id.values())
+    else:
+        stale_ids = [c["id"] for rel in changed + removed for c in previous_files.get(rel, {}).get("chunks", [])]
+
+    if manifest is not None and not changed and not removed and manifest.get("index_type", "flat") == index_type:
+        print(f"Nenhuma alteração em '{docs_path}'; índice mantido na versão {manifest['version']}.")
+        return {
+            "version": manifest["version"],
+            "files_unchanged": len(unchanged),
+            "files_changed": 0,
+            "files_removed": 0,
+            "chunks_total": len(vector_store.index_to_docstore_id),
+            "chunks_embedded": 0,
+            "chunks_reused": 0,
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+
+    # 3. Parsing + chunking dos arquivos alterados em paralelo (processos)
+    parsed: Dict[str, List[Dict[str, Any]]] = {}
+    if changed:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                rel: executor.submit(
+                    parse_and_chunk_pdf,
+                    os.path.join(docs_path, rel),
+                    "./" + os.path.join(os.path.relpath(docs_path), rel).replace("\\", "/"),
+                    chunk_size,
+                    chunk_overlap,
+                )
+                for rel in changed
+            }
+            for rel, future in futures.items():
+                parsed[rel] = future.result()
+
+    # 4. Reaproveita vetores de chunks cujo texto já está no índice; embeda apenas o restante
+    reuse_pool = existing_vectors_by_hash(vector_store) if vector_store is not None else {}
+    new_texts, new_metadatas, new_ids, new_hashes = [], [], [], []
+    files_manifest = {rel: previous_files[rel] for rel in unchanged}
+    for rel in changed:
+        chunk_entries = []
+        for position, chunk in enumerate(parsed[rel]):
+            text_hash = chunk_sha256(chunk["text"])
+            doc_id = chunk_id(rel, position, text_hash)
+            chunk_entries.append({"id": doc_id, "sha256": text_hash, "page": chunk["metadata"]["page"]})
+            new_texts.append(chunk["text"])
+            new_metadatas.append(chunk["metadata"])
+            new_ids.append(doc_id)
+            new_hashes.append(text_hash)
+        files_manifest[rel] = {"sha256": file_hashes[rel], "chunks": chunk_entries}
+
+    to_embed = sorted({h: t for h, t in zip(new_hashes, new_texts) if h not in reuse_pool}.items())
+    embedded = embed_in_batches(embeddings, [t for _, t in to_embed], batch_size, concurrency)
+    reuse_pool.update({h: v for (h, _), v in zip(to_embed, embedded)})
+
+    # 5. Aplica as mudanças no índice
+    if vector_store is not None and stale_ids:
+        vector_store.delete(stale_ids)
+    text_embeddings = [(t, reuse_pool[h]) for t, h in zip(new_texts, new_hashes)]
+    if vector_store is None:
+        if not text_embeddings:
+            raise ValueError(f"Nenhum texto extraído dos documentos em '{docs_path}'.")
+        vector_store = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=new_metadatas, ids=new_ids)
+    elif text_embeddings:
+        vector_store.add_embeddings(text_embeddings, metadatas=new_metadatas, ids=new_ids)
+
+    new_manifest = {
+        "format": MANIFEST_FORMAT,
+        "version": manifest_version(files_manifest, index_type),
+        "settings": settings,
+        "index_type": index_type,
+        "files": files_manifest,
+    }
+    write_index(vector_store, new_manifest, index_path)
+
+    report = {
+        "version": new_manifest["version"],
+        "index_type": index_type,
+        "files_unchanged": len(unchanged),
+        "files_changed": len(changed),
+        "files_removed": len(removed),
+        "chunks_total": len(vector_store.index_to_docstore_id),
+        "chunks_embedded": len(to_embed),
+        "chunks_reused": len(new_texts) - len(to_embed),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    load_dotenv(os.path.join(base_dir, ".env"))
+
+    parser = argparse.ArgumentParser(description="Gera/atualiza o índice FAISS a partir dos PDFs.")
+    parser.add_argument("--docs", default="docs/seguro-vida", help="Diretório com os PDFs de origem.")
+    parser.add_argument("--index", default=os.getenv("FAISS_INDEX_PATH", "faiss_index"), help="Diretório do índice FAISS.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Textos por chamada de embeddings.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Chamadas de embeddings simultâneas.")
+    parser.add_argument("--workers", type=int, default=None, help="Processos para parsing dos PDFs.")
+    parser.add_argument("--full", action="store_true", help="Ignora o manifest e reconstrói tudo.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=None,
+                        help="Tipo do index.faiss servido (padrão: o da execução anterior ou 'flat').")
+    parser.add_argument("--seed-manifest", action="store_true",
+                        help="Só gera manifest.json/VERSION para um índice sem manifest (não chama a API).")
+    parser.add_argument(
+        "--cache",
+        default=os.getenv("EMBEDDING_CACHE_PATH", os.path.join(base_dir, ".cache", "embeddings.sqlite")),
+        help="Arquivo SQLite do cache de embeddings compartilhado com o serviço (vazio desativa).",
+    )
+    args = parser.parse_args(argv)
+
+    if args.seed_manifest:
+        report = seed_manifest(args.docs, args.index, configured_embedding_model(), args.chunk_size, args.chunk_overlap)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+
+    from langchain_community.embeddings import OpenAIEmbeddings
+    from rag_service.embedding_cache import CachedEmbeddings
+
+    # Mesmo modelo (OPENAI_EMBEDDING_MODEL) e mesmo cache usados pelo /ask: chunks já embedados não voltam para a API
+    embeddings = CachedEmbeddings(OpenAIEmbeddings(model=configured_embedding_model()), max_entries=0,
+                                  db_path=args.cache or None)
+    report = run_ingestion(
+        args.docs,
+        args.index,
+        embeddings,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        workers=args.workers,
+        full_rebuild=args.full,
+        index_type=args.index_type,
+    )
+    report["embedding_cache"] = embeddings.stats()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
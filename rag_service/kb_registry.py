@@ -0,0 +1,357 @@
+"""
+Registro de bases de conhecimento: um índice FAISS por base (vida, saúde,
+marketing de franquias e, no futuro, uma por life planner).
+
+Cada base é um diretório de índice (index.faiss + chunks.sqlite + lexical)
+com o seu próprio IndexManager. Os diretórios vêm de uma lista explícita
+(id=caminho) e/ou de um diretório raiz em que cada subdiretório é uma base,
+descoberta no primeiro uso sem reiniciar o serviço.
+
+- Carga preguiçosa: a base só é lida do disco na primeira consulta.
+- Carga única: requisições simultâneas para uma base ainda não carregada
+  esperam o mesmo Future (sem ocupar uma thread por requisição).
+- LRU limitado por memória: depois de cada carga, as bases menos usadas
+  recentemente são descarregadas até o total estimado caber no orçamento.
+  O orçamento conta a memória própria do processo: com o index.faiss
+  mapeado (FAISS_MMAP=1), as páginas mapeadas ficam no page cache
+  compartilhado entre workers e só o restante do arquivo entra na conta.
+  Bases fixadas (a padrão) nunca saem; requisições em andamento seguem com
+  o snapshot que já tinham.
+- Um único watcher recarrega as bases residentes quando a versão em disco muda.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from rag_service.ann import mapped_bytes
+from rag_service.index_manager import IndexManager, IndexSnapshot
+
+# Ids aceitos na descoberta (também evita caminhos fora do diretório raiz)
+KB_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+def parse_knowledge_bases(spec: str, base_dir: str = "") -> Dict[str, str]:
+    """'vida=indices/vida,saude=/srv/saude' -> {id: caminho}; caminhos relativos partem de base_dir."""
+    result = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        kb_id, sep, path = item.partition("=")
+        kb_id, path = kb_id.strip(), path.strip()
+        if not sep or not path or not KB_ID_PATTERN.match(kb_id):
+            raise ValueError(f"Base de conhecimento inválida em RAG_KNOWLEDGE_BASES: '{item.strip()}' (use id=caminho).")
+        result[kb_id] = path if os.path.isabs(path) else os.path.join(base_dir, path)
+    return result
+
+
+def estimate_snapshot_bytes(snapshot: IndexSnapshot, mmap: bool = False) -> int:
+    """
+    Memória aproximada de um snapshot: index.faiss + índice lexical. Com
+    'mmap', a parte do index.faiss mapeada em memória (ver ann.mapped_bytes)
+    não conta: ela está no page cache, não no heap deste processo.
+    """
+    total = 0
+    index_file = os.path.join(snapshot.path, "index.faiss")
+    if os.path.exists(index_file):
+        total += os.path.getsize(index_file)
+        if mmap:
+            total -= min(total, mapped_bytes(snapshot.vector_store.index))
+    lexical = snapshot.lexical_index
+    if lexical is not None:
+        for name in ("offsets", "postings_docs", "postings_weight"):
+            array = getattr(lexical, name, None)
+            total += getattr(array, "nbytes", 0)
+        # Dicionário termo -> linha e lista de ids (objetos Python): ~100 bytes por item
+        total += 100 * (len(getattr(lexical, "term_to_row", ())) + len(getattr(lexical, "doc_ids", ())))
+    return total
+
+
+class _KnowledgeBase:
+    __slots__ = ("kb_id", "manager", "future", "future_force", "forced_next", "memory_bytes", "hits", "misses",
+                 "coalesced", "loads", "evictions", "errors", "last_error", "last_load_seconds", "last_used")
+
+    def __init__(self, kb_id: str, manager: IndexManager):
+        self.kb_id = kb_id
+        self.manager = manager
+        self.future: Optional[Future] = None
+        self.future_force = False
+        # Recarga forçada pedida durante uma carga sem force: roda logo depois dela
+        self.forced_next: Optional[Future] = None
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.loads = 0
+        self.evictions = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_load_seconds: Optional[float] = None
+        self.last_used: Optional[float] = None
+
+
+class KnowledgeBaseRegistry:
+    def __init__(
+        self,
+        manager_factory: Callable[[str, str], IndexManager],
+        paths: Dict[str, str],
+        root: Optional[str] = None,
+        memory_budget_bytes: int = 2 * 1024 ** 3,
+        pinned: Iterable[str] = (),
+        poll_interval: float = 30.0,
+        load_workers: int = 2,
+    ):
+        self.manager_factory = manager_factory
+        self.paths = dict(paths)
+        self.root = root
+        self.memory_budget_bytes = memory_budget_bytes
+        self.pinned = set(pinned)
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._bases: Dict[str, _KnowledgeBase] = {}
+        # Bases residentes, da menos para a mais recentemente usada
+        self._resident: "OrderedDict[str, None]" = OrderedDict()
+        self._loader = ThreadPoolExecutor(max_workers=max(1, load_workers), thread_name_prefix="kb-loader")
+        self._stop_event = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.unknown = 0
+
+    # --- Resolução ---
+    def _path_of(self, kb_id: str) -> Optional[str]:
+        path = self.paths.get(kb_id)
+        if path is None and self.root and KB_ID_PATTERN.match(kb_id):
+            candidate = os.path.join(self.root, kb_id)
+            if os.path.isdir(candidate):
+                path = candidate
+        return path
+
+    def _base(self, kb_id: str) -> _KnowledgeBase:
+        base = self._bases.get(kb_id)
+        if base is not None:
+            return base
+        path = self._path_of(kb_id)
+        with self._lock:
+            if path is None:
+                self.unknown += 1
+                raise KeyError(kb_id)
+            base = self._bases.get(kb_id)
+            if base is None:
+                base = self._bases[kb_id] = _KnowledgeBase(kb_id, self.manager_factory(kb_id, path))
+        return base
+
+    def manager(self, kb_id: str) -> IndexManager:
+        """IndexManager da base (KeyError se o id não está registrado nem existe no diretório raiz)."""
+        return self._base(kb_id).manager
+
+    def ids(self) -> List[str]:
+        found = set(self.paths) | set(self._bases)
+        if self.root and os.path.isdir(self.root):
+            found.update(name for name in os.listdir(self.root)
+                         if KB_ID_PATTERN.match(name) and os.path.isdir(os.path.join(self.root, name)))
+        return sorted(found)
+
+    # --- Aquisição (carga preguiçosa e única) ---
+    def _hit(self, base: _KnowledgeBase) -> Optional[IndexSnapshot]:
+        snapshot = base.manager.snapshot
+        if snapshot is None:
+            return None
+        with self._lock:
+            base.hits += 1
+            base.last_used = time.time()
+            if base.kb_id in self._resident:
+                self._resident.move_to_end(base.kb_id)
+        return snapshot
+
+    def _load_future(self, base: _KnowledgeBase, force: bool = False) -> Future:
+        with self._lock:
+            future = base.future
+            if future is not None and (base.future_force or not force):
+                base.coalesced += 1
+                return future
+            if future is not None:
+                # A carga em andamento pode não reler o disco (sem force): o force vem logo depois dela
+                if base.forced_next is None:
+                    base.forced_next = Future()
+                    base.misses += 1
+                else:
+                    base.coalesced += 1
+                return base.forced_next
+            future = base.future = Future()
+            base.future_force = force
+            base.misses += 1
+        self._loader.submit(self._load, base, future, force)
+        return future
+
+    def _next_load(self, base: _KnowledgeBase) -> None:
+        """Fim de uma carga (com self._lock): inicia a recarga forçada que ficou na fila, se houver."""
+        future, base.forced_next = base.forced_next, None
+        base.future = future
+        base.future_force = future is not None
+        if future is not None:
+            self._loader.submit(self._load, base, future, True)
+
+    def _load(self, base: _KnowledgeBase, future: Future, force: bool) -> None:
+        started = time.perf_counter()
+        try:
+            snapshot = base.manager.load(force=force)
+        except Exception as e:
+            with self._lock:
+                base.errors += 1
+                base.last_error = str(e)
+                self._next_load(base)
+            future.set_exception(e)
+            return
+        memory = estimate_snapshot_bytes(snapshot, getattr(base.manager, "mmap", False))
+        with self._lock:
+            base.loads += 1
+            base.last_error = None
+            base.last_load_seconds = round(time.perf_counter() - started, 3)
+            base.last_used = time.time()
+            base.memory_bytes = memory
+            self._resident[base.kb_id] = None
+            self._resident.move_to_end(base.kb_id)
+            self._next_load(base)
+        self._enforce_budget(keep=base.kb_id)
+        future.set_result(snapshot)
+
+    def acquire(self, kb_id: str) -> IndexSnapshot:
+        """Snapshot da base, carregando-a se necessário (KeyError para id desconhecido)."""
+        base = self._base(kb_id)
+        snapshot = self._hit(base)
+        return snapshot if snapshot is not None else self._load_future(base).result()
+
+    async def aacquire(self, kb_id: str) -> IndexSnapshot:
+        """Versão assíncrona: base residente responde na hora; senão aguarda a carga compartilhada."""
+        base = self._base(kb_id)
+        snapshot = self._hit(base)
+        if snapshot is not None:
+            return snapshot
+        return await asyncio.wrap_future(self._load_future(base))
+
+    def reload(self, kb_id: str, force: bool = True) -> IndexSnapshot:
+        return self._load_future(self._base(kb_id), force=force).result()
+
+    # --- Orçamento de memória ---
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(self._bases[kb_id].memory_bytes for kb_id in self._resident)
+
+    def _enforce_budget(self, keep: Optional[str] = None) -> List[str]:
+        evicted = []
+        with self._lock:
+            total = sum(self._bases[kb_id].memory_bytes for kb_id in self._resident)
+            for kb_id in list(self._resident):
+                if total <= self.memory_budget_bytes:
+                    break
+                if kb_id == keep or kb_id in self.pinned:
+                    continue
+                base = self._bases[kb_id]
+                del self._resident[kb_id]
+                base.manager.unload()
+                base.evictions += 1
+                total -= base.memory_bytes
+                evicted.append(kb_id)
+        for kb_id in evicted:
+            print(f"Base de conhecimento '{kb_id}' descarregada (LRU, orçamento de {self.memory_budget_bytes // 2 ** 20} MB)")
+        if total > self.memory_budget_bytes and keep is not None:
+            print(f"ALERTA: bases residentes somam {total // 2 ** 20} MB, acima do orçamento de "
+                  f"{self.memory_budget_bytes // 2 ** 20} MB (só restam bases fixadas ou em uso).")
+        return evicted
+
+    def evict(self, kb_id: str) -> bool:
+        with self._lock:
+            base = self._bases.get(kb_id)
+            if base is None or kb_id not in self._resident:
+                return False
+            del self._resident[kb_id]
+            base.manager.unload()
+            base.evictions += 1
+            return True
+
+    # --- Watcher em background (um para todas as bases) ---
+    def _watch(self) -> None:
+        while not self._stop_event.wait(self.poll_interval):
+            with self._lock:
+                # Residentes e fixadas (uma base fixada que falhou na carga é tentada de novo)
+                watched = [self._bases[kb_id] for kb_id in self._resident]
+                watched += [b for kb_id, b in self._bases.items() if kb_id in self.pinned and kb_id not in self._resident]
+            for base in watched:
+                if base.manager.snapshot is None and base.kb_id not in self.pinned:
+                    continue
+                if base.manager.reload_if_changed():
+                    with self._lock:
+                        base.loads += 1
+                        base.memory_bytes = estimate_snapshot_bytes(base.manager.current, base.manager.mmap)
+                        self._resident[base.kb_id] = None
+                    self._enforce_budget(keep=base.kb_id)
+
+    def start_watcher(self) -> None:
+        if self.poll_interval <= 0 or (self._watcher and self._watcher.is_alive()):
+            return
+        self._stop_event.clear()
+        self._watcher = threading.Thread(target=self._watch, name="kb-index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop_event.set()
+        if self._watcher:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    # --- Estatísticas ---
+    def base_stats(self, kb_id: str) -> Dict[str, Any]:
+        base = self._base(kb_id)
+        snapshot = base.manager.snapshot
+        lookups = base.hits + base.misses + base.coalesced
+        return {
+            "id": kb_id,
+            "path": base.manager.index_path,
+            "resident": snapshot is not None,
+            "pinned": kb_id in self.pinned,
+            "version": snapshot.version if snapshot else None,
+            "vectors": snapshot.vector_store.index.ntotal if snapshot else None,
+            "memory_bytes": base.memory_bytes if snapshot else 0,
+            "index": base.manager.stats(),
+            "hits": base.hits,
+            "misses": base.misses,
+            "coalesced": base.coalesced,
+            "hit_rate": round(base.hits / lookups, 4) if lookups else None,
+            "loads": base.loads,
+            "evictions": base.evictions,
+            "errors": base.errors,
+            "last_load_seconds": base.last_load_seconds,
+            "last_used": base.last_used,
+            "last_error": base.last_error or base.manager.last_error,
+        }
+
+    def _idle_stats(self, kb_id: str) -> Dict[str, Any]:
+        """Base registrada (ou descoberta no diretório raiz) que nunca foi consultada: sem IndexManager ainda."""
+        return {
+            "id": kb_id, "path": self._path_of(kb_id), "resident": False, "pinned": kb_id in self.pinned,
+            "version": None, "vectors": None, "memory_bytes": 0, "index": None, "hits": 0, "misses": 0,
+            "coalesced": 0, "hit_rate": None, "loads": 0, "evictions": 0, "errors": 0, "last_load_seconds": None,
+            "last_used": None, "last_error": None,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            known = set(self._bases)
+            resident = list(self._resident)
+        available = self.ids()
+        return {
+            "memory_bytes": self.memory_bytes(),
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "resident": resident,
+            "available": available,
+            "unknown_requests": self.unknown,
+            # Todas as bases do registro: as já consultadas com contadores e índice, as demais como ainda não carregadas
+            "knowledge_bases": {
+                kb_id: self.base_stats(kb_id) if kb_id in known else self._idle_stats(kb_id)
+                for kb_id in available
+            },
+        }
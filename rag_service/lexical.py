@@ -0,0 +1,203 @@
+"""
+Índice lexical (BM25) pré-calculado com tokenização para português.
+
+Termos exatos das apólices e códigos como "MSTRME0153" ou "vida inteira"
+muitas vezes escapam da busca densa; este índice invertido é persistido ao
+lado do index.faiss e combinado com o FAISS por reciprocal rank fusion. O numpy só é importado
+ao construir, carregar ou consultar o índice.
+"""
+import os
+import re
+import unicodedata
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+LEXICAL_FILE = "lexical.npz"
+
+# Stopwords do português (já sem acentos, pois são comparadas após o folding)
+STOPWORDS = frozenset("""
+a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela delas dele deles depois do dos
+e ela elas ele eles em entre era eram essa essas esse esses esta estas este estes eu foi foram ha isso isto ja
+la lhe lhes mais mas me mesmo meu meus minha minhas muito na nas nao nem no nos nossa nossas nosso nossos num
+numa o os ou para pela pelas pelo pelos por qual quando que quem se sem ser seu seus so sua suas tambem te tem
+ter teu tua um uma umas uns voce voces vos sao esta estao seja sejam sera pode podem caso sobre apos cada
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Sufixos removidos pelo stemmer leve (ordem importa: mais longos primeiro)
+_PLURAL_RULES = (("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"), ("ns", "m"), ("res", "r"))
+_SUFFIXES = (
+    "amentos", "imentos", "amento", "imento", "mente", "acoes", "icoes", "acao", "icao", "idades", "idade",
+    "ismos", "ismo", "istas", "ista", "aveis", "iveis", "avel", "ivel", "ancia", "encia", "osos", "osas",
+    "oso", "osa", "ador", "adora", "agem",
+)
+
+
+def fold_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def stem(token: str) -> str:
+    """Stemmer leve para português: plural, sufixos derivacionais comuns e vogal temática final."""
+    if len(token) <= 3 or any(ch.isdigit() for ch in token):
+        return token
+    for suffix, replacement in _PLURAL_RULES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 2:
+            token = token[: -len(suffix)] + replacement
+            break
+    else:
+        if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+            token = token[:-1]
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[: -len(suffix)]
+            break
+    if len(token) > 4 and token[-1] in "aeo":
+        token = token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sem acentos, sem stopwords e com stemming. Códigos alfanuméricos ficam intactos."""
+    tokens = _TOKEN_RE.findall(fold_accents(text.lower()))
+    return [stem(t) for t in tokens if t not in STOPWORDS and len(t) > 1]
+
+
+class LexicalIndex:
+    """
+    Índice invertido em formato CSR: para cada termo, um trecho contíguo de
+    'postings_docs'/'postings_weight'. O peso BM25 de cada posting já é
+    calculado na construção, então a consulta é só soma vetorizada.
+    """
+
+    def __init__(self, doc_ids: Sequence[str], terms: Sequence[str], offsets: "np.ndarray",
+                 postings_docs: "np.ndarray", postings_weight: "np.ndarray"):
+        self.doc_ids = list(doc_ids)
+        self.term_to_row = {t: i for i, t in enumerate(terms)}
+        self.offsets = offsets
+        self.postings_docs = postings_docs
+        self.postings_weight = postings_weight
+
+    @classmethod
+    def build(cls, docs: Iterable[Tuple[str, str]], k1: float = 1.5, b: float = 0.75) -> "LexicalIndex":
+        """Constrói a partir de pares (id no docstore, texto)."""
+        import numpy as np
+
+        doc_ids: List[str] = []
+        term_freqs: List[Dict[str, int]] = []
+        for doc_id, text in docs:
+            counts: Dict[str, int] = {}
+            for token in tokenize(text):
+                counts[token] = counts.get(token, 0) + 1
+            doc_ids.append(doc_id)
+            term_freqs.append(counts)
+
+        n_docs = len(doc_ids)
+        doc_len = np.asarray([sum(c.values()) for c in term_freqs], dtype="float32")
+        avg_len = float(doc_len.mean()) if n_docs and doc_len.mean() > 0 else 1.0
+
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_idx, counts in enumerate(term_freqs):
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_idx, tf))
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype="int64")
+        docs_arr, weights_arr = [], []
+        for row, term in enumerate(terms):
+            plist = postings[term]
+            df = len(plist)
+            idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+            for doc_idx, tf in plist:
+                norm = tf + k1 * (1.0 - b + b * doc_len[doc_idx] / avg_len)
+                docs_arr.append(doc_idx)
+                weights_arr.append(idf * tf * (k1 + 1.0) / norm)
+            offsets[row + 1] = offsets[row] + df
+
+        return cls(
+            doc_ids,
+            terms,
+            offsets,
+            np.asarray(docs_arr, dtype="int32"),
+            np.asarray(weights_arr, dtype="float32"),
+        )
+
+    @classmethod
+    def from_vector_store(cls, vector_store: Any) -> "LexicalIndex":
+        pairs = []
+        for doc_id in vector_store.index_to_docstore_id.values():
+            doc = vector_store.docstore.search(doc_id)
+            if doc is not None and not isinstance(doc, str):
+                pairs.append((doc_id, doc.page_content))
+        return cls.build(pairs)
+
+    # --- Persistência (npz sem pickle) ---
+    def save(self, index_path: str) -> None:
+        import numpy as np
+
+        terms = sorted(self.term_to_row, key=self.term_to_row.get)
+        with open(os.path.join(index_path, LEXICAL_FILE), "wb") as f:
+            np.savez(
+                f,
+                doc_ids=np.asarray(self.doc_ids, dtype=str),
+                terms=np.asarray(terms, dtype=str),
+                offsets=self.offsets,
+                postings_docs=self.postings_docs,
+                postings_weight=self.postings_weight,
+            )
+
+    @classmethod
+    def load(cls, index_path: str) -> Optional["LexicalIndex"]:
+        file_path = os.path.join(index_path, LEXICAL_FILE)
+        if not os.path.exists(file_path):
+            return None
+        import numpy as np
+
+        with np.load(file_path, allow_pickle=False) as data:
+            return cls(
+                data["doc_ids"].tolist(),
+                data["terms"].tolist(),
+                data["offsets"],
+                data["postings_docs"],
+                data["postings_weight"],
+            )
+
+    # --- Consulta ---
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float]]:
+        """Retorna até k pares (id no docstore, score BM25) em ordem decrescente."""
+        rows = [self.term_to_row[t] for t in set(tokenize(query)) if t in self.term_to_row]
+        if not rows or not self.doc_ids:
+            return []
+        import numpy as np
+
+        scores = np.zeros(len(self.doc_ids), dtype="float32")
+        for row in rows:
+            start, end = self.offsets[row], self.offsets[row + 1]
+            # Cada documento aparece uma única vez na lista de um termo
+            scores[self.postings_docs[start:end]] += self.postings_weight[start:end]
+
+        candidates = np.flatnonzero(scores)
+        if candidates.size > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        ordered = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.doc_ids[i], float(scores[i])) for i in ordered]
+
+    def ids_digest(self) -> str:
+        from rag_service.chunk_store import ids_digest
+        return ids_digest(self.doc_ids)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """Combina listas ranqueadas de ids: score = soma de 1 / (k + posição)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for position, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + position + 1)
+    return sorted(scores, key=lambda d: scores[d], reverse=True)
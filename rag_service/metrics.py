@@ -0,0 +1,319 @@
+"""
+Métricas no formato de exposição do Prometheus, sem dependências externas.
+
+A API imita a do prometheus_client (metric.labels(...).observe/inc), então
+trocar pela biblioteca oficial é direto se ela entrar no requirements.
+Cada observação custa um bisect e um incremento sob lock (~1 µs), o que é
+desprezível perto de uma chamada de embeddings, LLM ou Calendar.
+"""
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Buckets em segundos: de 1 ms (busca FAISS, cache) a 30 s (LLM lento)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: str) -> Any:
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: esperados os rótulos {self.labelnames}, recebidos {values}.")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in sorted(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "_lock")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for values, child in sorted(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class GaugeFunc(_Metric):
+    """Gauge lido no momento da coleta: a função retorna um número ou {valor do rótulo: número}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], Any], labelname: Optional[str] = None):
+        super().__init__(name, documentation, (labelname,) if labelname else ())
+        self.func = func
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        try:
+            value = self.func()
+        except Exception:
+            return lines
+        if isinstance(value, dict):
+            for label, item in sorted(value.items()):
+                if item is not None:
+                    lines.append(f"{self.name}{_format_labels(self.labelnames, (label,))} {_format_value(item)}")
+        elif value is not None:
+            lines.append(f"{self.name} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            # Registro idempotente: módulos reimportados (ou dois apps no mesmo processo) reutilizam a métrica
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_func(self, name: str, documentation: str, func: Callable[[], Any],
+                   labelname: Optional[str] = None) -> GaugeFunc:
+        with self._lock:
+            metric = GaugeFunc(name, documentation, func, labelname)
+            self._metrics[name] = metric
+            return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_duration_seconds",
+    "Duração de cada etapa (component=rag|calendar|supabase).",
+    ("component", "stage"),
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "rag_stage_errors_total",
+    "Etapas que terminaram com exceção.",
+    ("component", "stage"),
+)
+TOKENS = REGISTRY.counter(
+    "rag_llm_tokens_total",
+    "Tokens enviados ao (prompt) e gerados pelo (completion) LLM.",
+    ("kind",),
+)
+HTTP_SECONDS = REGISTRY.histogram(
+    "rag_http_request_duration_seconds",
+    "Duração das requisições HTTP por rota (template) e status.",
+    ("method", "route", "status"),
+)
+SINGLE_FLIGHT = REGISTRY.counter(
+    "rag_single_flight_total",
+    "Perguntas idênticas em andamento: 'leader' executou o pipeline, 'coalesced' aguardou a resposta dele.",
+    ("route", "role"),
+)
+EMBED_BATCH_SIZE = REGISTRY.histogram(
+    "rag_embedding_batch_size",
+    "Textos por chamada de embeddings feita pelo micro-batcher de perguntas.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256),
+)
+EMBED_QUEUE_WAIT = REGISTRY.histogram(
+    "rag_embedding_queue_wait_seconds",
+    "Espera de cada pergunta no micro-batcher até o envio do seu lote.",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25),
+)
+
+
+# --- Spans por requisição ---
+class Trace:
+    """Tempos das etapas de uma requisição (somados quando a etapa se repete)."""
+
+    __slots__ = ("started", "spans")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_ms(self) -> Dict[str, float]:
+        timings = {stage: round(seconds * 1000, 2) for stage, seconds in self.spans.items()}
+        timings["total"] = round(self.elapsed * 1000, 2)
+        return timings
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("rag_trace", default=None)
+
+
+def start_trace() -> Trace:
+    trace = Trace()
+    _current_trace.set(trace)
+    return trace
+
+
+@contextmanager
+def span(component: str, stage: str) -> Iterator[None]:
+    """Mede o bloco: histograma global por (component, stage) e, se houver, o Trace da requisição."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(component, stage).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.labels(component, stage).observe(elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage if component == "rag" else f"{component}.{stage}", elapsed)
+
+
+def log_slow(route: str, trace: Trace, threshold: float) -> None:
+    """Uma linha JSON por requisição acima do limite, com o tempo de cada etapa."""
+    if threshold > 0 and trace.elapsed >= threshold:
+        print(json.dumps({"event": "slow_request", "route": route, "timings_ms": trace.as_ms()}))
+
+
+# --- Middleware HTTP ---
+class MetricsMiddleware:
+    """
+    Middleware ASGI puro que observa a duração de cada requisição. O rótulo
+    'route' é o template da rota (ex.: /ask), nunca o caminho bruto, para
+    não explodir a cardinalidade.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            HTTP_SECONDS.labels(scope["method"], template, str(status["code"])).observe(time.perf_counter() - started)
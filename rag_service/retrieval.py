@@ -0,0 +1,58 @@
+from typing import Any, List
+
+from langchain_core.documents import Document
+
+from rag_service.lexical import reciprocal_rank_fusion
+
+# Modos de recuperação selecionáveis por requisição
+RETRIEVAL_MODES = ("vector", "hybrid")
+
+
+def search_many_ids(vector_store: Any, vectors: List[List[float]], k: int = 4) -> List[List[str]]:
+    """
+    Busca todas as perguntas de uma vez no índice FAISS (uma única chamada
+    index.search com a matriz de consultas) e devolve os ids do docstore de
+    cada uma, na ordem de entrada.
+    """
+    if not vectors:
+        return []
+    # faiss/numpy só na primeira busca: este módulo é importado junto com o rag.py
+    import faiss
+    import numpy as np
+
+    queries = np.asarray(vectors, dtype="float32")
+    if getattr(vector_store, "_normalize_L2", False):
+        faiss.normalize_L2(queries)
+
+    _, indices = vector_store.index.search(queries, k)
+    return [[vector_store.index_to_docstore_id[int(i)] for i in row if i != -1] for row in indices]
+
+
+def docs_for_ids(vector_store: Any, ids: List[str]) -> List[Document]:
+    # ChunkStore lê os k chunks em uma única consulta
+    if hasattr(vector_store.docstore, "get_many"):
+        return vector_store.docstore.get_many(ids)
+    docs = []
+    for doc_id in ids:
+        doc = vector_store.docstore.search(doc_id)
+        if doc is not None and not isinstance(doc, str):
+            docs.append(doc)
+    return docs
+
+
+def hybrid_rank(vector_ids: List[str], lexical_index: Any, query: str, k: int = 4, fetch_k: int = 20,
+                rrf_k: int = 60) -> List[str]:
+    """Funde o ranking do FAISS com o BM25 (reciprocal rank fusion) e devolve os k melhores ids."""
+    lexical_ids = [doc_id for doc_id, _ in lexical_index.search(query, fetch_k)]
+    return reciprocal_rank_fusion([vector_ids, lexical_ids], k=rrf_k)[:k]
+
+
+def retrieve_many(vector_store: Any, lexical_index: Any, questions: List[str], vectors: List[List[float]],
+                  mode: str = "vector", k: int = 4, fetch_k: int = 20) -> List[List[Document]]:
+    """Recuperação em lote: uma busca FAISS multi-consulta e, no modo híbrido, fusão com o BM25 por pergunta."""
+    if mode == "hybrid":
+        id_lists = search_many_ids(vector_store, vectors, fetch_k)
+        id_lists = [hybrid_rank(ids, lexical_index, q, k, fetch_k) for ids, q in zip(id_lists, questions)]
+    else:
+        id_lists = search_many_ids(vector_store, vectors, k)
+    return [docs_for_ids(vector_store, ids) for ids in id_lists]
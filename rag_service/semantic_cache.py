@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+@dataclass
+class CachedAnswer:
+    question: str
+    answer: str
+    index_version: str
+    namespace: str = ""
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class SemanticCache:
+    """
+    Cache de respostas por similaridade de pergunta.
+
+    As perguntas já respondidas ficam em um índice FAISS pequeno e dedicado
+    (produto interno sobre vetores normalizados = similaridade de cosseno).
+    Como o LLM roda com temperature=0, uma paráfrase acima do limiar pode
+    receber a resposta armazenada sem nova chamada ao modelo. Cada entrada
+    guarda a versão do faiss_index que a gerou e expira após o TTL. faiss e
+    numpy só são importados no primeiro lookup/store, não no import do serviço.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 3600, max_entries: int = 1000,
+                 search_k: int = 4):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.search_k = search_k
+
+        self._index: Optional[Any] = None
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> "np.ndarray":
+        import faiss
+        import numpy as np
+
+        arr = np.asarray(vector, dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(arr)
+        return arr
+
+    def _remove(self, ids: List[int]) -> None:
+        import numpy as np
+
+        if not ids:
+            return
+        for entry_id in ids:
+            self._entries.pop(entry_id, None)
+        self._index.remove_ids(np.asarray(ids, dtype="int64"))
+
+    def _is_stale(self, entry: CachedAnswer, index_version: str, now: float) -> bool:
+        return entry.index_version != index_version or (now - entry.created_at) > self.ttl_seconds
+
+    def lookup(self, vector: List[float], index_version: str, namespace: str = "") -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        query = self._normalize(vector)
+        with self._lock:
+            if self._index is None or self._index.ntotal == 0 or query.shape[1] != self._index.d:
+                self.misses += 1
+                return None
+
+            scores, ids = self._index.search(query, min(self.search_k, self._index.ntotal))
+            now = time.time()
+            stale = []
+            result = None
+            for score, entry_id in zip(scores[0], ids[0]):
+                entry = self._entries.get(int(entry_id))
+                if entry is None:
+                    continue
+                if entry.namespace != namespace:
+                    # Outra base/modo: a versão não é comparável com a desta consulta, só o TTL
+                    if (now - entry.created_at) > self.ttl_seconds:
+                        stale.append(int(entry_id))
+                    continue
+                if self._is_stale(entry, index_version, now):
+                    stale.append(int(entry_id))
+                    continue
+                if score >= self.threshold:
+                    entry.hits += 1
+                    result = {"answer": entry.answer, "similarity": float(score), "cached_question": entry.question}
+                break
+            self.expired += len(stale)
+            self._remove(stale)
+
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return result
+
+    def store(self, question: str, vector: List[float], answer: str, index_version: str, namespace: str = "") -> None:
+        if not self.enabled:
+            return
+        import faiss
+        import numpy as np
+
+        arr = self._normalize(vector)
+        with self._lock:
+            if self._index is None or arr.shape[1] != self._index.d:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(arr.shape[1]))
+                self._entries.clear()
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(arr, np.asarray([entry_id], dtype="int64"))
+            self._entries[entry_id] = CachedAnswer(
+                question=question, answer=answer, index_version=index_version, namespace=namespace
+            )
+
+            # Remove as entradas mais antigas quando passa do limite
+            overflow = len(self._entries) - self.max_entries
+            if overflow > 0:
+                self._remove(list(self._entries.keys())[:overflow])
+
+    def invalidate(self, keep_version: Optional[str] = None, namespace_prefix: str = "") -> int:
+        """Remove entradas de outras versões do índice (ou todas, sem 'keep_version') nos namespaces com o prefixo."""
+        with self._lock:
+            if self._index is None:
+                return 0
+            ids = [i for i, e in self._entries.items()
+                   if e.namespace.startswith(namespace_prefix) and (keep_version is None or e.index_version != keep_version)]
+            self._remove(ids)
+            self.invalidated += len(ids)
+            return len(ids)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "invalidated": self.invalidated,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
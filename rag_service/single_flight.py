@@ -0,0 +1,78 @@
+"""
+Coalescência de requisições idênticas em andamento (single-flight).
+
+Quando um disparo no WhatsApp gera a mesma pergunta dezenas de vezes em
+poucos segundos, só a primeira (líder) executa embed + busca + LLM; as
+demais com a mesma chave aguardam o mesmo resultado. Com temperature=0 a
+resposta seria idêntica.
+
+A computação roda em uma task própria, e cada requisição a aguarda com
+asyncio.shield: se o cliente do líder desconecta, só a espera dele é
+cancelada e os seguidores continuam recebendo a resposta. A chave sai do
+mapa assim que a computação termina; a coalescência vale só para o que está
+em andamento, e o que vem depois fica por conta do cache semântico.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from rag_service.metrics import SINGLE_FLIGHT
+
+
+class SingleFlight:
+    def __init__(self, name: str, enabled: bool = True):
+        self.name = name
+        self.enabled = enabled
+        self._flights: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.abandoned = 0
+        self.max_followers = 0
+        self._followers: Dict[Hashable, int] = {}
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Resultado de compute() para a chave e se esta requisição foi coalescida com uma já em andamento."""
+        if not self.enabled:
+            return await compute(), False
+        task: Optional[asyncio.Task] = self._flights.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.coalesced += 1
+            self._followers[key] += 1
+            self.max_followers = max(self.max_followers, self._followers[key])
+            SINGLE_FLIGHT.labels(self.name, "coalesced").inc()
+        else:
+            self.leaders += 1
+            SINGLE_FLIGHT.labels(self.name, "leader").inc()
+            task = asyncio.ensure_future(compute())
+            self._flights[key] = task
+            self._followers[key] = 0
+            task.add_done_callback(lambda done: self._finished(key, done))
+        try:
+            return await asyncio.shield(task), coalesced
+        except asyncio.CancelledError:
+            if not task.done():
+                # Cliente desconectou: a computação segue para quem ainda aguarda (e para o cache)
+                self.abandoned += 1
+            raise
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+            self._followers.pop(key, None)
+        # Marca a exceção como lida mesmo se ninguém mais aguardava
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.leaders + self.coalesced
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / total, 4) if total else None,
+            "max_followers": self.max_followers,
+            "errors": self.errors,
+            "abandoned": self.abandoned,
+        }
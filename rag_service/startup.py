@@ -0,0 +1,130 @@
+"""
+Subida rápida do serviço (restart do container, autoscaling).
+
+Importar o rag.py não cria os clientes da OpenAI nem carrega o índice: os
+módulos pesados (langchain_openai/openai, supabase, googleapiclient) só são
+importados quando o cliente é construído. O lifespan dispara o
+pré-aquecimento em background — índice padrão, clientes e encoding do
+tiktoken em paralelo no executor — e o servidor já responde ao liveness
+enquanto isso. O readiness só fica pronto com o índice residente.
+
+Uma requisição que chegue antes do fim do pré-aquecimento não falha: o
+LazyClient constrói o cliente no primeiro uso (uma única vez, mesmo com
+várias threads) e o registro de bases compartilha a carga do índice.
+"""
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, List, Optional, TypeVar
+
+from langchain_core.embeddings import Embeddings
+
+T = TypeVar("T")
+
+
+class LazyClient(Generic[T]):
+    """Cliente construído no primeiro get() (ou no pré-aquecimento), uma única vez por processo."""
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self.factory = factory
+        self._value: Optional[T] = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._value is not None
+
+    def get(self) -> T:
+        value = self._value
+        if value is None:
+            with self._lock:
+                if self._value is None:
+                    started = time.perf_counter()
+                    self._value = self.factory()
+                    self.load_seconds = round(time.perf_counter() - started, 3)
+                value = self._value
+        return value
+
+    async def aget(self) -> T:
+        """Versão assíncrona: a construção (imports pesados) roda fora do event loop."""
+        value = self._value
+        if value is None:
+            value = await asyncio.get_running_loop().run_in_executor(None, self.get)
+        return value
+
+    def set(self, value: T) -> None:
+        """Substitui o cliente (benchmarks e testes com backends falsos)."""
+        with self._lock:
+            self._value = value
+
+
+class LazyEmbeddings(Embeddings):
+    """Embeddings que só constroem o cliente real no primeiro uso; 'model' é conhecido antes disso (chave de cache)."""
+
+    def __init__(self, client: LazyClient, model: str):
+        self.client = client
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.client.get().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.client.get().embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await (await self.client.aget()).aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await (await self.client.aget()).aembed_query(text)
+
+
+class Prewarm:
+    """Etapas independentes do pré-aquecimento, executadas em paralelo no executor padrão do loop."""
+
+    def __init__(self):
+        self._steps: Dict[str, Callable[[], Any]] = {}
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, step: Callable[[], Any]) -> None:
+        self._steps[name] = step
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.get_running_loop().create_task(self.run())
+        return self._task
+
+    async def run(self) -> None:
+        started = time.perf_counter()
+        self.results = {name: {"status": "running"} for name in self._steps}
+        await asyncio.gather(*(self._run_step(name, step) for name, step in self._steps.items()))
+        self.seconds = round(time.perf_counter() - started, 3)
+        timings = ", ".join(f"{name} {r['seconds']:.2f}s" for name, r in self.results.items())
+        print(f"Pré-aquecimento concluído em {self.seconds:.2f}s ({timings})")
+
+    async def _run_step(self, name: str, step: Callable[[], Any]) -> None:
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, step)
+            self.results[name] = {"status": "ok", "seconds": round(time.perf_counter() - started, 3)}
+        except Exception as e:
+            # Uma etapa que falha não impede as demais; a requisição tentará de novo sob demanda
+            print(f"ALERTA: pré-aquecimento de '{name}' falhou: {e}")
+            self.results[name] = {"status": "error", "seconds": round(time.perf_counter() - started, 3), "error": str(e)}
+
+    @property
+    def finished(self) -> bool:
+        return self._task is not None and self._task.done()
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"finished": self.finished, "seconds": self.seconds, "steps": self.results}
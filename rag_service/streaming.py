@@ -0,0 +1,57 @@
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Formata um evento Server-Sent Events (uma linha 'data' com JSON)."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def describe_sources(docs: List[Any]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "source": doc.metadata.get("source"),
+            "page": doc.metadata.get("page"),
+            "page_label": doc.metadata.get("page_label"),
+        }
+        for doc in docs
+    ]
+
+
+async def stream_answer(
+    llm: Any,
+    prompt: str,
+    metadata: Dict[str, Any],
+    is_disconnected: Callable[[], Awaitable[bool]],
+    on_complete: Optional[Callable[[str], None]] = None,
+) -> AsyncIterator[str]:
+    """
+    Gera os eventos SSE: primeiro os metadados da recuperação, depois os
+    tokens do LLM conforme chegam e por fim 'done' com a resposta completa.
+
+    O StreamingResponse só pede o próximo evento depois de enviar o anterior
+    (backpressure). Se o cliente desconectar, o stream do LLM é fechado e a
+    geração para de consumir tokens.
+    """
+    yield sse_event("metadata", metadata)
+
+    parts: List[str] = []
+    token_stream = llm.astream(prompt)
+    try:
+        async for token in token_stream:
+            if await is_disconnected():
+                print("Cliente desconectou durante o streaming; geração interrompida.")
+                return
+            parts.append(token)
+            yield sse_event("token", {"text": token})
+    except Exception as e:
+        print(f"Erro durante o streaming da resposta: {e}")
+        yield sse_event("error", {"detail": f"Erro interno do servidor: {e}"})
+        return
+    finally:
+        await token_stream.aclose()
+
+    answer = "".join(parts)
+    if on_complete:
+        on_complete(answer)
+    yield sse_event("done", {"message": answer})
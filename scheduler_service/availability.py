@@ -0,0 +1,345 @@
+"""
+Motor de disponibilidade com bitmaps de minutos.
+
+Cada dia é um vetor de 1440 posições (minutos do relógio local). O horário
+comercial de cada dia da semana é compilado uma vez; feriados zeram o dia;
+os compromissos de cada life planner ficam em um IntervalIndex (intervalos
+ordenados e fundidos) que pinta o bitmap de ocupação de um intervalo de
+dias com uma soma acumulada. Livre = comercial & ~ocupado, e os slots
+(blocos de 60 minutos e um de 50 no fim da janela livre, as regras do
+generate_slots_for_day) são cortados de todas as janelas livres de uma vez
+com operações do numpy — consultar um mês custa o mesmo que um dia.
+
+Eventos fora da grade de minutos (segundos != 0) não cabem no bitmap: para
+esses intervalos o cálculo cai para a versão exata com datetimes.
+"""
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MINUTES_PER_DAY = 1440
+Interval = Tuple[datetime, datetime]
+
+
+# --- Feriados nacionais ---
+def easter(year: int) -> date:
+    """Domingo de Páscoa (algoritmo de Meeus/Jones/Butcher, calendário gregoriano)."""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def brazilian_holidays(year: int, include_optional: bool = False) -> Dict[date, str]:
+    """Feriados nacionais do ano; com include_optional, também Carnaval e Corpus Christi (pontos facultativos)."""
+    holidays = {
+        date(year, 1, 1): "Confraternização Universal",
+        date(year, 4, 21): "Tiradentes",
+        date(year, 5, 1): "Dia do Trabalho",
+        date(year, 9, 7): "Independência do Brasil",
+        date(year, 10, 12): "Nossa Senhora Aparecida",
+        date(year, 11, 2): "Finados",
+        date(year, 11, 15): "Proclamação da República",
+        date(year, 12, 25): "Natal",
+    }
+    if year >= 2024:
+        holidays[date(year, 11, 20)] = "Dia Nacional de Zumbi e da Consciência Negra"  # Lei 14.759/2023
+    sunday = easter(year)
+    holidays[sunday - timedelta(days=2)] = "Sexta-feira Santa"
+    if include_optional:
+        holidays[sunday - timedelta(days=48)] = "Carnaval"
+        holidays[sunday - timedelta(days=47)] = "Carnaval"
+        holidays[sunday + timedelta(days=60)] = "Corpus Christi"
+    return holidays
+
+
+class HolidayCalendar:
+    def __init__(self, include_optional: bool = False, extra: Iterable[date] = ()):
+        self.include_optional = include_optional
+        self.extra = frozenset(extra)
+        self._by_year = lru_cache(maxsize=64)(self._compute_year)
+
+    def _compute_year(self, year: int) -> Dict[date, str]:
+        holidays = brazilian_holidays(year, self.include_optional)
+        for d in self.extra:
+            if d.year == year:
+                holidays.setdefault(d, "Feriado local")
+        return holidays
+
+    def holidays(self, year: int) -> Dict[date, str]:
+        return self._by_year(year)
+
+    def is_holiday(self, d: date) -> bool:
+        return d in self._by_year(d.year)
+
+    def name(self, d: date) -> Optional[str]:
+        return self._by_year(d.year).get(d)
+
+    def mask(self, first: date, days: int) -> np.ndarray:
+        """Vetor booleano (days,) com True nos feriados a partir de 'first'."""
+        mask = np.zeros(days, dtype=bool)
+        last = first + timedelta(days=days - 1)
+        for year in range(first.year, last.year + 1):
+            for d in self._by_year(year):
+                if first <= d <= last:
+                    mask[(d - first).days] = True
+        return mask
+
+
+# --- Índice de intervalos ocupados ---
+def _minute(dt: datetime) -> int:
+    """Minuto absoluto do relógio local: ordinal do dia * 1440 + minuto do dia."""
+    return dt.toordinal() * MINUTES_PER_DAY + dt.hour * 60 + dt.minute
+
+
+def _aligned(dt: datetime) -> bool:
+    return dt.second == 0 and dt.microsecond == 0
+
+
+class IntervalIndex:
+    """
+    Intervalos ocupados de uma agenda, fundidos e ordenados em dois vetores
+    (início, fim) de minutos locais. 'exact' indica que todos os limites caem
+    em minutos inteiros, isto é, que o bitmap representa os intervalos sem perda.
+    """
+
+    def __init__(self, intervals: Iterable[Interval], tz):
+        self.tz = tz
+        pairs: List[Tuple[int, int]] = []
+        cuts: List[int] = []
+        self.intervals: List[Interval] = []
+        self.exact = True
+        for start, end in intervals:
+            start, end = start.astimezone(tz), end.astimezone(tz)
+            if end < start:
+                continue
+            self.intervals.append((start, end))
+            self.exact = self.exact and _aligned(start) and _aligned(end)
+            if end == start:
+                # Evento de duração zero não ocupa minutos, mas (como no cálculo original) divide a janela livre
+                cuts.append(_minute(start))
+                continue
+            # Arredonda para fora: o minuto parcialmente ocupado conta como ocupado
+            pairs.append((_minute(start), _minute(end) + (0 if _aligned(end) else 1)))
+        pairs.sort()
+        merged: List[List[int]] = []
+        for start_m, end_m in pairs:
+            if merged and start_m <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end_m)
+            else:
+                merged.append([start_m, end_m])
+        array = np.asarray(merged, dtype=np.int64).reshape(-1, 2)
+        self.starts = array[:, 0]
+        self.ends = array[:, 1]
+        self.cuts = np.unique(np.asarray(cuts, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.starts) + len(self.cuts)
+
+    def busy_mask(self, first: date, days: int) -> np.ndarray:
+        """Bitmap (days, 1440) de ocupação a partir de 'first'."""
+        low = first.toordinal() * MINUTES_PER_DAY
+        total = days * MINUTES_PER_DAY
+        i = int(np.searchsorted(self.ends, low, side="right"))
+        j = int(np.searchsorted(self.starts, low + total, side="left"))
+        if i >= j:
+            return np.zeros((days, MINUTES_PER_DAY), dtype=bool)
+        # Intervalos fundidos são disjuntos e não se tocam: cada posição recebe no máximo um +1 ou um -1
+        diff = np.zeros(total + 1, dtype=np.int8)
+        diff[np.clip(self.starts[i:j] - low, 0, total)] = 1
+        diff[np.clip(self.ends[i:j] - low, 0, total)] = -1
+        return np.cumsum(diff[:-1], dtype=np.int8).view(bool).reshape(days, MINUTES_PER_DAY)
+
+    def cut_mask(self, first: date, days: int) -> Optional[np.ndarray]:
+        """Bitmap (days, 1440) dos minutos em que um evento de duração zero divide a janela; None se não houver."""
+        low = first.toordinal() * MINUTES_PER_DAY
+        positions = self.cuts[(self.cuts >= low) & (self.cuts < low + days * MINUTES_PER_DAY)] - low
+        if not len(positions):
+            return None
+        mask = np.zeros(days * MINUTES_PER_DAY, dtype=bool)
+        mask[positions] = True
+        return mask.reshape(days, MINUTES_PER_DAY)
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Interval]:
+        return [(s, e) for s, e in self.intervals if s < end and e > start]
+
+
+# --- Motor ---
+class AvailabilityEngine:
+    def __init__(self, business_hours: Dict[int, Optional[Tuple[str, str]]], tz, holidays: HolidayCalendar,
+                 slot_minutes: int = 60, tail_minutes: int = 50):
+        self.tz = tz
+        self.holidays = holidays
+        self.slot_minutes = slot_minutes
+        self.tail_minutes = tail_minutes
+        # Horário comercial compilado uma vez: (início, fim) em minutos de cada dia da semana
+        self._windows: Dict[int, Optional[Tuple[int, int]]] = {}
+        for weekday in range(7):
+            rule = business_hours.get(weekday)
+            if not rule:
+                self._windows[weekday] = None
+                continue
+            start_t, end_t = (datetime.strptime(value, "%H:%M").time() for value in rule)
+            self._windows[weekday] = (start_t.hour * 60 + start_t.minute, end_t.hour * 60 + end_t.minute)
+        # Os bitmaps cobrem só as colunas [lo, hi) em que algum dia da semana tem expediente
+        bounds = [w for w in self._windows.values() if w and w[1] > w[0]]
+        self._lo = min((w[0] for w in bounds), default=0)
+        self._hi = max((w[1] for w in bounds), default=0)
+        self._week = np.zeros((7, self._hi - self._lo), dtype=bool)
+        for weekday, window in self._windows.items():
+            if window:
+                self._week[weekday, max(window[0] - self._lo, 0):max(window[1] - self._lo, 0)] = True
+
+    def _at(self, d: date, minute: int) -> datetime:
+        return datetime.combine(d, time(minute // 60, minute % 60)).replace(tzinfo=self.tz)
+
+    def window(self, d: date) -> Optional[Interval]:
+        """Janela comercial do dia (sem considerar feriados)."""
+        window = self._windows.get(d.weekday())
+        if not window:
+            return None
+        return self._at(d, window[0]), self._at(d, window[1])
+
+    def is_open(self, d: date) -> bool:
+        return self._windows.get(d.weekday()) is not None and not self.holidays.is_holiday(d)
+
+    def open_mask(self, first: date, days: int) -> np.ndarray:
+        """Bitmap (days, hi - lo) do horário comercial, com os feriados zerados."""
+        weekdays = (np.arange(days) + first.weekday()) % 7
+        mask = self._week[weekdays]
+        mask[self.holidays.mask(first, days)] = False
+        return mask
+
+    def _cut(self, free: np.ndarray, cuts: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(dia, minuto inicial, duração) de todos os slots das janelas livres do bitmap."""
+        days, width = free.shape
+        padded = np.zeros((days, width + 2), dtype=bool)
+        padded[:, 1:-1] = free
+        before, current = padded[:, :-1], padded[:, 1:]  # livre em m-1 e em m, para m = 0..width
+        if cuts is None:
+            run_day, run_start = np.nonzero(current & ~before)
+            _, run_end = np.nonzero(before & ~current)
+        else:
+            split = np.zeros((days, width + 1), dtype=bool)
+            split[:, :-1] = cuts
+            run_day, run_start = np.nonzero(current & (~before | split))
+            _, run_end = np.nonzero(before & (~current | split))
+        lengths = run_end - run_start
+        full = lengths // self.slot_minutes
+        tail = (lengths - full * self.slot_minutes) >= self.tail_minutes
+        counts = full + tail
+        total = int(counts.sum())
+        if total == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        starts = np.repeat(run_start, counts) + offsets * self.slot_minutes + self._lo
+        durations = np.where(offsets < np.repeat(full, counts), self.slot_minutes, self.tail_minutes)
+        return np.repeat(run_day, counts), starts, durations
+
+    def _slot_arrays(self, first: date, days: int, busy: Optional[IntervalIndex]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        free = self.open_mask(first, days)
+        cuts = None
+        if busy is not None and len(busy):
+            free &= ~busy.busy_mask(first, days)[:, self._lo:self._hi]
+            cuts = busy.cut_mask(first, days)
+            if cuts is not None:
+                cuts = cuts[:, self._lo:self._hi]
+        return self._cut(free, cuts)
+
+    def _inexact_days(self, first: date, days: int, busy: Optional[IntervalIndex]) -> List[date]:
+        """Dias cuja janela cruza um intervalo fora da grade de minutos (calculados pela versão exata)."""
+        if busy is None or busy.exact:
+            return []
+        inexact = []
+        for d in (first + timedelta(days=i) for i in range(days)):
+            window = self.window(d)
+            if window and any(not (_aligned(s) and _aligned(e)) for s, e in busy.overlapping(*window)):
+                inexact.append(d)
+        return inexact
+
+    def _exact_day(self, d: date, busy: IntervalIndex) -> List[Interval]:
+        """Regras originais com datetimes, para intervalos fora da grade de minutos."""
+        window = self.window(d)
+        if not window or self.holidays.is_holiday(d):
+            return []
+        start_dt, end_dt = window
+        cur, free = start_dt, []
+        for b_s, b_e in _merge(busy.overlapping(start_dt, end_dt)):
+            if b_s > cur:
+                free.append((cur, b_s))
+            cur = max(cur, b_e)
+        if cur < end_dt:
+            free.append((cur, end_dt))
+        slots = []
+        step, tail = timedelta(minutes=self.slot_minutes), timedelta(minutes=self.tail_minutes)
+        for f_s, f_e in free:
+            it = f_s
+            while it + step <= f_e:
+                slots.append((it, it + step))
+                it += step
+            if f_e - it >= tail:
+                slots.append((it, it + tail))
+        return slots
+
+    def slots_between(self, first: date, last: date, busy: Optional[IntervalIndex] = None) -> Dict[date, List[Interval]]:
+        """Slots livres de cada dia de [first, last]."""
+        days = (last - first).days + 1
+        if days <= 0:
+            return {}
+        result: Dict[date, List[Interval]] = {first + timedelta(days=i): [] for i in range(days)}
+        day_idx, starts, durations = self._slot_arrays(first, days, busy)
+        for i, start_m, duration in zip(day_idx.tolist(), starts.tolist(), durations.tolist()):
+            d = first + timedelta(days=i)
+            start_dt = self._at(d, start_m)
+            result[d].append((start_dt, start_dt + timedelta(minutes=duration)))
+        for d in self._inexact_days(first, days, busy):
+            result[d] = self._exact_day(d, busy)
+        return result
+
+    def slots_for_day(self, d: date, busy: Optional[IntervalIndex] = None) -> List[Interval]:
+        return self.slots_between(d, d, busy)[d]
+
+    def first_available(self, busy: Optional[IntervalIndex], after: datetime, count: int,
+                        horizon_days: int = 90, chunk_days: int = 7) -> List[Interval]:
+        """Os 'count' primeiros slots livres que começam em 'after' ou depois, em até horizon_days dias."""
+        after = after.astimezone(self.tz)
+        # Primeiro minuto inteiro >= after (os slots da grade começam em minutos inteiros)
+        after_m = _minute(after) + (0 if _aligned(after) else 1)
+        first, last = after.date(), after.date() + timedelta(days=horizon_days - 1)
+        found: List[Interval] = []
+        # Blocos que dobram de tamanho (uma semana, duas, ...): a busca para assim que encontra slots suficientes
+        while first <= last and len(found) < count:
+            days = min((last - first).days + 1, chunk_days)
+            if self._inexact_days(first, days, busy):
+                for slots in self.slots_between(first, first + timedelta(days=days - 1), busy).values():
+                    found.extend(s for s in slots if s[0] >= after)
+            else:
+                day_idx, starts, durations = self._slot_arrays(first, days, busy)
+                # Filtra e corta no numpy: só os slots devolvidos viram datetime
+                keep = np.nonzero((day_idx + first.toordinal()) * MINUTES_PER_DAY + starts >= after_m)[0][:count - len(found)]
+                for i, start_m, duration in zip(day_idx[keep].tolist(), starts[keep].tolist(), durations[keep].tolist()):
+                    start_dt = self._at(first + timedelta(days=i), start_m)
+                    found.append((start_dt, start_dt + timedelta(minutes=duration)))
+            first += timedelta(days=days)
+            chunk_days = min(chunk_days * 2, 64)
+        return found[:count]
+
+
+def _merge(intervals: Sequence[Interval]) -> List[Interval]:
+    merged: List[List[datetime]] = []
+    for s, e in sorted(intervals):
+        if merged and s <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], e)
+        else:
+            merged.append([s, e])
+    return [(s, e) for s, e in merged]
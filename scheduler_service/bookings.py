@@ -0,0 +1,307 @@
+"""
+Repositório de agendamentos: uma interface para o scheduler_service e para o
+main_mock.
+
+Todas as leituras e escritas da tabela agendamentos_ativos passam por aqui,
+com um único formato de linha (booking_row) e um único vocabulário de status.
+Dois backends:
+
+- SupabaseBookingRepository: PostgREST; as consultas usam só igualdades e
+  faixas cobertas pelos índices compostos de SUPABASE_INDEXES_SQL.
+- InMemoryBookingRepository: dicionários com índice hash em
+  (life planner, celular, status), índice por event id e um índice de
+  intervalos por life planner (listas ordenadas por início) para as
+  verificações de sobreposição e agendamento duplo. É o backend do main_mock
+  e pode substituir o Supabase em testes de carga (BOOKING_REPOSITORY=memory).
+"""
+import itertools
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from instrumentation import span
+
+TABLE = "agendamentos_ativos"
+STATUS_ACTIVE = "AGENDADO"
+STATUS_CANCELED = "CANCELADO"
+# Fuso dos horários gravados sem offset (o mesmo TIMEZONE do scheduler_service)
+TZ = ZoneInfo("America/Sao_Paulo")
+
+# Índices do Supabase para as consultas deste módulo (aplicar uma vez no SQL Editor ou em uma migration)
+SUPABASE_INDEXES_SQL = """
+-- find_active (reagendar/cancelar): igualdade nas três colunas
+create index if not exists agendamentos_ativos_lp_celular_status_idx
+    on agendamentos_ativos (id_lifeplanner, cliente_celular, status);
+-- overlapping: igualdade em life planner e status, faixa em start_time; end_time vem do próprio índice
+create index if not exists agendamentos_ativos_lp_status_start_idx
+    on agendamentos_ativos (id_lifeplanner, status, start_time) include (end_time);
+-- insert_many: chave de idempotência (reenvio de um lote do outbox não duplica linhas)
+create unique index if not exists agendamentos_ativos_event_idx
+    on agendamentos_ativos (event_ide_google);
+"""
+
+try:
+    from dateutil.parser import isoparse
+except Exception:
+    def isoparse(s: str) -> datetime:
+        return datetime.fromisoformat(s.replace("Z", "+00:00"))
+
+
+def _as_datetime(value: Any) -> datetime:
+    """Sempre com fuso: horário sem offset é lido em TZ, para comparar com consultas em qualquer fuso."""
+    dt = value if isinstance(value, datetime) else isoparse(value)
+    return dt.replace(tzinfo=TZ) if dt.tzinfo is None else dt
+
+
+def _as_text(value: Any) -> str:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def booking_row(agendamento_data: Dict[str, Any], event_id: str) -> Dict[str, Any]:
+    """Linha de agendamentos_ativos para um agendamento criado no Calendar."""
+    return {
+        # O 'cliente_id' do payload é o 'id_lifeplanner' na tabela
+        "id_lifeplanner": agendamento_data["cliente_id"],
+        "cliente_celular": agendamento_data["cliente_celular"],
+        "summary": agendamento_data["summary"],
+        "description": agendamento_data["description"],
+        "start_time": _as_text(agendamento_data["start_time"]),
+        "end_time": _as_text(agendamento_data["end_time"]),
+        "event_ide_google": event_id,
+        "status": STATUS_ACTIVE,
+    }
+
+
+class BookingRepository(ABC):
+    """Operações sobre agendamentos_ativos usadas pelas rotas de agendamento."""
+
+    @abstractmethod
+    def find_active(self, lifeplanner_id: str, celular: str) -> Optional[Dict[str, Any]]:
+        """Agendamento ativo do cliente com o life planner (None se não há)."""
+
+    @abstractmethod
+    def overlapping(self, lifeplanner_id: str, start: datetime, end: datetime,
+                    exclude_id: Any = None) -> List[Dict[str, Any]]:
+        """Agendamentos ativos do life planner que cruzam [start, end), em ordem de início."""
+
+    @abstractmethod
+    def insert_many(self, rows: List[Dict[str, Any]]) -> int:
+        """Insere as linhas, pulando event_ide_google já gravados. Retorna quantas entraram; erros são propagados."""
+
+    def insert(self, row: Dict[str, Any]) -> None:
+        self.insert_many([row])
+
+    @abstractmethod
+    def update(self, booking_id: Any, fields: Dict[str, Any]) -> None:
+        """Altera colunas de um agendamento (horários, status) pelo id."""
+
+    def cancel(self, booking_id: Any) -> None:
+        self.update(booking_id, {"status": STATUS_CANCELED})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+
+class SupabaseBookingRepository(BookingRepository):
+    """Backend PostgREST; cada método é uma única requisição coberta por SUPABASE_INDEXES_SQL."""
+
+    def __init__(self, client_factory: Callable[[], Any], table: str = TABLE):
+        self.client_factory = client_factory
+        self.table = table
+
+    def _table(self) -> Any:
+        return self.client_factory().table(self.table)
+
+    def find_active(self, lifeplanner_id: str, celular: str) -> Optional[Dict[str, Any]]:
+        with span("supabase", f"{self.table}.select_active"):
+            res = self._table().select("*") \
+                .eq("id_lifeplanner", lifeplanner_id) \
+                .eq("cliente_celular", celular) \
+                .eq("status", STATUS_ACTIVE) \
+                .limit(1) \
+                .execute()
+        return res.data[0] if res.data else None
+
+    def overlapping(self, lifeplanner_id: str, start: datetime, end: datetime,
+                    exclude_id: Any = None) -> List[Dict[str, Any]]:
+        with span("supabase", f"{self.table}.select_overlapping"):
+            res = self._table().select("*") \
+                .eq("id_lifeplanner", lifeplanner_id) \
+                .eq("status", STATUS_ACTIVE) \
+                .lt("start_time", _as_datetime(end).isoformat()) \
+                .gt("end_time", _as_datetime(start).isoformat()) \
+                .order("start_time") \
+                .execute()
+        return [row for row in res.data or [] if exclude_id is None or row.get("id") != exclude_id]
+
+    def insert_many(self, rows: List[Dict[str, Any]]) -> int:
+        # O índice único em event_ide_google fecha a janela entre a consulta e o insert
+        event_ids = [row["event_ide_google"] for row in rows]
+        with span("supabase", f"{self.table}.select_existing"):
+            existing = self._table().select("event_ide_google").in_("event_ide_google", event_ids).execute()
+        saved = {row["event_ide_google"] for row in existing.data or []}
+        missing = [row for row in rows if row["event_ide_google"] not in saved]
+        if missing:
+            with span("supabase", f"{self.table}.insert"):
+                self._table().insert(missing).execute()
+        return len(missing)
+
+    def insert(self, row: Dict[str, Any]) -> None:
+        # Gravação avulsa (sem outbox): um INSERT, sem a consulta de idempotência
+        with span("supabase", f"{self.table}.insert"):
+            self._table().insert(row).execute()
+
+    def update(self, booking_id: Any, fields: Dict[str, Any]) -> None:
+        with span("supabase", f"{self.table}.update"):
+            self._table().update({k: _as_text(v) for k, v in fields.items()}).eq("id", booking_id).execute()
+
+
+class _PlannerIntervals:
+    """Agendamentos ativos de um life planner ordenados por início (bisect) e a maior duração já vista."""
+    __slots__ = ("starts", "ids", "ends", "max_length")
+
+    def __init__(self):
+        self.starts: List[datetime] = []
+        self.ids: List[Any] = []
+        self.ends: Dict[Any, datetime] = {}
+        self.max_length = timedelta(0)
+
+    def add(self, booking_id: Any, start: datetime, end: datetime) -> None:
+        pos = bisect_right(self.starts, start)
+        self.starts.insert(pos, start)
+        self.ids.insert(pos, booking_id)
+        self.ends[booking_id] = end
+        self.max_length = max(self.max_length, end - start)
+
+    def remove(self, booking_id: Any, start: datetime) -> None:
+        pos = bisect_left(self.starts, start)
+        while self.ids[pos] != booking_id:
+            pos += 1
+        del self.starts[pos]
+        del self.ids[pos]
+        del self.ends[booking_id]
+
+    def overlapping(self, start: datetime, end: datetime) -> Iterable[Any]:
+        # Só quem começa depois de (start - maior duração) pode terminar depois de start
+        pos = bisect_left(self.starts, start - self.max_length)
+        stop = bisect_left(self.starts, end)
+        return [self.ids[i] for i in range(pos, stop) if self.ends[self.ids[i]] > start]
+
+
+class InMemoryBookingRepository(BookingRepository):
+    """
+    Backend em memória (thread-safe) com as mesmas regras do Supabase: ids
+    gerados na inserção, event_ide_google único e linhas devolvidas como
+    cópias. Buscas por (life planner, celular, status) e por event id são O(1);
+    sobreposição é O(log n + k) no índice de intervalos do life planner.
+    """
+
+    def __init__(self, rows: Iterable[Dict[str, Any]] = ()):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._rows: Dict[Any, Dict[str, Any]] = {}
+        # (id_lifeplanner, cliente_celular, status) -> ids na ordem de inserção
+        self._by_key: Dict[Tuple[str, str, str], Dict[Any, None]] = {}
+        self._by_event: Dict[str, Any] = {}
+        self._intervals: Dict[str, _PlannerIntervals] = {}
+        self.lookups = 0
+        self.overlap_queries = 0
+        self.duplicates_skipped = 0
+        if rows:
+            self.insert_many(list(rows))
+
+    # --- Índices ---
+    @staticmethod
+    def _key(row: Dict[str, Any]) -> Tuple[str, str, str]:
+        return row.get("id_lifeplanner"), row.get("cliente_celular"), row.get("status")
+
+    def _index(self, booking_id: Any, row: Dict[str, Any]) -> None:
+        self._by_key.setdefault(self._key(row), {})[booking_id] = None
+        if row.get("event_ide_google"):
+            self._by_event[row["event_ide_google"]] = booking_id
+        if row.get("status") == STATUS_ACTIVE:
+            start, end = _as_datetime(row["start_time"]), _as_datetime(row["end_time"])
+            self._intervals.setdefault(row["id_lifeplanner"], _PlannerIntervals()).add(booking_id, start, end)
+
+    def _unindex(self, booking_id: Any, row: Dict[str, Any]) -> None:
+        key = self._key(row)
+        ids = self._by_key[key]
+        del ids[booking_id]
+        if not ids:
+            del self._by_key[key]
+        if row.get("event_ide_google"):
+            self._by_event.pop(row["event_ide_google"], None)
+        if row.get("status") == STATUS_ACTIVE:
+            self._intervals[row["id_lifeplanner"]].remove(booking_id, _as_datetime(row["start_time"]))
+
+    # --- BookingRepository ---
+    def find_active(self, lifeplanner_id: str, celular: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self.lookups += 1
+            ids = self._by_key.get((lifeplanner_id, celular, STATUS_ACTIVE))
+            return dict(self._rows[next(iter(ids))]) if ids else None
+
+    def find_by_event(self, event_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            booking_id = self._by_event.get(event_id)
+            return dict(self._rows[booking_id]) if booking_id is not None else None
+
+    def overlapping(self, lifeplanner_id: str, start: datetime, end: datetime,
+                    exclude_id: Any = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            self.overlap_queries += 1
+            index = self._intervals.get(lifeplanner_id)
+            if index is None:
+                return []
+            ids = index.overlapping(_as_datetime(start), _as_datetime(end))
+            return [dict(self._rows[i]) for i in ids if i != exclude_id]
+
+    def insert_many(self, rows: List[Dict[str, Any]]) -> int:
+        inserted = 0
+        with self._lock:
+            for row in rows:
+                if row.get("event_ide_google") in self._by_event:
+                    self.duplicates_skipped += 1
+                    continue
+                row = {k: _as_text(v) for k, v in row.items()}
+                booking_id = row.setdefault("id", next(self._ids))
+                self._rows[booking_id] = row
+                self._index(booking_id, row)
+                inserted += 1
+        return inserted
+
+    def update(self, booking_id: Any, fields: Dict[str, Any]) -> None:
+        with self._lock:
+            row = self._rows.get(booking_id)
+            if row is None:
+                return  # Como o UPDATE ... WHERE id = ?: nenhuma linha afetada
+            self._unindex(booking_id, row)
+            row.update({k: _as_text(v) for k, v in fields.items()})
+            self._index(booking_id, row)
+
+    def rows(self, lifeplanner_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(row) for row in self._rows.values()
+                    if lifeplanner_id is None or row.get("id_lifeplanner") == lifeplanner_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows.clear()
+            self._by_key.clear()
+            self._by_event.clear()
+            self._intervals.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": type(self).__name__,
+                "rows": len(self._rows),
+                "active": sum(len(index.ids) for index in self._intervals.values()),
+                "life_planners": len(self._intervals),
+                "lookups": self.lookups,
+                "overlap_queries": self.overlap_queries,
+                "duplicates_skipped": self.duplicates_skipped,
+            }
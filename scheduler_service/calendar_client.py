@@ -0,0 +1,264 @@
+"""
+Cliente do Google Calendar compartilhado pelo processo.
+
+Antes, cada get_calendar_service() relia o JSON da service account, criava
+Credentials novas, interpretava o documento de discovery do Calendar e abria
+uma conexão TLS nova com www.googleapis.com (mais um POST ao token_uri para
+obter o access token). Aqui isso acontece uma vez por processo:
+
+- o documento de discovery é lido e interpretado uma única vez;
+- as credenciais são carregadas uma vez e o token é renovado sob lock quando expira
+  (uma única renovação mesmo com várias threads esperando);
+- o httplib2.Http não é thread-safe, então cada thread do threadpool do FastAPI usa
+  a sua conexão persistente (keep-alive), reaproveitada entre requisições e
+  compartilhada por todos os clientes do pool;
+- os Resources das coleções (events(), freebusy(), ...) são montados uma vez e
+  compartilhados: só o HttpRequest de cada chamada é criado por requisição;
+- com api_endpoint (emulador/fake), também os lotes (new_batch_http_request) vão para ele;
+- com delegação de domínio ativa, os clientes de cada organizador (subject) ficam em
+  um LRU limitado;
+- googleapiclient, google-auth e httplib2 só são importados no primeiro uso (ou no
+  warm() do pré-aquecimento): importar o módulo não atrasa a subida do serviço.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from instrumentation import span
+
+if TYPE_CHECKING:
+    import httplib2
+    from google.oauth2.service_account import Credentials
+
+CALENDAR_SCOPES = ["https://www.googleapis.com/auth/calendar"]
+
+
+def service_account_credentials() -> "Credentials":
+    """Credenciais da service account definida em GOOGLE_SERVICE_ACCOUNT_FILE."""
+    service_account_file = os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE")
+    if service_account_file:
+        service_account_file = service_account_file.replace("\\", "/")
+    if not service_account_file or not os.path.exists(service_account_file):
+        raise FileNotFoundError(
+            "Arquivo de Service Account não encontrado. Defina GOOGLE_SERVICE_ACCOUNT_FILE no .env."
+        )
+    from google.oauth2.service_account import Credentials
+
+    print(f"Credenciais do Google Calendar carregadas de '{service_account_file}'")
+    return Credentials.from_service_account_file(service_account_file, scopes=CALENDAR_SCOPES)
+
+
+class ThreadConnections:
+    """Um httplib2.Http (conexões keep-alive por host) por thread."""
+
+    def __init__(self, timeout: float = 30):
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all: List["httplib2.Http"] = []
+
+    def get(self) -> "httplib2.Http":
+        http = getattr(self._local, "http", None)
+        if http is None:
+            import httplib2
+
+            http = self._local.http = httplib2.Http(timeout=self.timeout)
+            with self._lock:
+                self._all.append(http)
+        return http
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    def close(self) -> None:
+        with self._lock:
+            connections, self._all = self._all, []
+        for http in connections:
+            http.close()
+        self._local = threading.local()
+
+
+class ThreadLocalHttp:
+    """
+    Substituto do httplib2.Http usado pelo googleapiclient: as mesmas
+    credenciais para todas as threads, sobre a conexão da thread atual.
+    """
+
+    def __init__(self, credentials: Any, connections: ThreadConnections):
+        self.credentials = credentials
+        self.connections = connections
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def ensure_token(self) -> None:
+        """Renova o access token expirado uma única vez, mesmo com várias threads chegando juntas."""
+        if self.credentials.valid:
+            return
+        with self._lock:
+            if not self.credentials.valid:
+                from google_auth_httplib2 import Request
+
+                self.credentials.refresh(Request(self.connections.get()))
+                self.refreshes += 1
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.ensure_token()
+        raw = self.connections.get()
+        http = getattr(self._local, "http", None)
+        if http is None or http.http is not raw:
+            from google_auth_httplib2 import AuthorizedHttp
+
+            http = self._local.http = AuthorizedHttp(self.credentials, http=raw)
+        return http.request(uri, method, body=body, headers=headers, **kwargs)
+
+
+class CalendarClient:
+    """Resource do Calendar v3 compartilhado entre threads, com as coleções montadas uma vez."""
+
+    def __init__(self, resource: Any, http: ThreadLocalHttp, collection_names: List[str]):
+        self._resource = resource
+        self.http = http
+        self._collection_names = frozenset(collection_names)
+        self._collections: Dict[str, Any] = {}
+
+    def new_batch_http_request(self, callback: Optional[Callable[..., None]] = None) -> Any:
+        """BatchHttpRequest do Calendar, com o token já renovado sob o lock (o lote renovaria por conta própria)."""
+        self.http.ensure_token()
+        return self._resource.new_batch_http_request(callback=callback)
+
+    def __getattr__(self, name: str) -> Any:
+        if name not in self._collection_names:
+            return getattr(self._resource, name)
+
+        def collection() -> Any:
+            resource = self._collections.get(name)
+            if resource is None:
+                resource = self._collections.setdefault(name, getattr(self._resource, name)())
+            return resource
+
+        return collection
+
+
+class CalendarClientPool:
+    """
+    Clientes do Calendar do processo: um cliente padrão (a própria service
+    account) e, com delegação de domínio, um cliente por organizador em LRU.
+    """
+
+    def __init__(self, credentials_factory: Callable[[], Any] = service_account_credentials,
+                 api_endpoint: Optional[str] = None, timeout: float = 30, delegation: bool = False,
+                 max_delegated: int = 32):
+        self.credentials_factory = credentials_factory
+        self.api_endpoint = api_endpoint
+        self.timeout = timeout
+        self.delegation = delegation
+        self.max_delegated = max_delegated
+
+        self._lock = threading.Lock()
+        self._connections = ThreadConnections(timeout)
+        self._document: Optional[Dict[str, Any]] = None
+        self._credentials: Any = None
+        self._default: Optional[CalendarClient] = None
+        self._delegated: "OrderedDict[str, CalendarClient]" = OrderedDict()
+        self.builds = 0
+        self.delegated_hits = 0
+        self.delegated_misses = 0
+        self.evictions = 0
+
+    def _discovery_document(self) -> Dict[str, Any]:
+        if self._document is None:
+            from googleapiclient import discovery_cache
+
+            # Documento empacotado no google-api-python-client: sem requisição ao serviço de discovery
+            document = json.loads(discovery_cache.get_static_doc("calendar", "v3"))
+            # O api_endpoint só troca a base das chamadas; os lotes usam rootUrl + batchPath
+            if self.api_endpoint and self.api_endpoint.endswith(document["servicePath"]):
+                document["rootUrl"] = self.api_endpoint[: -len(document["servicePath"])]
+            self._document = document
+        return self._document
+
+    def _base_credentials(self) -> Any:
+        if self._credentials is None:
+            self._credentials = self.credentials_factory()
+        return self._credentials
+
+    def _build(self, credentials: Any) -> CalendarClient:
+        from googleapiclient.discovery import build_from_document
+
+        with span("calendar", "build"):
+            document = self._discovery_document()
+            http = ThreadLocalHttp(credentials, self._connections)
+            options = {"api_endpoint": self.api_endpoint} if self.api_endpoint else None
+            resource = build_from_document(document, http=http, client_options=options)
+        self.builds += 1
+        return CalendarClient(resource, http, list(document.get("resources", {})))
+
+    def warm(self) -> bool:
+        """Pré-aquecimento: importa o googleapiclient, interpreta o discovery e, havendo credenciais, monta o cliente padrão."""
+        with self._lock:
+            self._discovery_document()
+        try:
+            self.client()
+        except FileNotFoundError as e:
+            print(f"ALERTA: cliente do Google Calendar não pré-aquecido: {e}")
+            return False
+        return True
+
+    def client(self, organizer_email: Optional[str] = None) -> CalendarClient:
+        """Cliente para o organizador (com delegação ativa) ou o cliente padrão da service account."""
+        if organizer_email and self.delegation:
+            return self._delegated_client(organizer_email)
+        client = self._default
+        if client is None:
+            with self._lock:
+                if self._default is None:
+                    self._default = self._build(self._base_credentials())
+                client = self._default
+        return client
+
+    def _delegated_client(self, subject: str) -> CalendarClient:
+        with self._lock:
+            client = self._delegated.get(subject)
+            if client is not None:
+                self._delegated.move_to_end(subject)
+                self.delegated_hits += 1
+                return client
+            self.delegated_misses += 1
+            base = self._base_credentials()
+        client = self._build(base.with_subject(subject))
+
+        with self._lock:
+            # Outra thread pode ter montado o mesmo cliente enquanto este era construído
+            current = self._delegated.setdefault(subject, client)
+            self._delegated.move_to_end(subject)
+            while len(self._delegated) > self.max_delegated:
+                self._delegated.popitem(last=False)
+                self.evictions += 1
+        return current
+
+    def reset(self) -> None:
+        """Descarta clientes e credenciais (ex.: chave da service account trocada)."""
+        with self._lock:
+            self._delegated.clear()
+            self._default = None
+            self._credentials = None
+        self._connections.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            clients = list(self._delegated.values()) + ([self._default] if self._default else [])
+            delegated = len(self._delegated)
+        return {
+            "builds": self.builds,
+            "delegation": self.delegation,
+            "delegated_clients": delegated,
+            "max_delegated": self.max_delegated,
+            "delegated_hits": self.delegated_hits,
+            "delegated_misses": self.delegated_misses,
+            "evictions": self.evictions,
+            "connections": len(self._connections),
+            "token_refreshes": sum(c.http.refreshes for c in clients),
+        }
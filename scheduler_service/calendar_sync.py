@@ -0,0 +1,320 @@
+"""
+Cache local dos eventos de cada agenda, mantido com a sincronização
+incremental do Google Calendar (events.list com syncToken).
+
+A primeira consulta a uma agenda faz a sincronização completa e guarda o
+nextSyncToken; as seguintes pedem só o que mudou desde o último token (em
+geral uma resposta vazia). A consulta de um dia é respondida da memória
+enquanto a agenda estiver dentro do limite de defasagem (max_staleness); um
+refresher em segundo plano mantém quentes as agendas usadas recentemente.
+Token expirado (410 Gone) leva a uma nova sincronização completa, e as
+escritas do próprio serviço (agendar/reagendar/cancelar) são aplicadas na
+hora, sem esperar a próxima sincronização. A agenda "primary" é resolvida
+para o seu ID real na sincronização completa, para que as escritas feitas
+com o ID (email) da agenda também cheguem a ela. Os eventos de cada agenda também
+ficam em um IntervalIndex (availability.py), refeito só quando algo muda.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from availability import IntervalIndex
+from instrumentation import span
+
+try:
+    from dateutil.parser import isoparse
+except Exception:
+    def isoparse(s: str) -> datetime:
+        return datetime.fromisoformat(s.replace("Z", "+00:00"))
+
+Interval = Tuple[datetime, datetime]
+
+PRIMARY = "primary"
+
+
+def event_interval(event: Dict[str, Any], tz: Any) -> Optional[Interval]:
+    """(início, fim) do evento no fuso 'tz'; None para eventos sem horário."""
+    s = event.get("start", {}).get("dateTime") or event.get("start", {}).get("date")
+    e = event.get("end", {}).get("dateTime") or event.get("end", {}).get("date")
+    if not s or not e:
+        return None
+    return isoparse(s).astimezone(tz), isoparse(e).astimezone(tz)
+
+
+def _http_status(error: Exception) -> Optional[int]:
+    status = getattr(getattr(error, "resp", None), "status", None)
+    return int(status) if status is not None else None
+
+
+class _CalendarState:
+    __slots__ = ("calendar_id", "resolved_id", "events", "sync_token", "synced_at", "accessed_at", "lock",
+                 "local_writes", "index")
+
+    def __init__(self, calendar_id: str):
+        self.calendar_id = calendar_id
+        # ID real de um apelido ("primary"); as escritas chegam com ele
+        self.resolved_id: Optional[str] = None if calendar_id == PRIMARY else calendar_id
+        self.events: Dict[str, Interval] = {}
+        self.sync_token: Optional[str] = None
+        self.synced_at = 0.0
+        self.accessed_at = time.monotonic()
+        # Uma sincronização por vez por agenda; quem chega durante ela espera o resultado
+        self.lock = threading.Lock()
+        # Escritas locais (id -> instante): resposta de sync iniciada antes delas não as desfaz
+        self.local_writes: Dict[str, float] = {}
+        # Índice de intervalos dos eventos; None = refazer na próxima consulta
+        self.index: Optional[IntervalIndex] = None
+
+
+class CalendarSyncCache:
+    def __init__(self, service_factory: Callable[[], Any], tz: Any, max_staleness: float = 30,
+                 refresh_interval: float = 15, idle_seconds: float = 3600, max_calendars: int = 256,
+                 retain_past: timedelta = timedelta(days=1)):
+        self.service_factory = service_factory
+        self.tz = tz
+        self.max_staleness = max_staleness
+        self.refresh_interval = refresh_interval
+        self.idle_seconds = idle_seconds
+        self.max_calendars = max_calendars
+        self.retain_past = retain_past
+
+        self._lock = threading.Lock()
+        self._states: Dict[str, _CalendarState] = {}
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self.memory_hits = 0
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.resyncs_gone = 0
+        self.errors = 0
+        self.write_throughs = 0
+
+    # --- Consulta ---
+    def events_between(self, calendar_id: str, start: datetime, end: datetime) -> List[Interval]:
+        """Intervalos ocupados que cruzam [start, end), sincronizando antes se a agenda estiver defasada."""
+        state = self._ready(calendar_id)
+        with self._lock:
+            intervals = [iv for iv in state.events.values() if iv[0] < end and iv[1] > start]
+        return sorted(intervals)
+
+    def busy_index(self, calendar_id: str) -> IntervalIndex:
+        """IntervalIndex com todos os eventos da agenda (mesma regra de defasagem de events_between)."""
+        state = self._ready(calendar_id)
+        with self._lock:
+            index = state.index
+            if index is None:
+                index = state.index = IntervalIndex(state.events.values(), self.tz)
+        return index
+
+    def _ready(self, calendar_id: str) -> _CalendarState:
+        state = self._state(calendar_id)
+        state.accessed_at = time.monotonic()
+        if not self._fresh(state):
+            with state.lock:
+                if not self._fresh(state):
+                    self._sync(state)
+                else:
+                    self._count("memory_hits")
+        else:
+            self._count("memory_hits")
+        return state
+
+    def _fresh(self, state: _CalendarState) -> bool:
+        return state.sync_token is not None and time.monotonic() - state.synced_at <= self.max_staleness
+
+    def _state(self, calendar_id: str) -> _CalendarState:
+        with self._lock:
+            state = self._states.get(calendar_id)
+            if state is None:
+                if len(self._states) >= self.max_calendars:
+                    # Descarta a agenda usada há mais tempo
+                    oldest = min(self._states.values(), key=lambda s: s.accessed_at)
+                    del self._states[oldest.calendar_id]
+                state = self._states[calendar_id] = _CalendarState(calendar_id)
+        self._ensure_refresher()
+        return state
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    # --- Sincronização (chamada com state.lock) ---
+    def _sync(self, state: _CalendarState) -> None:
+        started = time.monotonic()
+        try:
+            if state.sync_token is None:
+                self._full_sync(state, started)
+            else:
+                try:
+                    self._incremental_sync(state, started)
+                except Exception as e:
+                    if _http_status(e) != 410:
+                        raise
+                    # Token expirado/invalidado pelo Google: recomeça do zero
+                    print(f"ALERTA: syncToken expirado para a agenda '{state.calendar_id}'; sincronização completa.")
+                    self._count("resyncs_gone")
+                    state.sync_token = None
+                    self._full_sync(state, started)
+        except Exception:
+            self._count("errors")
+            raise
+
+    def _list_pages(self, state: _CalendarState, **params: Any) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        service = self.service_factory()
+        items: List[Dict[str, Any]] = []
+        page_token = None
+        while True:
+            request = service.events().list(calendarId=state.calendar_id, singleEvents=True, maxResults=2500,
+                                            pageToken=page_token, **params)
+            response = request.execute()
+            items.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return items, response.get("nextSyncToken")
+
+    def _resolve(self, state: _CalendarState) -> None:
+        """ID real da agenda "primary" (calendars.get); sem ele, as escritas com o email não a alcançam."""
+        try:
+            with span("calendar", "calendars.get"):
+                state.resolved_id = self.service_factory().calendars().get(calendarId=state.calendar_id).execute()["id"]
+        except Exception as e:
+            print(f"ALERTA: não foi possível resolver o ID da agenda '{state.calendar_id}' ({e}); nova tentativa na próxima sincronização completa.")
+
+    def _full_sync(self, state: _CalendarState, started: float) -> None:
+        if state.resolved_id is None:
+            self._resolve(state)
+        with span("calendar", "sync.full"):
+            items, token = self._list_pages(state)
+        events = {}
+        for event in items:
+            interval = event_interval(event, self.tz) if event.get("status") != "cancelled" else None
+            if interval:
+                events[event["id"]] = interval
+        with self._lock:
+            # Escritas locais feitas durante a sincronização prevalecem
+            for event_id, written_at in state.local_writes.items():
+                if written_at > started:
+                    if event_id in state.events:
+                        events[event_id] = state.events[event_id]
+                    else:
+                        events.pop(event_id, None)
+            state.events = events
+            state.index = None
+            self._prune(state)
+        self._finish(state, token, "full_syncs")
+
+    def _incremental_sync(self, state: _CalendarState, started: float) -> None:
+        with span("calendar", "sync.incremental"):
+            items, token = self._list_pages(state, syncToken=state.sync_token)
+        with self._lock:
+            for event in items:
+                event_id = event["id"]
+                if state.local_writes.get(event_id, 0.0) > started:
+                    continue
+                interval = event_interval(event, self.tz) if event.get("status") != "cancelled" else None
+                if interval:
+                    state.events[event_id] = interval
+                else:
+                    state.events.pop(event_id, None)
+                state.index = None
+            self._prune(state)
+        self._finish(state, token, "incremental_syncs")
+
+    def _finish(self, state: _CalendarState, token: Optional[str], counter: str) -> None:
+        state.sync_token = token
+        state.synced_at = time.monotonic()
+        with self._lock:
+            state.local_writes = {k: v for k, v in state.local_writes.items() if v > state.synced_at - 60}
+        self._count(counter)
+
+    def _prune(self, state: _CalendarState) -> None:
+        """Descarta eventos já terminados (com self._lock)."""
+        cutoff = datetime.now(self.tz) - self.retain_past
+        for event_id in [k for k, (_, e) in state.events.items() if e < cutoff]:
+            del state.events[event_id]
+            state.index = None
+
+    # --- Escrita direta (write-through) ---
+    def apply_event(self, calendar_id: str, event: Dict[str, Any]) -> None:
+        """Aplica um evento criado/alterado pelo próprio serviço (resposta do insert/update)."""
+        interval = event_interval(event, self.tz) if event.get("status") != "cancelled" else None
+        self._write(calendar_id, event["id"], interval)
+
+    def remove_event(self, calendar_id: str, event_id: str) -> None:
+        self._write(calendar_id, event_id, None)
+
+    def _write(self, calendar_id: str, event_id: str, interval: Optional[Interval]) -> None:
+        with self._lock:
+            # A agenda pelo ID e também por um apelido que aponte para ela ("primary")
+            states = [s for s in self._states.values() if calendar_id in (s.calendar_id, s.resolved_id)]
+            # Agenda fora do cache: a primeira consulta fará a sincronização completa
+            for state in states:
+                if interval:
+                    state.events[event_id] = interval
+                else:
+                    state.events.pop(event_id, None)
+                state.index = None
+                state.local_writes[event_id] = time.monotonic()
+                self.write_throughs += 1
+
+    def invalidate(self, calendar_id: Optional[str] = None) -> None:
+        with self._lock:
+            if calendar_id is None:
+                self._states.clear()
+            else:
+                self._states.pop(calendar_id, None)
+
+    # --- Refresher em segundo plano ---
+    def _ensure_refresher(self) -> None:
+        if self.refresh_interval <= 0 or self._refresher is not None:
+            return
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name="calendar-sync", daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while not self._stop.wait(self.refresh_interval):
+            now = time.monotonic()
+            with self._lock:
+                states = list(self._states.values())
+                for state in states:
+                    if now - state.accessed_at > self.idle_seconds:
+                        self._states.pop(state.calendar_id, None)
+            for state in states:
+                # Sincronizada há menos de meio intervalo (por uma requisição): fica para a próxima volta
+                if now - state.accessed_at > self.idle_seconds or now - state.synced_at < self.refresh_interval / 2:
+                    continue
+                # Sem esperar: se uma requisição já está sincronizando esta agenda, pula
+                if not state.lock.acquire(blocking=False):
+                    continue
+                try:
+                    self._sync(state)
+                except Exception as e:
+                    print(f"ERRO: sincronização da agenda '{state.calendar_id}' falhou: {e}")
+                finally:
+                    state.lock.release()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=5)
+            self._refresher = None
+        self._stop = threading.Event()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calendars": len(self._states),
+                "events": sum(len(s.events) for s in self._states.values()),
+                "max_staleness_seconds": self.max_staleness,
+                "refresh_interval_seconds": self.refresh_interval,
+                "memory_hits": self.memory_hits,
+                "full_syncs": self.full_syncs,
+                "incremental_syncs": self.incremental_syncs,
+                "resyncs_gone": self.resyncs_gone,
+                "errors": self.errors,
+                "write_throughs": self.write_throughs,
+            }
@@ -0,0 +1,15 @@
+# Spans de latência das chamadas ao Google Calendar e ao Supabase (métricas em /metrics do rag.app)
+try:
+    from rag_service.metrics import REGISTRY, span
+
+    def register_gauge(name: str, documentation: str, func, labelname=None) -> None:
+        REGISTRY.gauge_func(name, documentation, func, labelname)
+except ImportError:
+    # Serviço de agendamento rodando isolado, sem o pacote rag_service no path: spans e gauges desativados
+    from contextlib import nullcontext
+
+    def span(component: str, stage: str):
+        return nullcontext()
+
+    def register_gauge(name: str, documentation: str, func, labelname=None) -> None:
+        pass
@@ -1,22 +1,25 @@
 from dotenv import load_dotenv
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, time, timedelta
-from typing import List, Tuple, Optional
-from fastapi import FastAPI, APIRouter, HTTPException, Body
+from typing import Dict, List, Tuple, Optional
+from fastapi import FastAPI, APIRouter, HTTPException, Body, Header
 from pydantic import BaseModel
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
 from zoneinfo import ZoneInfo
 
 # 🟢 Importa as funções de Supabase e a função de cliente Supabase
 # DEPOIS:
-from supabase_supabase import get_lifeplanner_email, save_agendamento, get_supabase_client
+from supabase_supabase import get_lifeplanner, get_lifeplanner_email, get_lifeplanners, get_supabase_client, invalidate_lifeplanner, lifeplanner_cache
+from instrumentation import register_gauge, span
+from calendar_client import CalendarClientPool
+from calendar_sync import CalendarSyncCache, event_interval
+from availability import AvailabilityEngine, HolidayCalendar, IntervalIndex
+from outbox import SupabaseOutbox
+from bookings import STATUS_ACTIVE, TABLE as BOOKINGS_TABLE, BookingRepository, InMemoryBookingRepository, SupabaseBookingRepository, booking_row
 
 # --- Carrega variáveis do .env ---
 load_dotenv()
-print("=== DEBUG VARIÁVEIS ===")
-print("CWD:", os.getcwd())
-print("GOOGLE_SERVICE_ACCOUNT_FILE:", os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE"))
 
 # --- Inicializa FastAPI e Router ---
 app = FastAPI()
@@ -37,6 +40,9 @@ class AgendamentoPayload(BaseModel):
     cliente_id: str # NOVO: ID DO LIFE PLANNER (VENDEDOR) - CRÍTICO PARA ESCALABILIDADE
     cliente_celular: Optional[str] = None # NOVO: Celular do Consumidor Final - CRÍTICO PARA SALVAMENTO
 
+class AgendamentoBulkPayload(BaseModel):
+    agendamentos: List[AgendamentoPayload]
+
 
 # --- Configuração de timezone e regras de negócio ---
 TIMEZONE = "America/Sao_Paulo"
@@ -52,30 +58,117 @@ BUSINESS_HOURS = {
     6: None,# Domingo
 }
 
-
-# --- Função para criar o serviço do Google Calendar ---
-def get_calendar_service():
-    service_account_file = os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE")
-
-    if service_account_file:
-        service_account_file = service_account_file.replace("\\", "/")
-
-    # Prints de debug
-    print("🔎 Verificando arquivo:", service_account_file)
-    print("✅ Existe?:", os.path.exists(service_account_file))
-
-    if not service_account_file or not os.path.exists(service_account_file):
-        raise HTTPException(
-            status_code=500,
-            detail="Arquivo de Service Account não encontrado. Defina GOOGLE_SERVICE_ACCOUNT_FILE no .env."
-        )
-
-    creds = Credentials.from_service_account_file(
-        service_account_file,
-        scopes=["https://www.googleapis.com/auth/calendar"]
-    )
-    service = build("calendar", "v3", credentials=creds)
-    return service
+# Limites do /slots/range/ (o freebusy do Google aceita até 50 agendas por consulta)
+SLOTS_RANGE_MAX_DAYS = int(os.getenv("SLOTS_RANGE_MAX_DAYS", "31"))
+SLOTS_RANGE_MAX_PLANNERS = int(os.getenv("SLOTS_RANGE_MAX_PLANNERS", "100"))
+FREEBUSY_MAX_CALENDARS = 50
+# /bulk/: itens por requisição e chamadas por lote do Calendar (o Google aceita até 50 por lote)
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "200"))
+CALENDAR_BATCH_MAX = 50
+# Limites do /slots/next/
+SLOTS_NEXT_MAX_DAYS = int(os.getenv("SLOTS_NEXT_MAX_DAYS", "92"))
+SLOTS_NEXT_MAX_COUNT = int(os.getenv("SLOTS_NEXT_MAX_COUNT", "50"))
+
+# --- Feriados e motor de disponibilidade (bitmaps por minuto, ver availability.py) ---
+# Feriados nacionais fixos e móveis. Carnaval e Corpus Christi (pontos facultativos) são dias úteis;
+# HOLIDAYS_INCLUDE_OPTIONAL=1 fecha a agenda também nesses dias.
+# EXTRA_HOLIDAYS: datas adicionais (feriados locais) separadas por vírgula, no formato YYYY-MM-DD.
+holidays = HolidayCalendar(
+    include_optional=os.getenv("HOLIDAYS_INCLUDE_OPTIONAL", "0") == "1",
+    extra=[date.fromisoformat(v.strip()) for v in os.getenv("EXTRA_HOLIDAYS", "").split(",") if v.strip()],
+)
+availability = AvailabilityEngine(BUSINESS_HOURS, TZ, holidays)
+
+
+# --- Cliente do Google Calendar (um por processo, ver calendar_client.py) ---
+calendar_pool = CalendarClientPool(
+    api_endpoint=os.getenv("GOOGLE_CALENDAR_API_ENDPOINT") or None,  # emulador/fake local; vazio = Google
+    timeout=float(os.getenv("GOOGLE_CALENDAR_TIMEOUT_SECONDS", "30")),
+    # Com delegação de domínio, os eventos são criados como o próprio organizador (subject)
+    delegation=os.getenv("GOOGLE_CALENDAR_DELEGATION", "0") == "1",
+    max_delegated=int(os.getenv("GOOGLE_CALENDAR_DELEGATED_CLIENTS", "32")),
+)
+
+def get_calendar_service(organizer_email: Optional[str] = None):
+    try:
+        return calendar_pool.client(organizer_email)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- Cache de eventos por agenda (sincronização incremental, ver calendar_sync.py) ---
+CALENDAR_SYNC_ENABLED = os.getenv("CALENDAR_SYNC_ENABLED", "1") == "1"
+calendar_sync = CalendarSyncCache(
+    lambda: get_calendar_service(),
+    TZ,
+    max_staleness=float(os.getenv("CALENDAR_SYNC_MAX_STALENESS_SECONDS", "30")),  # defasagem máxima aceita numa consulta
+    refresh_interval=float(os.getenv("CALENDAR_SYNC_REFRESH_SECONDS", "15")),  # 0 desativa o refresher
+    idle_seconds=float(os.getenv("CALENDAR_SYNC_IDLE_SECONDS", "3600")),  # agenda sem consultas sai do cache
+    max_calendars=int(os.getenv("CALENDAR_SYNC_MAX_CALENDARS", "256")),
+)
+
+# --- Repositório de agendamentos (ver bookings.py) ---
+# 'supabase' (padrão) ou 'memory': tabela em memória, para testes de carga sem o Supabase
+BOOKING_REPOSITORY = os.getenv("BOOKING_REPOSITORY", "supabase")
+bookings: BookingRepository = (
+    InMemoryBookingRepository() if BOOKING_REPOSITORY == "memory"
+    else SupabaseBookingRepository(lambda: get_supabase_client())
+)
+
+# --- Outbox local das gravações no Supabase (ver outbox.py) ---
+# Arquivo SQLite com as gravações pendentes; vazio desativa (gravação síncrona, como antes)
+SUPABASE_OUTBOX_PATH = os.getenv(
+    "SUPABASE_OUTBOX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "supabase_outbox.sqlite"),
+)
+outbox = SupabaseOutbox(
+    SUPABASE_OUTBOX_PATH,
+    {BOOKINGS_TABLE: lambda rows: bookings.insert_many(rows)},
+    batch_size=int(os.getenv("SUPABASE_OUTBOX_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("SUPABASE_OUTBOX_FLUSH_SECONDS", "1")),
+    max_attempts=int(os.getenv("SUPABASE_OUTBOX_MAX_ATTEMPTS", "10")),  # depois disso a entrada fica 'dead' até um replay
+) if SUPABASE_OUTBOX_PATH else None
+
+# Token das rotas administrativas do outbox (header X-Admin-Token); o mesmo RAG_ADMIN_TOKEN do rag.py se
+# SCHEDULER_ADMIN_TOKEN não for definido. Sem nenhum dos dois, /outbox/ e /outbox/replay/ ficam fechadas
+SCHEDULER_ADMIN_TOKEN = os.getenv("SCHEDULER_ADMIN_TOKEN") or os.getenv("RAG_ADMIN_TOKEN")
+
+if outbox is not None:
+    register_gauge("scheduler_outbox_entries", "Entradas do outbox do Supabase por status.",
+                   lambda: outbox.counts(), "status")
+
+def persist_agendamento(agendamento_data: dict, event_id: str, event_link: str) -> str:
+    """Registra a gravação no outbox ('queued'); sem outbox, ou se ele falhar, grava direto no Supabase ('saved')."""
+    row = booking_row(agendamento_data, event_id)
+    if outbox is not None:
+        try:
+            outbox.enqueue(BOOKINGS_TABLE, event_id, row)
+            return "queued"
+        except Exception as e:
+            print(f"ERRO: outbox local indisponível ({e}); gravando no Supabase diretamente.")
+    try:
+        bookings.insert(row)
+    except Exception as e:
+        print(f"ERRO CRÍTICO: Falha ao salvar no Supabase '{BOOKINGS_TABLE}'.")
+        print("Payload Enviado:", json.dumps(row, indent=2))
+        print(f"Erro da API Supabase: {e}")
+    return "saved"
+
+def persist_agendamentos(items: List[Tuple[dict, str]]) -> str:
+    """Vários agendamentos de uma vez: uma transação no outbox ou, sem ele, um único INSERT no Supabase."""
+    rows = [(event_id, booking_row(data, event_id)) for data, event_id in items]
+    if outbox is not None:
+        try:
+            outbox.enqueue_many(BOOKINGS_TABLE, rows)
+            return "queued"
+        except Exception as e:
+            print(f"ERRO: outbox local indisponível ({e}); gravando no Supabase diretamente.")
+    try:
+        bookings.insert_many([row for _, row in rows])
+        return "saved"
+    except Exception as e:
+        print(f"ERRO CRÍTICO: Falha ao salvar {len(rows)} agendamentos no Supabase '{BOOKINGS_TABLE}'.")
+        print(f"Erro da API Supabase: {e}")
+        return "failed"
 
 # --- Funções auxiliares (Sem alteração) ---
 try:
@@ -85,52 +178,54 @@ except Exception:
         return datetime.fromisoformat(s.replace("Z", "+00:00"))
 
 def get_business_window_for_date(d: date) -> Optional[Tuple[datetime, datetime]]:
-    rule = BUSINESS_HOURS.get(d.weekday())
-    if not rule:
-        return None
-    start_str, end_str = rule
-    start_t = datetime.strptime(start_str, "%H:%M").time()
-    end_t = datetime.strptime(end_str, "%H:%M").time()
-    start_dt = datetime.combine(d, start_t).replace(tzinfo=TZ)
-    end_dt = datetime.combine(d, end_t).replace(tzinfo=TZ)
-    return start_dt, end_dt
+    return availability.window(d)
 
 def is_holiday(d: date) -> bool:
+    return holidays.is_holiday(d)
+
+def slots_calendar_id(id_lifeplanner: Optional[str] = None) -> str:
+    """
+    Agenda consultada pelo /slots/: a do life planner, pelo mesmo email em que
+    o agendamento cria o evento (e com que o cache de sincronização recebe a
+    escrita), ou a "primary" da conta do serviço quando não há id_lifeplanner.
+    Um id desconhecido é 404: o fallback de get_lifeplanner_email mostraria os
+    horários de outra agenda.
+    """
+    if not id_lifeplanner:
+        return "primary"
     try:
-        # Nota: Seu código original chamava 'scheduler_service.supabase_client'. 
-        # Esta lógica deve ser movida para o 'supabase_supabase.py' ou removida se não for usada.
-        # Por simplicidade, mantemos o fallback:
-        LOCAL_HOLIDAYS = set()
-        return d in LOCAL_HOLIDAYS
-    except Exception:
-        LOCAL_HOLIDAYS = set()
-        return d in LOCAL_HOLIDAYS
+        record = get_lifeplanner(id_lifeplanner)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Falha ao consultar o life planner no Supabase: {e}")
+    if not record or not record.get("email_calendario"):
+        raise HTTPException(status_code=404, detail=f"Life planner '{id_lifeplanner}' não encontrado ou sem email_calendario")
+    return record["email_calendario"]
 
-def get_existing_events_for_day(d: date) -> List[Tuple[datetime, datetime]]:
-    # Esta função usa 'calendarId="primary"' - Isso deve ser revisado se houver múltiplos calendars de vendedores
+def get_existing_events_for_day(d: date, calendar_id: str = "primary") -> List[Tuple[datetime, datetime]]:
     window = get_business_window_for_date(d)
     if not window:
         return []
     start_dt, end_dt = window
+    if CALENDAR_SYNC_ENABLED:
+        try:
+            # Agenda quente: responde da memória; senão sincroniza (incremental) antes
+            return calendar_sync.events_between(calendar_id, start_dt, end_dt)
+        except Exception as e:
+            print(f"ERRO: cache de sincronização do Calendar falhou ({e}); consultando o dia diretamente.")
+    return list_events_between(start_dt, end_dt, calendar_id)
+
+def list_events_between(start_dt: datetime, end_dt: datetime, calendar_id: str = "primary") -> List[Tuple[datetime, datetime]]:
     service = get_calendar_service()
-    events_res = service.events().list(
-        calendarId="primary", # ATENÇÃO: Se for para vários LPs, este ID precisa ser dinâmico!
-        timeMin=start_dt.isoformat(),
-        timeMax=end_dt.isoformat(),
-        singleEvents=True,
-        orderBy="startTime"
-    ).execute()
+    with span("calendar", "events.list"):
+        events_res = service.events().list(
+            calendarId=calendar_id,
+            timeMin=start_dt.isoformat(),
+            timeMax=end_dt.isoformat(),
+            singleEvents=True,
+            orderBy="startTime"
+        ).execute()
     items = events_res.get("items", [])
-    intervals = []
-    for ev in items:
-        s = ev.get("start", {}).get("dateTime") or ev.get("start", {}).get("date")
-        e = ev.get("end", {}).get("dateTime") or ev.get("end", {}).get("date")
-        if not s or not e:
-            continue
-        sdt = isoparse(s).astimezone(TZ)
-        edt = isoparse(e).astimezone(TZ)
-        intervals.append((sdt, edt))
-    return intervals
+    return [iv for iv in (event_interval(ev, TZ) for ev in items) if iv]
 
 def merge_intervals(intervals: List[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
     if not intervals:
@@ -147,34 +242,20 @@ def merge_intervals(intervals: List[Tuple[datetime, datetime]]) -> List[Tuple[da
     merged.append((cur_s, cur_e))
     return merged
 
-def generate_slots_for_day(d: date) -> List[Tuple[datetime, datetime]]:
-    if is_holiday(d):
-        return []
-    window = get_business_window_for_date(d)
-    if not window:
+def generate_slots_for_day(d: date, calendar_id: str = "primary") -> List[Tuple[datetime, datetime]]:
+    if not availability.is_open(d):
         return []
-    start_dt, end_dt = window
-    busy = get_existing_events_for_day(d)
-    busy = merge_intervals(busy)
-
-    free_intervals = []
-    cur = start_dt
-    for b_s, b_e in busy:
-        if b_s > cur:
-            free_intervals.append((cur, b_s))
-        cur = max(cur, b_e)
-    if cur < end_dt:
-        free_intervals.append((cur, end_dt))
-
-    slots = []
-    for f_s, f_e in free_intervals:
-        iter_start = f_s
-        while (iter_start + timedelta(minutes=60)) <= f_e:
-            slots.append((iter_start, iter_start + timedelta(minutes=60)))
-            iter_start += timedelta(minutes=60)
-        if (f_e - iter_start) >= timedelta(minutes=50):
-            slots.append((iter_start, iter_start + timedelta(minutes=50)))
-    return slots
+    if CALENDAR_SYNC_ENABLED:
+        try:
+            # Índice de intervalos mantido pelo cache de sincronização: sem consulta ao Calendar
+            return availability.slots_for_day(d, calendar_sync.busy_index(calendar_id))
+        except Exception as e:
+            print(f"ERRO: cache de sincronização do Calendar falhou ({e}); consultando o dia diretamente.")
+    return slots_from_busy(d, list_events_between(*get_business_window_for_date(d), calendar_id))
+
+def slots_from_busy(d: date, busy: List[Tuple[datetime, datetime]]) -> List[Tuple[datetime, datetime]]:
+    """Slots livres do dia 'd' dado os intervalos ocupados (que podem cobrir outros dias)."""
+    return availability.slots_for_day(d, IntervalIndex(busy, TZ))
 
 # --- Endpoint para consultar slots (Sem alteração) ---
 @router.post("/slots/")
@@ -186,12 +267,195 @@ def available_slots(payload: dict = Body(...)):
         d = date.fromisoformat(date_str)
     except Exception:
         raise HTTPException(status_code=400, detail="Formato de data inválido. Use YYYY-MM-DD")
-    slots = generate_slots_for_day(d)
+    # id_lifeplanner (opcional): a agenda do life planner, onde o agendamento grava o evento
+    slots = generate_slots_for_day(d, slots_calendar_id(payload.get("id_lifeplanner")))
     return {"date": date_str, "slots": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in slots]}
 
+# --- Disponibilidade de vários life planners em um intervalo de datas ---
+def get_busy_intervals(calendar_ids: List[str], time_min: datetime, time_max: datetime) -> Dict[str, dict]:
+    """
+    Intervalos ocupados de várias agendas com freebusy.query (uma chamada por
+    até 50 agendas, em paralelo). Retorna {agenda: {"busy": [...], "errors": [...]}}.
+    """
+    service = get_calendar_service()
+    chunks = [calendar_ids[i:i + FREEBUSY_MAX_CALENDARS] for i in range(0, len(calendar_ids), FREEBUSY_MAX_CALENDARS)]
+
+    def query(chunk: List[str]) -> dict:
+        with span("calendar", "freebusy.query"):
+            return service.freebusy().query(body={
+                "timeMin": time_min.isoformat(),
+                "timeMax": time_max.isoformat(),
+                "timeZone": TIMEZONE,
+                "items": [{"id": calendar_id} for calendar_id in chunk],
+            }).execute()
+
+    if len(chunks) == 1:
+        responses = [query(chunks[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            responses = list(executor.map(query, chunks))
+
+    result = {}
+    for response in responses:
+        for calendar_id, info in response.get("calendars", {}).items():
+            busy = [(isoparse(b["start"]).astimezone(TZ), isoparse(b["end"]).astimezone(TZ)) for b in info.get("busy", [])]
+            result[calendar_id] = {"busy": busy, "errors": info.get("errors", [])}
+    return result
+
+@router.post("/slots/range/")
+def available_slots_range(payload: dict = Body(...)):
+    start_str = payload.get("start_date")
+    end_str = payload.get("end_date") or start_str
+    planner_ids = list(dict.fromkeys(payload.get("life_planners") or []))
+    if not start_str or not planner_ids:
+        raise HTTPException(status_code=400, detail="Campos obrigatórios: start_date (YYYY-MM-DD), life_planners (lista de IDs)")
+    try:
+        start_d, end_d = date.fromisoformat(start_str), date.fromisoformat(end_str)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Formato de data inválido. Use YYYY-MM-DD")
+    days = (end_d - start_d).days + 1
+    if days < 1 or days > SLOTS_RANGE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Intervalo inválido: end_date >= start_date e no máximo {SLOTS_RANGE_MAX_DAYS} dias")
+    if len(planner_ids) > SLOTS_RANGE_MAX_PLANNERS:
+        raise HTTPException(status_code=400, detail=f"No máximo {SLOTS_RANGE_MAX_PLANNERS} life planners por consulta")
+
+    dates = [start_d + timedelta(days=i) for i in range(days)]
+    time_min = datetime.combine(start_d, time.min).replace(tzinfo=TZ)
+    time_max = datetime.combine(end_d + timedelta(days=1), time.min).replace(tzinfo=TZ)
+    result = []
+    for entry, index in planners_busy(planner_ids, time_min, time_max):
+        entry["days"] = []
+        if index is not None:
+            slots_by_day = availability.slots_between(start_d, end_d, index)
+            entry["days"] = [
+                {"date": d.isoformat(), "slots": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in slots_by_day[d]]}
+                for d in dates
+            ]
+        result.append(entry)
+    return {"start_date": start_d.isoformat(), "end_date": end_d.isoformat(), "life_planners": result}
+
+def planners_busy(planner_ids: List[str], time_min: datetime, time_max: datetime) -> List[Tuple[dict, Optional[IntervalIndex]]]:
+    """
+    Para cada life planner: a entrada da resposta ({id_lifeplanner, calendar,
+    error}) e o IntervalIndex dos seus horários ocupados em [time_min, time_max)
+    (None quando a agenda não pôde ser consultada). Ids que não existem na
+    tabela 'life_planners' recusam a consulta inteira com 404.
+    """
+    # Agendas dos life planners (cache + uma consulta para os que faltam)
+    planners = get_lifeplanners(planner_ids)
+    unknown = [lp for lp in planner_ids if planners.get(lp) is None]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Life planners não encontrados: {', '.join(unknown)}")
+    calendars = {lp: (planners.get(lp) or {}).get("email_calendario") for lp in planner_ids}
+
+    # Uma consulta freebusy cobre todos os dias e todas as agendas
+    calendar_ids = list(dict.fromkeys(c for c in calendars.values() if c))
+    try:
+        busy_by_calendar = get_busy_intervals(calendar_ids, time_min, time_max) if calendar_ids else {}
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Falha ao consultar a disponibilidade no Google Calendar: {e}")
+
+    result = []
+    for lp in planner_ids:
+        calendar_id = calendars[lp]
+        entry = {"id_lifeplanner": lp, "calendar": calendar_id, "error": None}
+        info = busy_by_calendar.get(calendar_id) if calendar_id else None
+        index = None
+        if not calendar_id:
+            entry["error"] = "Life planner sem email_calendario"
+        elif info is None or info["errors"]:
+            reasons = ", ".join(err.get("reason", "erro") for err in (info or {}).get("errors", [])) or "sem resposta"
+            entry["error"] = f"Agenda indisponível no Google Calendar ({reasons})"
+        else:
+            index = IntervalIndex(info["busy"], TZ)
+        result.append((entry, index))
+    return result
+
+# --- Próximos horários livres de cada life planner ---
+@router.post("/slots/next/")
+def next_available_slots(payload: dict = Body(...)):
+    planner_ids = list(dict.fromkeys(payload.get("life_planners") or []))
+    if not planner_ids:
+        raise HTTPException(status_code=400, detail="Campo obrigatório: life_planners (lista de IDs)")
+    if len(planner_ids) > SLOTS_RANGE_MAX_PLANNERS:
+        raise HTTPException(status_code=400, detail=f"No máximo {SLOTS_RANGE_MAX_PLANNERS} life planners por consulta")
+    try:
+        after = isoparse(payload["from"]) if payload.get("from") else datetime.now(TZ)
+        count = int(payload.get("count", 5))
+        horizon_days = int(payload.get("horizon_days", 30))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Campos inválidos: from (data/hora ISO 8601), count e horizon_days (inteiros)")
+    after = after.replace(tzinfo=TZ) if after.tzinfo is None else after.astimezone(TZ)
+    if not 1 <= count <= SLOTS_NEXT_MAX_COUNT:
+        raise HTTPException(status_code=400, detail=f"count deve estar entre 1 e {SLOTS_NEXT_MAX_COUNT}")
+    if not 1 <= horizon_days <= SLOTS_NEXT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"horizon_days deve estar entre 1 e {SLOTS_NEXT_MAX_DAYS}")
+
+    # Consulta desde o início do dia: um evento que termina antes de 'from' ainda define onde os slots começam
+    time_min = datetime.combine(after.date(), time.min).replace(tzinfo=TZ)
+    time_max = time_min + timedelta(days=horizon_days)
+    result = []
+    for entry, index in planners_busy(planner_ids, time_min, time_max):
+        slots = availability.first_available(index, after, count, horizon_days) if index is not None else []
+        entry["slots"] = [{"start": s.isoformat(), "end": e.isoformat()} for s, e in slots]
+        result.append(entry)
+    return {"from": after.isoformat(), "count": count, "horizon_days": horizon_days, "life_planners": result}
+
+def build_event_body(payload: AgendamentoPayload, calendar_id: str) -> dict:
+    return {
+        "summary": payload.summary,
+        "description": payload.description,
+        "start": {"dateTime": payload.start_time.isoformat(), "timeZone": TIMEZONE},
+        "end": {"dateTime": payload.end_time.isoformat(), "timeZone": TIMEZONE},
+        "attendees": [{"email": email} for email in payload.attendee_emails],
+        "organizer": {"email": calendar_id}, # Usa o email definido/buscado
+        "reminders": {"useDefault": True},
+    }
+
+# --- Conflitos com agendamentos já gravados (dupla reserva) ---
+def booking_interval(row: dict) -> Tuple[datetime, datetime]:
+    return as_local(isoparse(row["start_time"])), as_local(isoparse(row["end_time"]))
+
+def booking_conflicts(lifeplanner_id: str, start: datetime, end: datetime,
+                      exclude_event_id: Optional[str] = None) -> List[dict]:
+    """
+    Agendamentos ativos do life planner que cruzam [start, end): os do
+    repositório (bookings.overlapping, pelo índice de life planner e início)
+    e os que ainda estão no outbox, que só chegam ao Supabase depois da
+    resposta do agendamento.
+    """
+    rows = bookings.overlapping(lifeplanner_id, start, end)
+    if outbox is not None:
+        pending = outbox.pending_rows(BOOKINGS_TABLE, {"id_lifeplanner": lifeplanner_id, "status": STATUS_ACTIVE})
+        for entry in pending:
+            row_start, row_end = booking_interval(entry["payload"])
+            if row_start < end and row_end > start:
+                rows.append(entry["payload"])
+    conflicts, seen = [], {exclude_event_id}
+    for row in rows:
+        if row.get("event_ide_google") not in seen:
+            seen.add(row.get("event_ide_google"))
+            conflicts.append(row)
+    return conflicts
+
+def check_booking_conflicts(lifeplanner_id: str, start: datetime, end: datetime,
+                            exclude_event_id: Optional[str] = None) -> None:
+    """409 se o horário já está reservado. Se o Supabase falha a verificação é pulada, como a gravação (outbox)."""
+    try:
+        conflicts = booking_conflicts(lifeplanner_id, start, end, exclude_event_id)
+    except Exception as e:
+        print(f"ALERTA: não foi possível verificar conflitos de '{lifeplanner_id}' ({e}); seguindo sem a verificação.")
+        return
+    if conflicts:
+        raise HTTPException(status_code=409, detail=(
+            f"Horário já ocupado: conflita com o agendamento de {conflicts[0]['start_time']} a {conflicts[0]['end_time']}"
+        ))
+
 # --- Endpoint para criar agendamento (CORRIGIDO PARA ESCALABILIDADE E SUPABASE) ---
 @router.post("/")
 def schedule_event(payload: AgendamentoPayload):
+    # Antes de criar o evento: um horário já reservado para o life planner é 409, não uma segunda reserva
+    check_booking_conflicts(payload.cliente_id, as_local(payload.start_time), as_local(payload.end_time))
     try:
         # 1. DEFINE O CALENDÁRIO/ORGANIZADOR (LÓGICA ESCALÁVEL)
         calendar_id = payload.organizer_email # Prioridade 1: Tenta usar o email que o n8n envia
@@ -205,43 +469,210 @@ def schedule_event(payload: AgendamentoPayload):
             calendar_id = "jjsales003@gmail.com" 
 
         # --- 2. GOOGLE CALENDAR (AGENDAMENTO) ---
-        service = get_calendar_service()
-        event = {
-            "summary": payload.summary,
-            "description": payload.description,
-            "start": {"dateTime": payload.start_time.isoformat(), "timeZone": TIMEZONE},
-            "end": {"dateTime": payload.end_time.isoformat(), "timeZone": TIMEZONE},
-            "attendees": [{"email": email} for email in payload.attendee_emails],
-            "organizer": {"email": calendar_id}, # Usa o email definido/buscado
-            "reminders": {"useDefault": True},
-        }
+        service = get_calendar_service(calendar_id)
+        event = build_event_body(payload, calendar_id)
         
         # Cria o evento no calendário do Vendedor
-        created_event = service.events().insert(
-            calendarId=calendar_id, # CRÍTICO: Usa o ID do calendário/Vendedor DINÂMICO
-            body=event
-        ).execute()
+        with span("calendar", "events.insert"):
+            created_event = service.events().insert(
+                calendarId=calendar_id, # CRÍTICO: Usa o ID do calendário/Vendedor DINÂMICO
+                body=event
+            ).execute()
         
         event_id = created_event.get("id")
         event_link = created_event.get("htmlLink")
+        calendar_sync.apply_event(calendar_id, created_event) # Cache de eventos atualizado na hora
 
         # --- 3. SUPABASE (SALVAMENTO) ---
-        save_agendamento(payload.dict(), event_id, event_link)
+        # Vai para o outbox local: a resposta não espera o Supabase
+        persistence = persist_agendamento(payload.model_dump(), event_id, event_link)
         
         return {
             "status": "success",
             "event_id": event_id,
-            "event_link": event_link
+            "event_link": event_link,
+            "persistence": persistence
         }
         
     except Exception as e:
         print(f"ERRO FATAL DURANTE AGENDAMENTO: {e}")
         raise HTTPException(status_code=500, detail=f"Falha ao agendar: {e}")
 
+# --- Agendamento em lote (dias de campanha): lotes do Google Calendar + uma gravação no Supabase ---
+def resolve_calendars(items: List[AgendamentoPayload]) -> List[str]:
+    """Agenda de cada item: organizer_email ou o email_calendario do life planner (uma consulta para todos)."""
+    missing = list(dict.fromkeys(p.cliente_id for p in items if not p.organizer_email))
+    try:
+        planners = get_lifeplanners(missing) if missing else {}
+    except Exception as e:
+        print(f"ERRO SUPABASE: Falha ao buscar os life planners do lote: {e}")
+        planners = {}
+    calendars = []
+    for p in items:
+        calendar_id = p.organizer_email or (planners.get(p.cliente_id) or {}).get("email_calendario")
+        if not calendar_id:
+            print(f"ALERTA: ID do Life Planner '{p.cliente_id}' não encontrado na tabela 'life_planners'. Usando Fallback.")
+            calendar_id = "jjsales003@gmail.com"
+        calendars.append(calendar_id)
+    return calendars
+
+def as_local(dt: datetime) -> datetime:
+    # Horário sem fuso é interpretado no fuso do serviço (o evento vai com timeZone=TIMEZONE)
+    return dt.replace(tzinfo=TZ) if dt.tzinfo is None else dt.astimezone(TZ)
+
+def insert_events_batched(calendar_id: str, entries: List[Tuple[int, dict]]) -> Dict[int, Tuple[Optional[dict], Optional[str]]]:
+    """Cria os eventos de uma agenda em lotes de até 50 chamadas. Retorna índice -> (evento criado, erro)."""
+    service = get_calendar_service(calendar_id)
+    results: Dict[int, Tuple[Optional[dict], Optional[str]]] = {}
+
+    def callback(request_id, response, exception):
+        results[int(request_id)] = (response, None) if exception is None else (None, str(exception))
+
+    for i in range(0, len(entries), CALENDAR_BATCH_MAX):
+        chunk = entries[i:i + CALENDAR_BATCH_MAX]
+        batch = service.new_batch_http_request(callback=callback)
+        for index, body in chunk:
+            batch.add(service.events().insert(calendarId=calendar_id, body=body), request_id=str(index))
+        try:
+            with span("calendar", "events.insert.batch"):
+                batch.execute()
+        except Exception as e:
+            # Falha do lote inteiro (rede, autenticação): todos os itens dele falham
+            print(f"ERRO: lote de {len(chunk)} eventos na agenda '{calendar_id}' falhou: {e}")
+            for index, _ in chunk:
+                results.setdefault(index, (None, str(e)))
+    return results
+
+@router.post("/bulk/")
+def schedule_bulk(payload: AgendamentoBulkPayload):
+    items = payload.agendamentos
+    if not items:
+        raise HTTPException(status_code=400, detail="Campo 'agendamentos' vazio")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"No máximo {BULK_MAX_ITEMS} agendamentos por lote")
+
+    calendars = resolve_calendars(items)
+    results = [
+        {"index": i, "status": None, "calendar": calendars[i], "event_id": None, "event_link": None, "error": None}
+        for i in range(len(items))
+    ]
+    valid = []
+    for i, item in enumerate(items):
+        start, end = as_local(item.start_time), as_local(item.end_time)
+        if end <= start:
+            results[i].update(status="invalid", error="end_time deve ser posterior a start_time")
+        else:
+            valid.append((i, start, end))
+
+    # Conflitos: uma consulta freebusy cobre todas as agendas e todo o período do lote
+    busy_by_calendar = {}
+    if valid:
+        calendar_ids = list(dict.fromkeys(calendars[i] for i, _, _ in valid))
+        try:
+            busy_by_calendar = get_busy_intervals(calendar_ids, min(s for _, s, _ in valid), max(e for _, _, e in valid))
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Falha ao consultar a disponibilidade no Google Calendar: {e}")
+
+    # ... e os agendamentos já gravados de cada life planner no período do lote (uma consulta por life planner)
+    booked: Dict[str, List[Tuple[datetime, datetime]]] = {}
+    if valid:
+        planner_ids = list(dict.fromkeys(items[i].cliente_id for i, _, _ in valid))
+        window = (min(s for _, s, _ in valid), max(e for _, _, e in valid))
+
+        def planner_bookings(lp: str) -> List[Tuple[datetime, datetime]]:
+            try:
+                return [booking_interval(row) for row in booking_conflicts(lp, *window)]
+            except Exception as e:
+                print(f"ALERTA: não foi possível verificar conflitos de '{lp}' ({e}); seguindo sem a verificação.")
+                return []
+
+        with ThreadPoolExecutor(max_workers=min(8, len(planner_ids))) as executor:
+            booked = dict(zip(planner_ids, executor.map(planner_bookings, planner_ids)))
+
+    accepted: Dict[str, List[Tuple[int, dict]]] = {}
+    claimed: Dict[str, List[Tuple[datetime, datetime, int]]] = {}
+    for i, start, end in valid:
+        calendar_id = calendars[i]
+        info = busy_by_calendar.get(calendar_id)
+        if info is None or info["errors"]:
+            reasons = ", ".join(err.get("reason", "erro") for err in (info or {}).get("errors", [])) or "sem resposta"
+            results[i].update(status="error", error=f"Agenda indisponível no Google Calendar ({reasons})")
+            continue
+        if any(b_s < end and b_e > start for b_s, b_e in info["busy"]):
+            results[i].update(status="conflict", error="Horário já ocupado na agenda")
+            continue
+        if any(b_s < end and b_e > start for b_s, b_e in booked.get(items[i].cliente_id, [])):
+            results[i].update(status="conflict", error="Horário já ocupado por outro agendamento do life planner")
+            continue
+        # Itens anteriores do próprio lote também ocupam a agenda
+        earlier = next((j for c_s, c_e, j in claimed.get(calendar_id, []) if c_s < end and c_e > start), None)
+        if earlier is not None:
+            results[i].update(status="conflict", error=f"Horário conflita com o item {earlier} do lote")
+            continue
+        claimed.setdefault(calendar_id, []).append((start, end, i))
+        accepted.setdefault(calendar_id, []).append((i, build_event_body(items[i], calendar_id)))
+
+    # Uma sequência de lotes por agenda (clientes distintos com delegação), agendas em paralelo
+    created = []
+    if accepted:
+        with ThreadPoolExecutor(max_workers=min(8, len(accepted))) as executor:
+            futures = {calendar_id: executor.submit(insert_events_batched, calendar_id, entries)
+                       for calendar_id, entries in accepted.items()}
+        for calendar_id, future in futures.items():
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = {i: (None, str(getattr(e, "detail", e))) for i, _ in accepted[calendar_id]}
+            for i, _ in accepted[calendar_id]:
+                event, error = outcome.get(i, (None, "Sem resposta do Google Calendar"))
+                if event is None:
+                    results[i].update(status="error", error=error)
+                    continue
+                results[i].update(status="success", event_id=event.get("id"), event_link=event.get("htmlLink"))
+                calendar_sync.apply_event(calendar_id, event) # Cache de eventos atualizado na hora
+                created.append((items[i].model_dump(), event["id"]))
+
+    # --- SUPABASE: todas as linhas de uma vez (outbox ou um único INSERT) ---
+    persistence = persist_agendamentos(created) if created else None
+    statuses = [r["status"] for r in results]
+    return {
+        "total": len(items),
+        "created": statuses.count("success"),
+        "conflicts": statuses.count("conflict"),
+        "failed": len(items) - statuses.count("success") - statuses.count("conflict"),
+        "persistence": persistence,
+        "results": results,
+    }
+
+def find_active_booking(id_lp: str, celular: str) -> Optional[dict]:
+    """
+    Agendamento ativo do cliente, considerando o que ainda está no outbox.
+
+    Com o outbox, o agendamento responde antes de a linha chegar ao Supabase:
+    ela é gravada pelo worker em ~SUPABASE_OUTBOX_FLUSH_SECONDS, ou bem depois
+    se o Supabase estiver falhando (backoff) ou a entrada estiver 'dead'.
+    Reagendar/cancelar nessa janela não pode dar 404: se a consulta não acha
+    nada mas há uma entrada pendente para o mesmo (id_lifeplanner,
+    cliente_celular), ela é enviada agora e a consulta é refeita. Se o envio
+    falha, a resposta é 503 (tente de novo), nunca "não encontrado".
+    """
+    ag = bookings.find_active(id_lp, celular)
+    if ag or outbox is None:
+        return ag
+    pending = outbox.pending_rows(BOOKINGS_TABLE, {
+        "id_lifeplanner": id_lp, "cliente_celular": celular, "status": STATUS_ACTIVE,
+    })
+    if not pending:
+        return None
+    outbox.flush_events(BOOKINGS_TABLE, [entry["event_id"] for entry in pending])
+    ag = bookings.find_active(id_lp, celular)
+    if not ag:
+        raise HTTPException(503, "Agendamento ainda não gravado no Supabase (pendente no outbox); tente novamente em instantes.")
+    return ag
+
 # --- Endpoint para reagendar (CORRIGIDO para usar a nova função de cliente Supabase) ---
 @router.post("/reagendar/")
 def reschedule_event(payload: dict = Body(...)):
-    db = get_supabase_client() # Obtém o cliente Supabase
     id_lp = payload.get("id_lifeplanner")
     celular = payload.get("cliente_celular")
     new_start_str = payload.get("new_start_time")
@@ -250,34 +681,34 @@ def reschedule_event(payload: dict = Body(...)):
     if not all([id_lp, celular, new_start_str, new_end_str]):
         raise HTTPException(400, "Campos obrigatórios: id_lifeplanner, cliente_celular, new_start_time, new_end_time")
     
-    # Nota: Assumindo que a tabela ainda se chama "agendamentos" neste endpoint, mas o nome correto é "agendamentos_ativos"
-    res = db.table("agendamentos") \
-        .select("*") \
-        .eq("id_lifeplanner", id_lp) \
-        .eq("cliente_celular", celular) \
-        .eq("status", "scheduled") \
-        .execute()
-    
-    if not res.data:
+    # Mesma tabela e colunas gravadas pelo agendamento (índice em id_lifeplanner, cliente_celular, status),
+    # incluindo o que ainda está no outbox (ver find_active_booking)
+    ag = find_active_booking(id_lp, celular)
+    if not ag:
         raise HTTPException(404, "Agendamento não encontrado")
-    ag = res.data[0]
+    try:
+        new_start, new_end = as_local(isoparse(new_start_str)), as_local(isoparse(new_end_str))
+    except Exception:
+        raise HTTPException(400, "Formato de data/hora inválido. Use ISO 8601 (ex.: 2030-01-08T14:00:00-03:00)")
+    # O próprio agendamento não conta como conflito
+    check_booking_conflicts(id_lp, new_start, new_end, exclude_event_id=ag["event_ide_google"])
 
     try:
-        service = get_calendar_service()
-        event_id = ag["event_id_google"]
+        event_id = ag["event_ide_google"]
         
         # Busca o email do organizador (agora dinâmico)
         calendar_id = get_lifeplanner_email(id_lp)
+        service = get_calendar_service(calendar_id)
 
-        event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
+        with span("calendar", "events.get"):
+            event = service.events().get(calendarId=calendar_id, eventId=event_id).execute()
         event["start"]["dateTime"] = new_start_str
         event["end"]["dateTime"] = new_end_str
-        updated_event = service.events().update(calendarId=calendar_id, eventId=event_id, body=event).execute()
+        with span("calendar", "events.update"):
+            updated_event = service.events().update(calendarId=calendar_id, eventId=event_id, body=event).execute()
+        calendar_sync.apply_event(calendar_id, updated_event)
 
-        db.table("agendamentos").update({
-            "start_time": new_start_str,
-            "end_time": new_end_str
-        }).eq("id", ag["id"]).execute()
+        bookings.update(ag["id"], {"start_time": new_start_str, "end_time": new_end_str})
 
         return {"status": "success", "event_id": event_id, "event_link": updated_event.get("htmlLink")}
 
@@ -287,40 +718,85 @@ def reschedule_event(payload: dict = Body(...)):
 # --- Endpoint para cancelar (CORRIGIDO para usar a nova função de cliente Supabase) ---
 @router.post("/cancelar/")
 def cancel_event(payload: dict = Body(...)):
-    db = get_supabase_client() # Obtém o cliente Supabase
     id_lp = payload.get("id_lifeplanner")
     celular = payload.get("cliente_celular")
     
     if not id_lp or not celular:
         raise HTTPException(400, "Campos obrigatórios: id_lifeplanner, cliente_celular")
 
-    res = db.table("agendamentos") \
-        .select("*") \
-        .eq("id_lifeplanner", id_lp) \
-        .eq("cliente_celular", celular) \
-        .eq("status", "scheduled") \
-        .execute()
-    
-    if not res.data:
+    # Inclui o agendamento que ainda está no outbox (ver find_active_booking)
+    ag = find_active_booking(id_lp, celular)
+    if not ag:
         raise HTTPException(404, "Agendamento não encontrado")
-    ag = res.data[0]
 
     try:
-        service = get_calendar_service()
-        event_id = ag["event_id_google"]
+        event_id = ag["event_ide_google"]
         
         # Busca o email do organizador (agora dinâmico)
         calendar_id = get_lifeplanner_email(id_lp)
+        service = get_calendar_service(calendar_id)
 
-        service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+        with span("calendar", "events.delete"):
+            service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
+        calendar_sync.remove_event(calendar_id, event_id)
 
-        db.table("agendamentos").update({
-            "status": "canceled"
-        }).eq("id", ag["id"]).execute()
+        bookings.cancel(ag["id"])
 
         return {"status": "success", "event_id": event_id}
     except Exception as e:
         raise HTTPException(500, f"Falha ao cancelar: {e}")
 
+# --- Cache de life planners: invalidação após alterar a tabela 'life_planners' ---
+@router.post("/cache/life-planners/invalidate/")
+def invalidate_lifeplanner_cache(payload: dict = Body(default={})):
+    id_lp = payload.get("id_lifeplanner") # Sem id: descarta todos
+    removed = invalidate_lifeplanner(id_lp)
+    return {"status": "success", "id_lifeplanner": id_lp, "removed": removed}
+
+# --- Outbox do Supabase: inspeção e reenvio ---
+def check_admin_token(token: Optional[str]) -> None:
+    # As entradas têm os dados dos clientes e o replay reenvia gravações: sem token configurado, ninguém acessa
+    if not SCHEDULER_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Rotas administrativas desativadas (defina SCHEDULER_ADMIN_TOKEN ou RAG_ADMIN_TOKEN).")
+    if token != SCHEDULER_ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Token administrativo inválido.")
+
+def require_outbox() -> SupabaseOutbox:
+    if outbox is None:
+        raise HTTPException(status_code=404, detail="Outbox desativado (SUPABASE_OUTBOX_PATH vazio)")
+    return outbox
+
+@router.get("/outbox/")
+def outbox_backlog(status: Optional[str] = None, limit: int = 50, x_admin_token: Optional[str] = Header(None)):
+    check_admin_token(x_admin_token)
+    box = require_outbox()
+    if status and status not in ("pending", "done", "dead"):
+        raise HTTPException(status_code=400, detail="status deve ser 'pending', 'done' ou 'dead'")
+    return {"stats": box.stats(), "entries": box.entries(status, max(1, min(limit, 500)))}
+
+@router.post("/outbox/replay/")
+def outbox_replay(payload: dict = Body(default={}), x_admin_token: Optional[str] = Header(None)):
+    # Sem ids/event_ids: reenfileira todas as entradas do status (padrão 'dead')
+    check_admin_token(x_admin_token)
+    box = require_outbox()
+    status = payload.get("status") or "dead"
+    if status not in ("pending", "done", "dead"):
+        raise HTTPException(status_code=400, detail="status deve ser 'pending', 'done' ou 'dead'")
+    requeued = box.replay(ids=payload.get("ids"), event_ids=payload.get("event_ids"), status=status)
+    # flush=true envia agora, na própria requisição, e devolve o resultado
+    flushed = box.flush() if payload.get("flush") else None
+    return {"status": "success", "requeued": requeued, "flush": flushed}
+
+# --- Estatísticas dos clientes compartilhados (Calendar e cache de life planners) ---
+@router.get("/stats/")
+def scheduler_stats():
+    return {
+        "calendar": calendar_pool.stats(),
+        "calendar_sync": calendar_sync.stats(),
+        "life_planners": lifeplanner_cache.stats(),
+        "outbox": outbox.stats() if outbox is not None else None,
+        "bookings": bookings.stats(),
+    }
+
 # --- Inclui router no app ---
 app.include_router(router, prefix="/agendar") # Uso corrigido: inclui todas as rotas definidas acima
@@ -1,18 +1,34 @@
+"""
+Mock do scheduler_service: mesmas rotas, validações e formatos de resposta do
+main.py, sem Google Calendar nem Supabase.
+
+Os agendamentos ficam em um InMemoryBookingRepository (bookings.py): busca
+do agendamento ativo por índice hash e horários ocupados de cada life planner
+pelo índice de intervalos, que alimenta o mesmo AvailabilityEngine do serviço
+real (feriados incluídos). Serve de dublê rápido para testes de carga do n8n;
+MOCK_LATENCY_SECONDS simula a ida ao Calendar em cada escrita.
+
+Uso:
+    uvicorn main_mock:app --port 8081
+"""
+import itertools
+import os
+import time as time_module
+from datetime import datetime, date, time, timedelta
+from typing import List, Tuple, Optional
+from zoneinfo import ZoneInfo
+
 from fastapi import FastAPI, APIRouter, HTTPException, Body
 from pydantic import BaseModel
-from datetime import datetime, date, timedelta
-from typing import List, Tuple, Optional
+
+from availability import AvailabilityEngine, HolidayCalendar, IntervalIndex
+from bookings import InMemoryBookingRepository, booking_row
 
 # --- FastAPI & Router ---
 app = FastAPI()
 router = APIRouter(prefix="/agendar")
 
-# --- Mock global ---
-EVENT_COUNTER = 1
-MOCK_AGENDAMENTOS = []
-
-# --- Timezone e regras de horário ---
-from zoneinfo import ZoneInfo
+# --- Timezone e regras de horário (iguais às do main.py) ---
 TIMEZONE = "America/Sao_Paulo"
 TZ = ZoneInfo(TIMEZONE)
 
@@ -26,6 +42,24 @@ BUSINESS_HOURS = {
     6: None,                # Domingo
 }
 
+SLOTS_RANGE_MAX_DAYS = int(os.getenv("SLOTS_RANGE_MAX_DAYS", "31"))
+SLOTS_RANGE_MAX_PLANNERS = int(os.getenv("SLOTS_RANGE_MAX_PLANNERS", "100"))
+SLOTS_NEXT_MAX_DAYS = int(os.getenv("SLOTS_NEXT_MAX_DAYS", "92"))
+SLOTS_NEXT_MAX_COUNT = int(os.getenv("SLOTS_NEXT_MAX_COUNT", "50"))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "200"))
+# Latência simulada do Google Calendar por escrita (0 = responde da memória)
+MOCK_LATENCY_SECONDS = float(os.getenv("MOCK_LATENCY_SECONDS", "0"))
+
+holidays = HolidayCalendar(
+    include_optional=os.getenv("HOLIDAYS_INCLUDE_OPTIONAL", "0") == "1",
+    extra=[date.fromisoformat(v.strip()) for v in os.getenv("EXTRA_HOLIDAYS", "").split(",") if v.strip()],
+)
+availability = AvailabilityEngine(BUSINESS_HOURS, TZ, holidays)
+
+# --- Mock global ---
+bookings = InMemoryBookingRepository()
+EVENT_IDS = itertools.count(1)
+
 # --- Modelos ---
 class AgendamentoPayload(BaseModel):
     summary: str
@@ -33,31 +67,61 @@ class AgendamentoPayload(BaseModel):
     start_time: datetime
     end_time: datetime
     attendee_emails: List[str]
-    organizer_email: str
+    organizer_email: Optional[str] = None
+    cliente_id: Optional[str] = None
+    id_lifeplanner: Optional[str] = None  # Aceito como sinônimo de cliente_id (test_mock.ps1)
+    cliente_celular: Optional[str] = None
+
+class AgendamentoBulkPayload(BaseModel):
+    agendamentos: List[AgendamentoPayload]
 
 # --- Funções utilitárias ---
-def get_business_window_for_date(d: date) -> Optional[Tuple[datetime, datetime]]:
-    rule = BUSINESS_HOURS.get(d.weekday())
-    if not rule:
-        return None
-    start_str, end_str = rule
-    start_dt = datetime.combine(d, datetime.strptime(start_str, "%H:%M").time()).replace(tzinfo=TZ)
-    end_dt = datetime.combine(d, datetime.strptime(end_str, "%H:%M").time()).replace(tzinfo=TZ)
-    return start_dt, end_dt
-
-def generate_slots_for_day(d: date) -> List[Tuple[datetime, datetime]]:
-    window = get_business_window_for_date(d)
-    if not window:
-        return []
-    start_dt, end_dt = window
-    slots = []
-    cur = start_dt
-    while (cur + timedelta(minutes=60)) <= end_dt:
-        slots.append((cur, cur + timedelta(minutes=60)))
-        cur += timedelta(minutes=60)
-    if (end_dt - cur) >= timedelta(minutes=50):
-        slots.append((cur, cur + timedelta(minutes=50)))
-    return slots
+try:
+    from dateutil.parser import isoparse
+except Exception:
+    def isoparse(s: str) -> datetime:
+        return datetime.fromisoformat(s.replace("Z", "+00:00"))
+
+def simulate_latency() -> None:
+    if MOCK_LATENCY_SECONDS > 0:
+        time_module.sleep(MOCK_LATENCY_SECONDS)
+
+def as_local(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=TZ) if dt.tzinfo is None else dt.astimezone(TZ)
+
+def planner_of(payload: AgendamentoPayload) -> str:
+    return payload.cliente_id or payload.id_lifeplanner or "mock_lp_1"
+
+def calendar_of(lifeplanner_id: str) -> str:
+    return f"{lifeplanner_id}@agenda.mock"
+
+def event_link(event_id: str) -> str:
+    return f"https://mockcalendar.com/{event_id}"
+
+def busy_index(lifeplanner_id: Optional[str], time_min: datetime, time_max: datetime) -> IntervalIndex:
+    """Horários ocupados do life planner em [time_min, time_max), pelo índice de intervalos do repositório."""
+    rows = bookings.overlapping(lifeplanner_id, time_min, time_max) if lifeplanner_id else []
+    return IntervalIndex([(isoparse(r["start_time"]), isoparse(r["end_time"])) for r in rows], TZ)
+
+def day_bounds(first: date, last: date) -> Tuple[datetime, datetime]:
+    return (datetime.combine(first, time.min).replace(tzinfo=TZ),
+            datetime.combine(last + timedelta(days=1), time.min).replace(tzinfo=TZ))
+
+def check_booking_conflicts(lifeplanner_id: str, start: datetime, end: datetime,
+                            exclude_event_id: Optional[str] = None) -> None:
+    """409 se o horário já está reservado para o life planner (como no main.py)."""
+    conflicts = [r for r in bookings.overlapping(lifeplanner_id, start, end) if r["event_ide_google"] != exclude_event_id]
+    if conflicts:
+        raise HTTPException(status_code=409, detail=(
+            f"Horário já ocupado: conflita com o agendamento de {conflicts[0]['start_time']} a {conflicts[0]['end_time']}"
+        ))
+
+def save_booking(payload: AgendamentoPayload) -> str:
+    event_id = f"mock_event_{next(EVENT_IDS)}"
+    data = payload.model_dump()
+    data["cliente_id"] = planner_of(payload)
+    bookings.insert(booking_row(data, event_id))
+    return event_id
 
 # --- Endpoints ---
 @router.post("/slots/")
@@ -69,46 +133,170 @@ def available_slots(payload: dict = Body(...)):
         d = date.fromisoformat(date_str)
     except Exception:
         raise HTTPException(status_code=400, detail="Formato de data inválido. Use YYYY-MM-DD")
-    slots = generate_slots_for_day(d)
+    # A agenda "primary" do serviço real não recebe os agendamentos; id_lifeplanner (opcional) usa a do life planner
+    slots = availability.slots_for_day(d, busy_index(payload.get("id_lifeplanner"), *day_bounds(d, d)))
     return {"date": date_str, "slots": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in slots]}
 
+@router.post("/slots/range/")
+def available_slots_range(payload: dict = Body(...)):
+    start_str = payload.get("start_date")
+    end_str = payload.get("end_date") or start_str
+    planner_ids = list(dict.fromkeys(payload.get("life_planners") or []))
+    if not start_str or not planner_ids:
+        raise HTTPException(status_code=400, detail="Campos obrigatórios: start_date (YYYY-MM-DD), life_planners (lista de IDs)")
+    try:
+        start_d, end_d = date.fromisoformat(start_str), date.fromisoformat(end_str)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Formato de data inválido. Use YYYY-MM-DD")
+    days = (end_d - start_d).days + 1
+    if days < 1 or days > SLOTS_RANGE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Intervalo inválido: end_date >= start_date e no máximo {SLOTS_RANGE_MAX_DAYS} dias")
+    if len(planner_ids) > SLOTS_RANGE_MAX_PLANNERS:
+        raise HTTPException(status_code=400, detail=f"No máximo {SLOTS_RANGE_MAX_PLANNERS} life planners por consulta")
+
+    time_min, time_max = day_bounds(start_d, end_d)
+    result = []
+    for lp in planner_ids:
+        slots_by_day = availability.slots_between(start_d, end_d, busy_index(lp, time_min, time_max))
+        result.append({
+            "id_lifeplanner": lp,
+            "calendar": calendar_of(lp),
+            "error": None,
+            "days": [
+                {"date": d.isoformat(), "slots": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in slots_by_day[d]]}
+                for d in (start_d + timedelta(days=i) for i in range(days))
+            ],
+        })
+    return {"start_date": start_d.isoformat(), "end_date": end_d.isoformat(), "life_planners": result}
+
+@router.post("/slots/next/")
+def next_available_slots(payload: dict = Body(...)):
+    planner_ids = list(dict.fromkeys(payload.get("life_planners") or []))
+    if not planner_ids:
+        raise HTTPException(status_code=400, detail="Campo obrigatório: life_planners (lista de IDs)")
+    if len(planner_ids) > SLOTS_RANGE_MAX_PLANNERS:
+        raise HTTPException(status_code=400, detail=f"No máximo {SLOTS_RANGE_MAX_PLANNERS} life planners por consulta")
+    try:
+        after = isoparse(payload["from"]) if payload.get("from") else datetime.now(TZ)
+        count = int(payload.get("count", 5))
+        horizon_days = int(payload.get("horizon_days", 30))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Campos inválidos: from (data/hora ISO 8601), count e horizon_days (inteiros)")
+    after = as_local(after)
+    if not 1 <= count <= SLOTS_NEXT_MAX_COUNT:
+        raise HTTPException(status_code=400, detail=f"count deve estar entre 1 e {SLOTS_NEXT_MAX_COUNT}")
+    if not 1 <= horizon_days <= SLOTS_NEXT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"horizon_days deve estar entre 1 e {SLOTS_NEXT_MAX_DAYS}")
+
+    time_min = datetime.combine(after.date(), time.min).replace(tzinfo=TZ)
+    time_max = time_min + timedelta(days=horizon_days)
+    result = []
+    for lp in planner_ids:
+        slots = availability.first_available(busy_index(lp, time_min, time_max), after, count, horizon_days=horizon_days)
+        result.append({
+            "id_lifeplanner": lp,
+            "calendar": calendar_of(lp),
+            "error": None,
+            "slots": [{"start": s.isoformat(), "end": e.isoformat()} for s, e in slots],
+        })
+    return {"from": after.isoformat(), "count": count, "horizon_days": horizon_days, "life_planners": result}
+
 @router.post("/")
 def schedule_event(payload: AgendamentoPayload):
-    global EVENT_COUNTER
-    event_id = f"mock_event_{EVENT_COUNTER}"
-    EVENT_COUNTER += 1
-    MOCK_AGENDAMENTOS.append({
-        "event_id_google": event_id,
-        "summary": payload.summary,
-        "description": payload.description,
-        "start_time": payload.start_time,
-        "end_time": payload.end_time,
-        "attendee_emails": payload.attendee_emails,
-        "organizer_email": payload.organizer_email,
-        "status": "scheduled",
-        "id_lifeplanner": "mock_lp_1",
-        "cliente_celular": "123456789"
-    })
-    return {"status": "success", "event_id": event_id, "event_link": f"https://mockcalendar.com/{event_id}"}
+    check_booking_conflicts(planner_of(payload), as_local(payload.start_time), as_local(payload.end_time))
+    simulate_latency()
+    event_id = save_booking(payload)
+    return {"status": "success", "event_id": event_id, "event_link": event_link(event_id), "persistence": "saved"}
+
+@router.post("/bulk/")
+def schedule_bulk(payload: AgendamentoBulkPayload):
+    items = payload.agendamentos
+    if not items:
+        raise HTTPException(status_code=400, detail="Campo 'agendamentos' vazio")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"No máximo {BULK_MAX_ITEMS} agendamentos por lote")
+
+    simulate_latency()
+    results = []
+    batch_events = {}  # event id -> índice no lote, para apontar conflitos com itens anteriores
+    for i, item in enumerate(items):
+        lp = planner_of(item)
+        result = {"index": i, "status": None, "calendar": item.organizer_email or calendar_of(lp),
+                  "event_id": None, "event_link": None, "error": None}
+        results.append(result)
+        start, end = as_local(item.start_time), as_local(item.end_time)
+        if end <= start:
+            result.update(status="invalid", error="end_time deve ser posterior a start_time")
+            continue
+        conflicts = bookings.overlapping(lp, start, end)
+        if conflicts:
+            earlier = batch_events.get(conflicts[0]["event_ide_google"])
+            error = f"Horário conflita com o item {earlier} do lote" if earlier is not None else "Horário já ocupado na agenda"
+            result.update(status="conflict", error=error)
+            continue
+        event_id = save_booking(item)
+        batch_events[event_id] = i
+        result.update(status="success", event_id=event_id, event_link=event_link(event_id))
+
+    statuses = [r["status"] for r in results]
+    return {
+        "total": len(items),
+        "created": statuses.count("success"),
+        "conflicts": statuses.count("conflict"),
+        "failed": len(items) - statuses.count("success") - statuses.count("conflict"),
+        "persistence": "saved" if batch_events else None,
+        "results": results,
+    }
 
 @router.post("/reagendar/")
 def reschedule_event(payload: dict = Body(...)):
-    ag = next((a for a in MOCK_AGENDAMENTOS if a["id_lifeplanner"] == payload.get("id_lifeplanner")
-               and a["cliente_celular"] == payload.get("cliente_celular") and a["status"] == "scheduled"), None)
+    id_lp = payload.get("id_lifeplanner")
+    celular = payload.get("cliente_celular")
+    new_start_str = payload.get("new_start_time")
+    new_end_str = payload.get("new_end_time")
+
+    if not all([id_lp, celular, new_start_str, new_end_str]):
+        raise HTTPException(400, "Campos obrigatórios: id_lifeplanner, cliente_celular, new_start_time, new_end_time")
+
+    ag = bookings.find_active(id_lp, celular)
     if not ag:
         raise HTTPException(404, "Agendamento não encontrado")
-    ag["start_time"] = payload.get("new_start_time")
-    ag["end_time"] = payload.get("new_end_time")
-    return {"status": "success", "event_id": ag["event_id_google"], "event_link": f"https://mockcalendar.com/{ag['event_id_google']}"}
+    try:
+        new_start, new_end = as_local(isoparse(new_start_str)), as_local(isoparse(new_end_str))
+    except Exception:
+        raise HTTPException(400, "Formato de data/hora inválido. Use ISO 8601 (ex.: 2030-01-08T14:00:00-03:00)")
+    check_booking_conflicts(id_lp, new_start, new_end, exclude_event_id=ag["event_ide_google"])
+    try:
+        simulate_latency()
+        bookings.update(ag["id"], {"start_time": new_start_str, "end_time": new_end_str})
+    except Exception as e:
+        raise HTTPException(500, f"Falha ao reagendar: {e}")
+    return {"status": "success", "event_id": ag["event_ide_google"], "event_link": event_link(ag["event_ide_google"])}
 
 @router.post("/cancelar/")
 def cancel_event(payload: dict = Body(...)):
-    ag = next((a for a in MOCK_AGENDAMENTOS if a["id_lifeplanner"] == payload.get("id_lifeplanner")
-               and a["cliente_celular"] == payload.get("cliente_celular") and a["status"] == "scheduled"), None)
+    id_lp = payload.get("id_lifeplanner")
+    celular = payload.get("cliente_celular")
+
+    if not id_lp or not celular:
+        raise HTTPException(400, "Campos obrigatórios: id_lifeplanner, cliente_celular")
+
+    ag = bookings.find_active(id_lp, celular)
     if not ag:
         raise HTTPException(404, "Agendamento não encontrado")
-    ag["status"] = "canceled"
-    return {"status": "success", "event_id": ag["event_id_google"]}
+    simulate_latency()
+    bookings.cancel(ag["id"])
+    return {"status": "success", "event_id": ag["event_ide_google"]}
+
+@router.get("/stats/")
+def scheduler_stats():
+    return {"bookings": bookings.stats()}
+
+@router.post("/mock/reset/")
+def reset_mock():
+    # Entre rodadas de um teste de carga
+    bookings.clear()
+    return {"status": "success"}
 
 # --- Inclui router ---
 app.include_router(router)
@@ -0,0 +1,363 @@
+"""
+Outbox local (SQLite em modo WAL) para as gravações no Supabase.
+
+O agendamento grava a linha do Supabase no outbox (um INSERT local, com
+fsync do WAL) e responde; um worker em segundo plano envia as pendências em
+lotes, com novas tentativas e backoff exponencial. Falha do Supabase deixa de
+atrasar a resposta e de perder a linha: ela fica no arquivo até ser enviada
+(sobrevive a restarts) ou, esgotadas as tentativas, fica como 'dead' para
+inspeção e reenvio (replay).
+
+A chave de idempotência é o event_id do Google Calendar: o mesmo evento
+enfileirado duas vezes vira uma única entrada, e o escritor de cada tabela
+recebe as linhas já com a chave para não gravá-las em duplicidade quando um
+lote é reenviado. Vários workers do uvicorn podem compartilhar o arquivo:
+cada lote é reservado (lease) por quem o pega.
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from instrumentation import span
+
+# Escritor de uma tabela: grava as linhas (sem duplicar as que já estão no Supabase) ou levanta exceção
+Writer = Callable[[List[Dict[str, Any]]], None]
+
+STATUSES = ("pending", "done", "dead")
+
+
+class SupabaseOutbox:
+    def __init__(self, path: str, writers: Dict[str, Writer], batch_size: int = 100, flush_interval: float = 1.0,
+                 max_attempts: int = 10, base_backoff: float = 1.0, max_backoff: float = 300,
+                 lease_seconds: float = 60, retention_seconds: float = 7 * 86400):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.writers = writers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.owner = uuid.uuid4().hex  # identifica as reservas deste processo
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL: a entrada está no disco antes de o agendamento responder
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " event_id TEXT NOT NULL,"
+            " table_name TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL,"
+            " lease_owner TEXT,"
+            " lease_until REAL NOT NULL DEFAULT 0,"
+            " last_error TEXT,"
+            " created_at REAL NOT NULL,"
+            " flushed_at REAL,"
+            " UNIQUE (table_name, event_id))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+        self._conn.commit()
+
+        self._worker: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+        self.enqueued = 0
+        self.duplicates = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dead = 0
+
+        # Pendências de uma execução anterior (processo reiniciado) voltam a ser enviadas
+        if self.counts()["pending"]:
+            self._ensure_worker()
+
+    # --- Escrita local ---
+    def enqueue(self, table_name: str, event_id: str, row: Dict[str, Any]) -> bool:
+        """Registra a gravação pendente. False quando o event_id já estava no outbox (idempotência)."""
+        return self.enqueue_many(table_name, [(event_id, row)]) == 1
+
+    def enqueue_many(self, table_name: str, items: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """Várias gravações em uma única transação local. Retorna quantas eram novas."""
+        if table_name not in self.writers:
+            raise ValueError(f"Tabela sem escritor no outbox: {table_name}")
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO outbox (event_id, table_name, payload, next_attempt_at, created_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(event_id, table_name, json.dumps(row, default=str), now, now) for event_id, row in items],
+            )
+            self._conn.commit()
+            created = self._conn.total_changes - before
+            self.enqueued += created
+            self.duplicates += len(items) - created
+        self._ensure_worker()
+        self._wake.set()
+        return created
+
+    # --- Envio ---
+    def _claim(self, limit: int, table_name: Optional[str] = None,
+               event_ids: Optional[List[str]] = None) -> List[sqlite3.Row]:
+        """
+        Reserva (lease) até 'limit' entradas vencidas; outro processo não pega
+        as mesmas. Com 'event_ids', reserva essas entradas da tabela mesmo em
+        backoff ou 'dead' (envio pedido explicitamente).
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if event_ids:
+                    rows = self._conn.execute(
+                        "SELECT id, event_id, table_name, payload, attempts FROM outbox"
+                        f" WHERE table_name = ? AND event_id IN ({','.join('?' * len(event_ids))})"
+                        " AND status != 'done' AND lease_until <= ? ORDER BY id LIMIT ?",
+                        (table_name, *event_ids, now, limit),
+                    ).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        "SELECT id, event_id, table_name, payload, attempts FROM outbox"
+                        " WHERE status = 'pending' AND next_attempt_at <= ? AND lease_until <= ?"
+                        " ORDER BY id LIMIT ?",
+                        (now, now, limit),
+                    ).fetchall()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE outbox SET lease_owner = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                        [(self.owner, now + self.lease_seconds, row[0]) for row in rows],
+                    )
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return rows
+
+    def flush(self, limit: Optional[int] = None) -> Dict[str, int]:
+        """Envia as entradas vencidas agora, em lotes por tabela. Retorna quantas foram gravadas/falharam."""
+        result = {"flushed": 0, "failed": 0, "dead": 0}
+        remaining = limit
+        while remaining is None or remaining > 0:
+            rows = self._claim(self.batch_size if remaining is None else min(self.batch_size, remaining))
+            if not rows:
+                break
+            by_table: Dict[str, List[Any]] = {}
+            for row in rows:
+                by_table.setdefault(row[2], []).append(row)
+            for table_name, entries in by_table.items():
+                for key, value in self._send(table_name, entries).items():
+                    result[key] += value
+            if remaining is not None:
+                remaining -= len(rows)
+        return result
+
+    def flush_events(self, table_name: str, event_ids: List[str]) -> Dict[str, int]:
+        """
+        Envia agora as entradas desses event_ids (pendentes ou 'dead'), sem
+        esperar o worker nem o backoff. Entradas reservadas por outro envio em
+        andamento ficam de fora.
+        """
+        result = {"flushed": 0, "failed": 0, "dead": 0}
+        rows = self._claim(len(event_ids), table_name, event_ids) if event_ids else []
+        if rows:
+            result = self._send(table_name, rows)
+        return result
+
+    def _send(self, table_name: str, entries: List[Any]) -> Dict[str, int]:
+        writer = self.writers[table_name]
+        rows = [json.loads(payload) for _, _, _, payload, _ in entries]
+        try:
+            with span("supabase", f"outbox.flush.{table_name}"):
+                writer(rows)
+        except Exception as e:
+            if len(entries) == 1:
+                return self._failed(entries[0], e)
+            # Uma linha inválida não pode segurar o lote inteiro: reenvia uma a uma
+            print(f"ALERTA: lote de {len(entries)} gravações em '{table_name}' falhou ({e}); enviando individualmente.")
+            result = {"flushed": 0, "failed": 0, "dead": 0}
+            for entry in entries:
+                for key, value in self._send(table_name, [entry]).items():
+                    result[key] += value
+            return result
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE outbox SET status = 'done', flushed_at = ?, lease_owner = NULL, lease_until = 0, last_error = NULL"
+                " WHERE id = ?",
+                [(now, entry[0]) for entry in entries],
+            )
+            self._conn.commit()
+            self.flushed += len(entries)
+            self.batches += 1
+        return {"flushed": len(entries), "failed": 0, "dead": 0}
+
+    def _failed(self, entry: Any, error: Exception) -> Dict[str, int]:
+        entry_id, event_id, table_name, _, attempts = entry
+        attempts += 1  # já incrementado no banco pelo _claim
+        dead = attempts >= self.max_attempts
+        # Backoff exponencial com jitter, para não reenviar tudo junto quando o Supabase voltar
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, next_attempt_at = ?, lease_owner = NULL, lease_until = 0, last_error = ?"
+                " WHERE id = ?",
+                ("dead" if dead else "pending", time.time() + delay, str(error)[:1000], entry_id),
+            )
+            self._conn.commit()
+            self.failures += 1
+            self.dead += int(dead)
+        if dead:
+            print(f"ERRO CRÍTICO: gravação de '{event_id}' em '{table_name}' desistida após {attempts} tentativas: {error}")
+        else:
+            print(f"ALERTA: gravação de '{event_id}' em '{table_name}' falhou (tentativa {attempts}); nova tentativa em {delay:.1f}s: {error}")
+        return {"flushed": 0, "failed": 1, "dead": int(dead)}
+
+    # --- Inspeção e replay ---
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        counts = {status: 0 for status in STATUSES}
+        counts.update(dict(rows))
+        return counts
+
+    def entries(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Entradas mais antigas primeiro (todas as pendentes/mortas, ou de um status)."""
+        query = ("SELECT id, event_id, table_name, payload, status, attempts, next_attempt_at, last_error, created_at, flushed_at"
+                 " FROM outbox")
+        params: List[Any] = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        else:
+            query += " WHERE status != 'done'"
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        keys = ("id", "event_id", "table", "payload", "status", "attempts", "next_attempt_at", "last_error", "created_at", "flushed_at")
+        result = []
+        for row in rows:
+            entry = dict(zip(keys, row))
+            entry["payload"] = json.loads(entry["payload"])
+            result.append(entry)
+        return result
+
+    def pending_rows(self, table_name: str, match: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Entradas ainda não gravadas (pendentes ou 'dead') da tabela cujo payload tem os valores de 'match'."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT event_id, payload, status FROM outbox WHERE table_name = ? AND status != 'done' ORDER BY id",
+                (table_name,),
+            ).fetchall()
+        result = []
+        for event_id, payload, status in rows:
+            row = json.loads(payload)
+            if all(str(row.get(key)) == str(value) for key, value in match.items()):
+                result.append({"event_id": event_id, "status": status, "payload": row})
+        return result
+
+    def replay(self, ids: Optional[List[int]] = None, event_ids: Optional[List[str]] = None,
+               status: str = "dead") -> int:
+        """
+        Devolve entradas à fila para envio imediato, zerando as tentativas: as
+        de 'ids'/'event_ids' (qualquer status, inclusive 'done') ou, sem
+        filtro, todas as do status indicado. Retorna quantas foram reenfileiradas.
+        """
+        now = time.time()
+        query = "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, lease_owner = NULL, lease_until = 0"
+        params: List[Any] = [now]
+        if ids or event_ids:
+            conditions = []
+            if ids:
+                conditions.append(f"id IN ({','.join('?' * len(ids))})")
+                params.extend(ids)
+            if event_ids:
+                conditions.append(f"event_id IN ({','.join('?' * len(event_ids))})")
+                params.extend(event_ids)
+            query += " WHERE " + " OR ".join(conditions)
+        else:
+            query += " WHERE status = ?"
+            params.append(status)
+        with self._lock:
+            changed = self._conn.execute(query, params).rowcount
+            self._conn.commit()
+        if changed:
+            self._ensure_worker()
+            self._wake.set()
+        return changed
+
+    def purge(self) -> int:
+        """Remove entradas já gravadas há mais de retention_seconds."""
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM outbox WHERE status = 'done' AND flushed_at < ?", (time.time() - self.retention_seconds,)
+            ).rowcount
+            self._conn.commit()
+        return removed
+
+    # --- Worker em segundo plano ---
+    def _ensure_worker(self) -> None:
+        if self.flush_interval <= 0 or self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="supabase-outbox", daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        last_purge = 0.0
+        while not self._stop.is_set():
+            # Acorda com um enqueue/replay ou a cada flush_interval (entradas em backoff)
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+                if time.time() - last_purge > 3600:
+                    self.purge()
+                    last_purge = time.time()
+            except Exception as e:
+                print(f"ERRO: worker do outbox do Supabase falhou: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+            self._worker = None
+        self._stop = threading.Event()
+
+    def stats(self) -> Dict[str, Any]:
+        counts = self.counts()
+        with self._lock:
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM outbox WHERE status = 'pending'").fetchone()[0]
+            return {
+                "path": self.path,
+                "entries": counts,
+                "oldest_pending_age_seconds": round(time.time() - oldest, 3) if oldest else None,
+                "worker_running": self._worker is not None,
+                "enqueued": self.enqueued,
+                "duplicates": self.duplicates,
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "failures": self.failures,
+                "dead": self.dead,
+            }
@@ -1,35 +1,105 @@
-from supabase import create_client, Client
-from typing import Optional, Dict, Any
+from typing import TYPE_CHECKING, Optional, Dict, Any, List
 import os # ESSENCIAL
-from datetime import datetime
-import json
+import threading
 from dotenv import load_dotenv
+from instrumentation import register_gauge, span
+from ttl_cache import TTLCache
+
+if TYPE_CHECKING:
+    # O pacote supabase é pesado: importado só quando o cliente é criado
+    from supabase import Client
 
 # Carrega variáveis de ambiente, garantindo que o get_supabase_client funcione 
 # mesmo se chamado isoladamente, embora main.py já faça isso.
 load_dotenv() 
 
-# --- Cliente de Conexão ---
-def get_supabase_client() -> Client:
-    url: str = os.getenv("SUPABASE_URL")
-    key: str = os.getenv("SUPABASE_KEY")
-    
-    if not url or not key:
-        raise Exception("Credenciais Supabase (SUPABASE_URL/SUPABASE_KEY) não estão definidas no ambiente.")
-        
-    return create_client(url, key)
+# Conexões HTTP (keep-alive/HTTP2) do cliente compartilhado com o PostgREST
+SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+SUPABASE_TIMEOUT_SECONDS = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "30"))
+# Cache dos registros de 'life_planners' (0 desativa); ids inexistentes ficam menos tempo
+LIFEPLANNER_CACHE_TTL_SECONDS = float(os.getenv("LIFEPLANNER_CACHE_TTL_SECONDS", "300"))
+LIFEPLANNER_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("LIFEPLANNER_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+LIFEPLANNER_CACHE_SIZE = int(os.getenv("LIFEPLANNER_CACHE_SIZE", "1024"))
+
+# --- Cliente de Conexão (um por processo) ---
+_client: Optional["Client"] = None
+_client_lock = threading.Lock()
+
+def get_supabase_client() -> "Client":
+    """Cliente Supabase compartilhado: um pool de conexões HTTP por processo em vez de um cliente por chamada."""
+    global _client
+    if _client is not None:
+        return _client
+    with _client_lock:
+        if _client is None:
+            url: str = os.getenv("SUPABASE_URL")
+            key: str = os.getenv("SUPABASE_KEY")
+
+            if not url or not key:
+                raise Exception("Credenciais Supabase (SUPABASE_URL/SUPABASE_KEY) não estão definidas no ambiente.")
+
+            import httpx
+            from supabase import ClientOptions, create_client
+
+            # httpx.Client é thread-safe: as threads do FastAPI compartilham o mesmo pool
+            http_client = httpx.Client(
+                http2=True,
+                follow_redirects=True,
+                timeout=SUPABASE_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=SUPABASE_POOL_SIZE, max_keepalive_connections=SUPABASE_POOL_SIZE),
+            )
+            client = create_client(url, key, options=ClientOptions(httpx_client=http_client))
+            # O cliente PostgREST é criado sob demanda sem lock; cria agora, uma única vez
+            client.postgrest
+            _client = client
+    return _client
+
+# --- Cache de Life Planners ---
+def _load_lifeplanner(lifeplanner_id: str) -> Optional[Dict[str, Any]]:
+    supabase = get_supabase_client()
+    with span("supabase", "life_planners.select"):
+        response = supabase.table("life_planners").select("*").eq("id", lifeplanner_id).limit(1).execute()
+    return response.data[0] if response.data else None
+
+lifeplanner_cache = TTLCache(
+    _load_lifeplanner,
+    ttl=LIFEPLANNER_CACHE_TTL_SECONDS,
+    negative_ttl=LIFEPLANNER_CACHE_NEGATIVE_TTL_SECONDS,
+    max_entries=LIFEPLANNER_CACHE_SIZE,
+)
+
+def get_lifeplanner(lifeplanner_id: str) -> Optional[Dict[str, Any]]:
+    """Registro da tabela 'life_planners' (read-through no cache; None se o id não existe)."""
+    return lifeplanner_cache.get(lifeplanner_id)
+
+def _load_lifeplanners(lifeplanner_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    supabase = get_supabase_client()
+    with span("supabase", "life_planners.select_many"):
+        response = supabase.table("life_planners").select("*").in_("id", lifeplanner_ids).execute()
+    return {row["id"]: row for row in response.data or []}
+
+def get_lifeplanners(lifeplanner_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+    """Vários life planners: os que não estão em cache vêm de uma única consulta (id -> registro ou None)."""
+    return lifeplanner_cache.get_many(lifeplanner_ids, _load_lifeplanners)
+
+def invalidate_lifeplanner(lifeplanner_id: Optional[str] = None) -> int:
+    """Descarta o registro em cache (ou todos): usar após alterar a tabela 'life_planners'."""
+    return lifeplanner_cache.invalidate(lifeplanner_id)
+
+register_gauge("scheduler_lifeplanner_cache_hit_ratio", "Taxa de acerto do cache de life planners.",
+               lambda: lifeplanner_cache.stats()["hit_rate"])
+register_gauge("scheduler_lifeplanner_cache_events", "Acertos, faltas, cargas agrupadas (single-flight) e consultas.",
+               lambda: {k: v for k, v in lifeplanner_cache.stats().items() if k in ("hits", "misses", "coalesced", "loads", "errors")},
+               "event")
 
 # --- Função de Busca de Email (Vendedor) ---
 def get_lifeplanner_email(lifeplanner_id: str) -> Optional[str]:
     """Busca o email de calendário do Life Planner na tabela 'life_planners' (Escalável)."""
-    supabase = get_supabase_client()
     try:
-        # Busca na tabela 'life_planners' usando o ID do Vendedor
-        response = supabase.table("life_planners").select("email_calendario").eq("id", lifeplanner_id).limit(1).execute()
-        
-        data = response.data
-        if data and len(data) > 0 and data[0].get("email_calendario"):
-            return data[0]["email_calendario"]
+        # Busca na tabela 'life_planners' usando o ID do Vendedor (via cache)
+        record = get_lifeplanner(lifeplanner_id)
+        if record and record.get("email_calendario"):
+            return record["email_calendario"]
         
         # Fallback de segurança
         print(f"ALERTA: ID do Life Planner '{lifeplanner_id}' não encontrado na tabela 'life_planners'. Usando Fallback.")
@@ -38,28 +108,3 @@ def get_lifeplanner_email(lifeplanner_id: str) -> Optional[str]:
     except Exception as e:
         print(f"ERRO SUPABASE: Falha ao buscar email para {lifeplanner_id}: {e}")
         return "jjsales003@gmail.com"
-
-# --- Função de Salvamento (Agendamentos Ativos) ---
-def save_agendamento(agendamento_data: Dict[str, Any], event_id: str, event_link: str) -> None:
-    """Salva os dados do agendamento finalizado na tabela agendamentos_ativos."""
-    supabase = get_supabase_client()
-    
-    payload = {
-        # O 'cliente_id' do payload é o 'id_lifeplanner' na tabela
-        "id_lifeplanner": agendamento_data["cliente_id"],         
-        "cliente_celular": agendamento_data["cliente_celular"],   
-        "summary": agendamento_data["summary"],
-        "description": agendamento_data["description"],
-        "start_time": agendamento_data["start_time"].isoformat(), 
-        "end_time": agendamento_data["end_time"].isoformat(),
-        "event_ide_google": event_id,
-        "status": "AGENDADO", 
-    }
-    
-    try:
-        supabase.table("agendamentos_ativos").insert(payload).execute()
-        
-    except Exception as e:
-        print("ERRO CRÍTICO: Falha ao salvar no Supabase 'agendamentos_ativos'.")
-        print("Payload Enviado:", json.dumps(payload, indent=2))
-        print(f"Erro da API Supabase: {e}")
\ No newline at end of file
@@ -0,0 +1,187 @@
+"""
+Cache read-through com TTL, LRU limitado e carregamento single-flight.
+
+Em uma rajada de agendamentos para o mesmo life planner, só a primeira
+thread consulta o Supabase; as demais esperam o resultado dessa consulta em
+vez de dispararem as suas. Registros ausentes (loader retorna None) também
+são guardados, com um TTL menor. Erros do loader não são guardados: todas as
+threads que esperavam recebem a exceção e a próxima chamada tenta de novo.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error", "generation")
+
+    def __init__(self, generation: int):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.generation = generation
+
+
+class TTLCache:
+    def __init__(self, loader: Callable[[Hashable], Any], ttl: float = 300, negative_ttl: Optional[float] = None,
+                 max_entries: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.loader = loader
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.max_entries = max_entries
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, _Flight] = {}
+        # Incrementada a cada invalidação: carga iniciada antes dela não é guardada
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.loads = 0
+        self.errors = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_entries > 0
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight(self._generation)
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = self.loader(key)
+        except BaseException as e:
+            flight.error = e
+            with self._lock:
+                self.errors += 1
+            raise
+        else:
+            self._store(key, flight)
+        finally:
+            with self._lock:
+                self.loads += 1
+                self._inflight.pop(key, None)
+            flight.done.set()
+        return flight.value
+
+    def get_many(self, keys: Iterable[Hashable],
+                 batch_loader: Callable[[List[Hashable]], Dict[Hashable, Any]]) -> Dict[Hashable, Any]:
+        """
+        Vários registros de uma vez: os ausentes do cache são carregados com uma
+        única chamada a batch_loader (chaves fora do retorno = None); chaves já
+        em carregamento por outra thread são esperadas, não recarregadas.
+        """
+        results: Dict[Hashable, Any] = {}
+        own: Dict[Hashable, _Flight] = {}
+        waiting: Dict[Hashable, _Flight] = {}
+        with self._lock:
+            now = self.clock()
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    results[key] = entry[1]
+                    continue
+                self._entries.pop(key, None)
+                self.misses += 1
+                flight = self._inflight.get(key)
+                if flight is None:
+                    own[key] = self._inflight[key] = _Flight(self._generation)
+                else:
+                    self.coalesced += 1
+                    waiting[key] = flight
+
+        if own:
+            try:
+                loaded = batch_loader(list(own))
+            except BaseException as e:
+                for flight in own.values():
+                    flight.error = e
+                with self._lock:
+                    self.errors += 1
+                raise
+            else:
+                for key, flight in own.items():
+                    flight.value = results[key] = loaded.get(key)
+                    self._store(key, flight)
+            finally:
+                with self._lock:
+                    self.loads += 1
+                    for key, flight in own.items():
+                        self._inflight.pop(key, None)
+                for flight in own.values():
+                    flight.done.set()
+
+        for key, flight in waiting.items():
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            results[key] = flight.value
+        return results
+
+    def _store(self, key: Hashable, flight: _Flight) -> None:
+        ttl = self.ttl if flight.value is not None else self.negative_ttl
+        if not self.enabled or ttl <= 0:
+            return
+        with self._lock:
+            if flight.generation != self._generation:
+                return
+            self._entries[key] = (self.clock() + ttl, flight.value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None) -> int:
+        """Remove uma chave (ou todas, com key=None). Retorna quantas entradas saíram."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if key is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            return 1 if self._entries.pop(key, None) is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "negative_ttl_seconds": self.negative_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "loads": self.loads,
+                "errors": self.errors,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
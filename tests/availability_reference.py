@@ -0,0 +1,95 @@
+"""
+Cópia da implementação original dos slots (scheduler_service/main.py antes
+do motor de disponibilidade), usada como referência pela verificação de
+equivalência em tests/test_availability.py e pelo benchmark de tempos em
+benchmarks/availability_bench.py. Não deve acompanhar mudanças do motor:
+ela é a especificação do comportamento que o motor tem de reproduzir.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from availability import HolidayCalendar
+
+TZ = ZoneInfo("America/Sao_Paulo")
+Interval = Tuple[datetime, datetime]
+
+# BUSINESS_HOURS do serviço quando a implementação original foi substituída
+SERVICE_HOURS = {
+    0: ("13:00", "18:00"),
+    1: ("11:00", "18:00"),
+    2: ("11:00", "18:00"),
+    3: ("11:00", "18:00"),
+    4: ("11:00", "13:00"),
+    5: None,
+    6: None,
+}
+
+
+class Reference:
+    def __init__(self, business_hours: Dict[int, Optional[Tuple[str, str]]], holidays: HolidayCalendar):
+        self.business_hours = business_hours
+        self.holidays = holidays
+
+    def get_business_window_for_date(self, d: date) -> Optional[Interval]:
+        rule = self.business_hours.get(d.weekday())
+        if not rule:
+            return None
+        start_str, end_str = rule
+        start_t = datetime.strptime(start_str, "%H:%M").time()
+        end_t = datetime.strptime(end_str, "%H:%M").time()
+        start_dt = datetime.combine(d, start_t).replace(tzinfo=TZ)
+        end_dt = datetime.combine(d, end_t).replace(tzinfo=TZ)
+        return start_dt, end_dt
+
+    @staticmethod
+    def merge_intervals(intervals: List[Interval]) -> List[Interval]:
+        if not intervals:
+            return []
+        intervals = sorted(intervals, key=lambda x: x[0])
+        merged = []
+        cur_s, cur_e = intervals[0]
+        for s, e in intervals[1:]:
+            if s <= cur_e:
+                cur_e = max(cur_e, e)
+            else:
+                merged.append((cur_s, cur_e))
+                cur_s, cur_e = s, e
+        merged.append((cur_s, cur_e))
+        return merged
+
+    def slots_from_busy(self, d: date, busy: List[Interval]) -> List[Interval]:
+        if self.holidays.is_holiday(d):
+            return []
+        window = self.get_business_window_for_date(d)
+        if not window:
+            return []
+        start_dt, end_dt = window
+        busy = self.merge_intervals([(s, e) for s, e in busy if s < end_dt and e > start_dt])
+
+        free_intervals = []
+        cur = start_dt
+        for b_s, b_e in busy:
+            if b_s > cur:
+                free_intervals.append((cur, b_s))
+            cur = max(cur, b_e)
+        if cur < end_dt:
+            free_intervals.append((cur, end_dt))
+
+        slots = []
+        for f_s, f_e in free_intervals:
+            iter_start = f_s
+            while (iter_start + timedelta(minutes=60)) <= f_e:
+                slots.append((iter_start, iter_start + timedelta(minutes=60)))
+                iter_start += timedelta(minutes=60)
+            if (f_e - iter_start) >= timedelta(minutes=50):
+                slots.append((iter_start, iter_start + timedelta(minutes=50)))
+        return slots
+
+    def first_available(self, busy: List[Interval], after: datetime, count: int, horizon_days: int) -> List[Interval]:
+        found: List[Interval] = []
+        for i in range(horizon_days):
+            found.extend(s for s in self.slots_from_busy(after.date() + timedelta(days=i), busy) if s[0] >= after)
+            if len(found) >= count:
+                break
+        return found[:count]
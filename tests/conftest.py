@@ -0,0 +1,18 @@
+"""
+Configuração comum dos testes: mesmos caminhos de import do serviço (os
+módulos do scheduler_service importam os vizinhos pelo nome) e nenhum
+arquivo em .cache nem thread em segundo plano.
+"""
+import os
+import sys
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, "scheduler_service"))
+
+os.environ.setdefault("OPENAI_API_KEY", "fake-key")
+os.environ.setdefault("FAISS_INDEX_POLL_SECONDS", "0")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+os.environ.setdefault("SUPABASE_OUTBOX_PATH", os.path.join(tempfile.mkdtemp(prefix="tests-outbox-"), "outbox.sqlite"))
+os.environ.setdefault("CALENDAR_SYNC_REFRESH_SECONDS", "0")
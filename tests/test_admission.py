@@ -0,0 +1,74 @@
+"""
+Controle de admissão: com as vagas ocupadas e a fila cheia a requisição é
+recusada na hora (429); quem espera além do queue_timeout recebe 503. A vaga
+é devolvida ao fim de cada requisição, inclusive quando o handler falha.
+"""
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+
+from rag_service.admission import AdmissionController, AdmissionMiddleware
+
+
+def make_app(controller: AdmissionController, release: asyncio.Event) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/ask")
+    async def ask():
+        await release.wait()
+        return {"answer": "ok"}
+
+    @app.post("/ask/batch")
+    async def ask_batch():
+        raise RuntimeError("falha no handler")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+
+    app.add_middleware(AdmissionMiddleware, controller=controller, paths=["/ask", "/ask/batch"])
+    return app
+
+
+def test_full_queue_gets_429_and_queue_timeout_gets_503():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=1, queue_timeout=0.2)
+        release = asyncio.Event()
+        transport = httpx.ASGITransport(app=make_app(controller, release))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            running = asyncio.create_task(client.post("/ask"))
+            await asyncio.sleep(0.02)
+            queued = asyncio.create_task(client.post("/ask"))
+            await asyncio.sleep(0.02)
+            assert controller.stats()["active"] == 1 and controller.stats()["waiting"] == 1
+
+            rejected = await client.post("/ask")
+            assert rejected.status_code == 429 and rejected.headers["Retry-After"] == "1"
+            # Rotas fora do caminho RAG não passam pelo controle
+            assert (await client.get("/health")).status_code == 200
+
+            assert (await queued).status_code == 503
+            release.set()
+            assert (await running).status_code == 200
+            assert (await client.post("/ask")).status_code == 200
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["admitted"], stats["rejected_queue_full"], stats["rejected_timeout"]) == (2, 1, 1)
+    assert stats["active"] == 0 and stats["waiting"] == 0
+
+
+def test_slot_is_released_when_the_handler_fails():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=0, queue_timeout=0.2)
+        release = asyncio.Event()
+        release.set()
+        transport = httpx.ASGITransport(app=make_app(controller, release), raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert (await client.post("/ask/batch")).status_code == 500
+            assert (await client.post("/ask")).status_code == 200
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["active"] == 0 and stats["admitted"] == 2
@@ -0,0 +1,50 @@
+"""
+Conversão do index.faiss com python -m rag_service.ann: o manifest passa a
+registrar o novo tipo (a próxima ingestão o mantém) e VERSION é criado ou
+trocado para o watcher do serviço recarregar.
+"""
+import json
+import os
+
+import faiss
+import numpy as np
+
+from rag_service import ann
+from rag_service.index_manager import MANIFEST_FILE, VERSION_FILE, compute_index_version
+
+
+def write_flat_index(path: str, n: int = 200, dim: int = 16) -> None:
+    vectors = np.random.default_rng(0).standard_normal((n, dim)).astype("float32")
+    index = faiss.IndexFlat(dim)
+    index.add(vectors)
+    faiss.write_index(index, os.path.join(path, "index.faiss"))
+
+
+def read(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def test_conversion_records_index_type_in_manifest_and_bumps_version(tmp_path):
+    write_flat_index(str(tmp_path))
+    manifest = {"format": 1, "version": "20250101000000-abcd1234", "settings": {"embedding_model": "m"},
+                "index_type": "flat", "files": {}}
+    (tmp_path / MANIFEST_FILE).write_text(json.dumps(manifest), encoding="utf-8")
+    (tmp_path / VERSION_FILE).write_text(manifest["version"], encoding="utf-8")
+
+    ann.main(["--index", str(tmp_path), "--type", "hnsw"])
+
+    converted = json.loads(read(str(tmp_path / MANIFEST_FILE)))
+    assert converted["index_type"] == "hnsw"
+    assert converted["settings"] == manifest["settings"] and converted["files"] == {}
+    version = read(str(tmp_path / VERSION_FILE))
+    assert version != manifest["version"] and version == converted["version"]
+    assert ann.index_type_of(faiss.read_index(str(tmp_path / "index.faiss"))) == "hnsw"
+    assert os.path.exists(tmp_path / ann.FLAT_MASTER_FILE)
+
+
+def test_conversion_creates_version_file(tmp_path):
+    write_flat_index(str(tmp_path))
+    ann.main(["--index", str(tmp_path), "--type", "sq_fp16"])
+    assert compute_index_version(str(tmp_path)) == read(str(tmp_path / VERSION_FILE))
+    assert read(str(tmp_path / VERSION_FILE)).endswith("-sq_fp16")
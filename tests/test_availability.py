@@ -0,0 +1,110 @@
+"""
+Motor de disponibilidade (scheduler_service/availability.py) contra a
+implementação original dos slots (tests/availability_reference.py), com
+casos aleatórios de semente fixa.
+
+Cada caso sorteia um horário comercial (o BUSINESS_HOURS do serviço ou um
+aleatório), um dia ou intervalo de dias e uma lista de compromissos (inclusive
+sobrepostos, atravessando a meia-noite e, em parte dos casos, fora da grade de
+minutos). O resultado de slots_for_day, slots_between e first_available tem de
+ser idêntico ao da versão original, aplicada dia a dia com o mesmo calendário
+de feriados. Uma divergência mostra o caso e a semente.
+"""
+import random
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from availability import AvailabilityEngine, HolidayCalendar, IntervalIndex
+from tests.availability_reference import SERVICE_HOURS, TZ, Interval, Reference
+
+CASES_PER_SEED = 300
+
+
+def random_hours(rng: random.Random) -> Dict[int, Optional[Tuple[str, str]]]:
+    if rng.random() < 0.5:
+        return SERVICE_HOURS
+    hours: Dict[int, Optional[Tuple[str, str]]] = {}
+    for weekday in range(7):
+        if rng.random() < 0.2:
+            hours[weekday] = None
+            continue
+        start = rng.randrange(0, 23 * 60)
+        end = rng.randrange(start + 1, 24 * 60)
+        hours[weekday] = (f"{start // 60:02d}:{start % 60:02d}", f"{end // 60:02d}:{end % 60:02d}")
+    return hours
+
+
+def random_busy(rng: random.Random, first: date, days: int, unaligned: bool) -> List[Interval]:
+    base = datetime.combine(first - timedelta(days=1), time.min).replace(tzinfo=TZ)
+    busy = []
+    for _ in range(rng.randrange(0, 4 + 3 * days)):
+        start = base + timedelta(minutes=rng.randrange(0, (days + 2) * 1440))
+        duration = timedelta(minutes=rng.choice([rng.randrange(1, 120), 30, 60, 90, rng.randrange(1, 2000)]))
+        if unaligned and rng.random() < 0.3:
+            start += timedelta(seconds=rng.randrange(1, 60), microseconds=rng.randrange(0, 1000000))
+        if rng.random() < 0.05:
+            duration = timedelta(0)  # duração zero: não ocupa, mas divide a janela livre
+        # Fim antes do início não é gerado: o Google Calendar rejeita esses eventos
+        busy.append((start, start + duration))
+    return busy
+
+
+def test_holidays():
+    calendar = HolidayCalendar(include_optional=True)
+    expected = [
+        date(2025, 3, 3), date(2025, 3, 4), date(2025, 4, 18), date(2025, 6, 19), date(2025, 11, 20),
+        date(2026, 2, 16), date(2026, 2, 17), date(2026, 4, 3), date(2026, 6, 4), date(2024, 3, 29),
+        date(2027, 3, 26), date(2030, 1, 1), date(2030, 12, 25),
+    ]
+    assert [d for d in expected if not calendar.is_holiday(d)] == []
+    # Consciência Negra só é feriado nacional desde 2024
+    assert not calendar.is_holiday(date(2023, 11, 20))
+    assert HolidayCalendar(extra=[date(2025, 1, 25)]).is_holiday(date(2025, 1, 25))
+
+
+def test_optional_holidays_are_business_days_by_default():
+    # Carnaval e Corpus Christi são pontos facultativos: só fecham a agenda com include_optional
+    calendar = HolidayCalendar()
+    assert not calendar.is_holiday(date(2025, 3, 4))
+    assert not calendar.is_holiday(date(2026, 6, 4))
+    assert calendar.is_holiday(date(2025, 4, 18))
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3, 4])
+def test_engine_matches_reference(seed):
+    rng = random.Random(seed)
+    utc = ZoneInfo("UTC")
+    for case in range(CASES_PER_SEED):
+        hours = random_hours(rng)
+        holidays = HolidayCalendar(include_optional=rng.random() < 0.7)
+        engine = AvailabilityEngine(hours, TZ, holidays)
+        reference = Reference(hours, holidays)
+
+        first = date(2020, 1, 1) + timedelta(days=rng.randrange(0, 16 * 365))
+        days = rng.choice([1, 1, 2, 7, rng.randrange(1, 70)])
+        unaligned = rng.random() < 0.2
+        busy = random_busy(rng, first, days, unaligned)
+        # Parte dos eventos chega ao índice em UTC (como na resposta do freebusy); a versão
+        # original sempre recebia os intervalos já convertidos para o fuso do serviço
+        index = IntervalIndex([(s.astimezone(utc), e.astimezone(utc)) if rng.random() < 0.5 else (s, e) for s, e in busy], TZ)
+        context = f"seed={seed} caso={case} first={first} days={days} hours={hours} busy={busy}"
+
+        got = engine.slots_between(first, first + timedelta(days=days - 1), index)
+        for i in range(days):
+            d = first + timedelta(days=i)
+            expected = reference.slots_from_busy(d, busy)
+            assert got[d] == expected, f"slots_between divergiu em {d}\n{context}"
+            if i == 0:
+                assert engine.slots_for_day(d, index) == expected, f"slots_for_day divergiu\n{context}"
+
+        after = datetime.combine(first, time.min).replace(tzinfo=TZ) + timedelta(minutes=rng.randrange(0, 1440))
+        if unaligned and rng.random() < 0.5:
+            after += timedelta(seconds=rng.randrange(1, 60))
+        count = rng.randrange(1, 12)
+        horizon = rng.randrange(1, days + 40)
+        got_first = engine.first_available(index, after, count, horizon, chunk_days=rng.choice([1, 7, 31]))
+        expected_first = reference.first_available(busy, after, count, horizon)
+        assert got_first == expected_first, f"first_available divergiu\n{context} after={after}"
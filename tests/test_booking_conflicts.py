@@ -0,0 +1,107 @@
+"""
+Dupla reserva: agendar, reagendar e o /bulk/ recusam um horário que já tem
+agendamento ativo do mesmo life planner, esteja ele no Supabase ou ainda no
+outbox.
+"""
+from datetime import date, datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import scheduler_service.main as scheduler
+import supabase_supabase
+from benchmarks.fakes import FakeCalendarService, FakeSupabaseClient
+from bookings import STATUS_ACTIVE, TABLE as BOOKINGS_TABLE
+from outbox import SupabaseOutbox
+
+# Quarta-feira fora de feriados (janela 11h-18h)
+DAY = date(2030, 1, 9)
+PLANNERS = {"lp-a": "lpa@agenda.fake", "lp-b": "lpb@agenda.fake"}
+
+
+def at(hour: int, minutes: int = 0) -> str:
+    return datetime(DAY.year, DAY.month, DAY.day, hour, minutes).isoformat() + "-03:00"
+
+
+def booking(planner: str, phone: str, start: str, end: str) -> dict:
+    return {
+        "summary": "Reunião de planejamento",
+        "description": "Teste",
+        "start_time": start,
+        "end_time": end,
+        "attendee_emails": ["cliente@exemplo.fake"],
+        "cliente_id": planner,
+        "cliente_celular": phone,
+    }
+
+
+@pytest.fixture
+def db() -> FakeSupabaseClient:
+    return FakeSupabaseClient(latency=0)
+
+
+@pytest.fixture
+def client(monkeypatch: pytest.MonkeyPatch, tmp_path, db: FakeSupabaseClient) -> TestClient:
+    calendar = FakeCalendarService(latency=0)
+    db.tables["life_planners"] = [{"id": lp, "email_calendario": email} for lp, email in PLANNERS.items()]
+    for email in PLANNERS.values():
+        # Agenda existente (o freebusy devolve notFound para agendas desconhecidas)
+        calendar.add_event(email, "2030-01-07T08:00:00-03:00", "2030-01-07T09:00:00-03:00")
+    monkeypatch.setattr(scheduler, "get_calendar_service", lambda organizer_email=None: calendar)
+    monkeypatch.setattr(scheduler, "get_supabase_client", lambda: db)
+    monkeypatch.setattr(supabase_supabase, "get_supabase_client", lambda: db)
+    # Outbox próprio e sem worker: as linhas ficam pendentes até o flush() do teste
+    monkeypatch.setattr(scheduler, "outbox", SupabaseOutbox(
+        str(tmp_path / "outbox.sqlite"), {BOOKINGS_TABLE: lambda rows: scheduler.bookings.insert_many(rows)},
+        flush_interval=0,
+    ))
+    scheduler.invalidate_lifeplanner(None)
+    return TestClient(scheduler.app)
+
+
+def test_schedule_rejects_overlap_pending_or_saved(client):
+    assert client.post("/agendar/", json=booking("lp-a", "5511900000001", at(11), at(12))).status_code == 200
+
+    # Ainda no outbox
+    response = client.post("/agendar/", json=booking("lp-a", "5511900000002", at(11, 30), at(12, 30)))
+    assert response.status_code == 409, response.text
+    # Já no Supabase
+    assert scheduler.outbox.flush()["flushed"] == 1
+    assert client.post("/agendar/", json=booking("lp-a", "5511900000002", at(11, 30), at(12, 30))).status_code == 409
+
+    # Horário contíguo e outro life planner no mesmo horário são aceitos
+    assert client.post("/agendar/", json=booking("lp-a", "5511900000002", at(12), at(13))).status_code == 200
+    assert client.post("/agendar/", json=booking("lp-b", "5511900000003", at(11), at(12))).status_code == 200
+
+
+def test_reschedule_rejects_overlap_but_not_its_own_slot(client):
+    assert client.post("/agendar/", json=booking("lp-a", "5511900000001", at(11), at(12))).status_code == 200
+    assert client.post("/agendar/", json=booking("lp-a", "5511900000002", at(14), at(15))).status_code == 200
+
+    move = {"id_lifeplanner": "lp-a", "cliente_celular": "5511900000002"}
+    response = client.post("/agendar/reagendar/", json={**move, "new_start_time": at(11, 30), "new_end_time": at(12, 30)})
+    assert response.status_code == 409, response.text
+    # Sobrepor o próprio horário atual não é conflito
+    response = client.post("/agendar/reagendar/", json={**move, "new_start_time": at(14, 30), "new_end_time": at(15, 30)})
+    assert response.status_code == 200, response.text
+    response = client.post("/agendar/reagendar/", json={**move, "new_start_time": "amanhã", "new_end_time": at(16)})
+    assert response.status_code == 400
+
+
+def test_bulk_marks_items_that_overlap_existing_bookings(client, db):
+    # Agendamento só no Supabase (evento criado em outra agenda): o freebusy não o vê, o repositório sim
+    db.tables[BOOKINGS_TABLE] = [{
+        "id": "ag-1", "id_lifeplanner": "lp-a", "cliente_celular": "5511900000001", "event_ide_google": "ev-1",
+        "start_time": at(11), "end_time": at(12), "status": STATUS_ACTIVE,
+    }]
+
+    response = client.post("/agendar/bulk/", json={"agendamentos": [
+        booking("lp-a", "5511900000002", at(11, 30), at(12, 30)),
+        booking("lp-a", "5511900000003", at(13), at(14)),
+        booking("lp-b", "5511900000004", at(11), at(12)),
+    ]})
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert [r["status"] for r in body["results"]] == ["conflict", "success", "success"]
+    assert "agendamento" in body["results"][0]["error"]
+    assert (body["created"], body["conflicts"]) == (2, 1)
@@ -0,0 +1,108 @@
+"""
+O /slots/ reflete agendar/reagendar/cancelar na hora, pela escrita direta no
+cache de sincronização, sem esperar uma nova sincronização com o Calendar.
+Um id_lifeplanner desconhecido é 404, em vez de cair na agenda de fallback.
+"""
+from datetime import date, datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import scheduler_service.main as scheduler
+import supabase_supabase
+from benchmarks.fakes import FakeCalendarService, FakeSupabaseClient
+
+# Terça-feira fora de feriados (janela 11h-18h)
+DAY = date(2030, 1, 8)
+PLANNER = "lp-0"
+PLANNER_CALENDAR = "lp0@agenda.fake"
+
+
+def at(hour: int) -> str:
+    return datetime(DAY.year, DAY.month, DAY.day, hour).isoformat() + "-03:00"
+
+
+def booking(phone: str, hour: int) -> dict:
+    return {
+        "summary": "Reunião de planejamento",
+        "description": "Teste",
+        "start_time": at(hour),
+        "end_time": at(hour + 1),
+        "attendee_emails": ["cliente@exemplo.fake"],
+        "cliente_id": PLANNER,
+        "cliente_celular": phone,
+    }
+
+
+def make_client(monkeypatch: pytest.MonkeyPatch, primary_id: str = "primary"):
+    calendar = FakeCalendarService(latency=0, primary_id=primary_id)
+    db = FakeSupabaseClient(latency=0)
+    db.tables["life_planners"] = [{"id": PLANNER, "email_calendario": PLANNER_CALENDAR}]
+    monkeypatch.setattr(scheduler, "get_calendar_service", lambda organizer_email=None: calendar)
+    monkeypatch.setattr(scheduler, "get_supabase_client", lambda: db)
+    monkeypatch.setattr(supabase_supabase, "get_supabase_client", lambda: db)
+    # Nenhuma sincronização por defasagem durante o teste
+    monkeypatch.setattr(scheduler.calendar_sync, "max_staleness", 3600)
+    scheduler.calendar_sync.invalidate()
+    scheduler.invalidate_lifeplanner(None)
+    return TestClient(scheduler.app), calendar
+
+
+def slot_starts(client: TestClient, **payload) -> list:
+    response = client.post("/agendar/slots/", json={"date": DAY.isoformat(), **payload})
+    assert response.status_code == 200, response.text
+    return [slot["start"] for slot in response.json()["slots"]]
+
+
+def list_calls(calendar: FakeCalendarService) -> int:
+    return calendar.calls.get("list", 0) + calendar.calls.get("list_incremental", 0)
+
+
+def test_planner_calendar_reflects_writes_without_sync(monkeypatch):
+    client, calendar = make_client(monkeypatch)
+    assert at(11) in slot_starts(client, id_lifeplanner=PLANNER)
+    synced = list_calls(calendar)
+
+    assert client.post("/agendar/", json=booking("5511900000001", 11)).status_code == 200
+    assert at(11) not in slot_starts(client, id_lifeplanner=PLANNER)
+
+    response = client.post("/agendar/reagendar/", json={
+        "id_lifeplanner": PLANNER, "cliente_celular": "5511900000001",
+        "new_start_time": at(14), "new_end_time": at(15),
+    })
+    assert response.status_code == 200, response.text
+    starts = slot_starts(client, id_lifeplanner=PLANNER)
+    assert at(11) in starts and at(14) not in starts
+
+    response = client.post("/agendar/cancelar/", json={"id_lifeplanner": PLANNER, "cliente_celular": "5511900000001"})
+    assert response.status_code == 200, response.text
+    assert at(14) in slot_starts(client, id_lifeplanner=PLANNER)
+
+    assert list_calls(calendar) == synced
+
+
+def test_primary_alias_receives_writes_to_its_calendar_id(monkeypatch):
+    # A "primary" da conta do serviço é a própria agenda do life planner
+    client, calendar = make_client(monkeypatch, primary_id=PLANNER_CALENDAR)
+    assert at(11) in slot_starts(client)
+    synced = list_calls(calendar)
+
+    assert client.post("/agendar/", json=booking("5511900000002", 11)).status_code == 200
+    assert at(11) not in slot_starts(client)
+    assert list_calls(calendar) == synced
+
+
+def test_unknown_planner_is_404_instead_of_fallback_calendar(monkeypatch):
+    client, calendar = make_client(monkeypatch)
+    response = client.post("/agendar/slots/", json={"date": DAY.isoformat(), "id_lifeplanner": "lp-nao-existe"})
+    assert response.status_code == 404 and "lp-nao-existe" in response.json()["detail"]
+    assert list_calls(calendar) == 0
+
+    response = client.post("/agendar/slots/range/", json={
+        "start_date": DAY.isoformat(), "life_planners": [PLANNER, "lp-nao-existe"],
+    })
+    assert response.status_code == 404 and "lp-nao-existe" in response.json()["detail"]
+    assert calendar.calls.get("freebusy", 0) == 0
+
+    # Sem id_lifeplanner continua valendo a "primary" da conta do serviço
+    assert at(11) in slot_starts(client)
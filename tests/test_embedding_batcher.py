@@ -0,0 +1,71 @@
+"""
+Micro-batching das perguntas: chamadas concorrentes viram um único
+embed_documents, e um texto problemático, um timeout ou um cancelamento só
+afetam a própria requisição.
+"""
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fakes import FakeLatencyEmbeddings
+from rag_service.embedding_batcher import MicroBatchingEmbeddings
+
+
+class PickyEmbeddings(FakeLatencyEmbeddings):
+    """Recusa qualquer chamada que contenha um texto marcado como inválido."""
+
+    def embed_documents(self, texts):
+        if any(t.startswith("ruim") for t in texts):
+            raise ValueError("texto inválido")
+        return super().embed_documents(texts)
+
+
+def test_concurrent_queries_share_one_batch():
+    underlying = FakeLatencyEmbeddings(size=8, latency=0)
+    batcher = MicroBatchingEmbeddings(underlying, window=0.02)
+    texts = ["a", "b", "c", "a", "d"]
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.aembed_query(t) for t in texts))
+
+    vectors = asyncio.run(scenario())
+    assert vectors == [underlying.embed_query(t) for t in texts]
+    stats = batcher.stats()
+    assert (stats["batches"], stats["texts_sent"], stats["deduplicated"]) == (1, 4, 1)
+
+
+def test_bad_text_fails_alone():
+    batcher = MicroBatchingEmbeddings(PickyEmbeddings(size=8, latency=0), window=0.02)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.aembed_query(t) for t in ["a", "ruim", "b"]), return_exceptions=True)
+
+    first, bad, last = asyncio.run(scenario())
+    assert isinstance(bad, ValueError)
+    assert len(first) == 8 and len(last) == 8
+    stats = batcher.stats()
+    assert (stats["batch_errors"], stats["errors"]) == (1, 1)
+
+
+def test_timeout_and_cancellation_leave_the_batch_intact():
+    batcher = MicroBatchingEmbeddings(FakeLatencyEmbeddings(size=8, latency=0.1), window=0.01, timeout=0.05)
+
+    async def scenario():
+        cancelled = asyncio.create_task(batcher.aembed_query("cancelada"))
+        patient = asyncio.create_task(batcher.aembed_query("paciente"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        # Espera o lote (com "cancelada" fora dele) e o timeout de "paciente"
+        with pytest.raises(TimeoutError):
+            await patient
+        batcher.timeout = 1.0
+        started = time.perf_counter()
+        vector = await batcher.aembed_query("depois")
+        assert time.perf_counter() - started < 0.5
+        return cancelled, vector
+
+    cancelled, vector = asyncio.run(scenario())
+    assert cancelled.cancelled() and len(vector) == 8
+    stats = batcher.stats()
+    assert stats["abandoned"] == 1 and stats["timeouts"] == 1 and stats["errors"] == 0
@@ -0,0 +1,92 @@
+"""
+Troca a quente do IndexManager: leitores concorrentes sempre enxergam um
+snapshot completo, nunca voltam para uma versão anterior, e quem já tinha
+um snapshot continua buscando nele depois da troca. Uma versão nova que
+falha na carga mantém o snapshot atual.
+"""
+import os
+import shutil
+import threading
+
+import numpy as np
+import pytest
+
+from benchmarks.fakes import FakeLatencyEmbeddings
+from rag_service.index_manager import VERSION_FILE, IndexManager
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "faiss_index")
+
+
+def publish(index_path: str, version: str) -> None:
+    with open(os.path.join(index_path, f"{VERSION_FILE}.tmp"), "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(os.path.join(index_path, f"{VERSION_FILE}.tmp"), os.path.join(index_path, VERSION_FILE))
+
+
+@pytest.fixture
+def index_path(tmp_path) -> str:
+    path = str(tmp_path / "faiss_index")
+    shutil.copytree(SOURCE, path)
+    publish(path, "v1")
+    return path
+
+
+def search(snapshot, query: np.ndarray) -> list:
+    _, positions = snapshot.vector_store.index.search(query, 4)
+    ids = [snapshot.vector_store.index_to_docstore_id[int(i)] for i in positions[0] if i != -1]
+    return snapshot.vector_store.docstore.get_many(ids)
+
+
+def test_concurrent_readers_see_complete_monotonic_snapshots(index_path):
+    manager = IndexManager(index_path, FakeLatencyEmbeddings(latency=0), poll_interval=0)
+    swaps = []
+    manager.add_listener(lambda snapshot: swaps.append(snapshot.version))
+    held = manager.load()
+    query = np.random.default_rng(0).standard_normal((1, held.vector_store.index.d)).astype("float32")
+    expected = [doc.page_content for doc in search(held, query)]
+
+    stop = threading.Event()
+    seen, errors = [[] for _ in range(8)], []
+
+    def reader(versions: list) -> None:
+        try:
+            while not stop.is_set():
+                snapshot = manager.current
+                assert [doc.page_content for doc in search(snapshot, query)] == expected
+                versions.append(snapshot.version)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reader, args=(versions,)) for versions in seen]
+    for thread in threads:
+        thread.start()
+    for version in ("v2", "v3", "v4"):
+        publish(index_path, version)
+        assert manager.reload_if_changed()
+    stop.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert errors == []
+    order = ["v1", "v2", "v3", "v4"]
+    for versions in seen:
+        ranks = [order.index(v) for v in versions]
+        assert ranks == sorted(ranks)
+    assert swaps == order and manager.current.version == "v4"
+    # Quem pegou o snapshot antes das trocas continua buscando nele
+    assert held.version == "v1" and [doc.page_content for doc in search(held, query)] == expected
+    assert not manager.reload_if_changed()
+
+
+def test_failed_reload_keeps_current_snapshot(index_path):
+    manager = IndexManager(index_path, FakeLatencyEmbeddings(latency=0), poll_interval=0)
+    current = manager.load()
+    # Um index.faiss inválido com uma versão nova publicada (o snapshot atual segue no arquivo anterior)
+    with open(os.path.join(index_path, "index.faiss.tmp"), "wb") as f:
+        f.write(b"truncado")
+    os.replace(os.path.join(index_path, "index.faiss.tmp"), os.path.join(index_path, "index.faiss"))
+    publish(index_path, "v2")
+
+    assert not manager.reload_if_changed()
+    assert manager.current is current and manager.last_error
+    assert len(current.vector_store.index.search(np.zeros((1, current.vector_store.index.d), dtype="float32"), 1)[1][0]) == 1
@@ -0,0 +1,103 @@
+"""
+Ingestão incremental: só os arquivos alterados voltam para a API de
+embeddings e os chunks de arquivos alterados ou removidos saem do índice e
+do chunks.sqlite.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.fakes import FakeLatencyEmbeddings
+from rag_service import ingest
+from rag_service.index_manager import MANIFEST_FILE, VERSION_FILE
+
+
+def parse_lines(path: str, source: str, chunk_size: int, chunk_overlap: int) -> list:
+    """Parser falso: cada linha do arquivo é um chunk (dispensa PDFs reais no teste)."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line for line in f.read().splitlines() if line]
+    return [{"text": line, "metadata": {"source": source, "page": 0, "page_label": "1", "total_pages": 1}}
+            for line in lines]
+
+
+@pytest.fixture(autouse=True)
+def fake_parser(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(ingest, "parse_and_chunk_pdf", parse_lines)
+    # Threads em vez de processos: o parser substituído vale no próprio processo do teste
+    monkeypatch.setattr(ingest, "ProcessPoolExecutor", ThreadPoolExecutor)
+
+
+def write_doc(docs, name: str, lines: list) -> None:
+    (docs / name).write_text("\n".join(lines), encoding="utf-8")
+
+
+def indexed_texts(index_path: str) -> list:
+    store = ingest.load_for_update(index_path, FakeLatencyEmbeddings(size=16, latency=0))
+    texts = [store.docstore.search(doc_id).page_content for doc_id in store.index_to_docstore_id.values()]
+    assert store.index.ntotal == len(texts)
+    return sorted(texts)
+
+
+def test_incremental_run_embeds_only_changes_and_drops_stale_chunks(tmp_path):
+    docs, index_path = tmp_path / "docs", str(tmp_path / "faiss_index")
+    docs.mkdir()
+    write_doc(docs, "a.pdf", ["a1", "a2"])
+    write_doc(docs, "b.pdf", ["b1", "b2", "b3"])
+    embeddings = FakeLatencyEmbeddings(size=16, latency=0)
+
+    first = ingest.run_ingestion(str(docs), index_path, embeddings)
+    assert (first["files_changed"], first["chunks_embedded"], first["chunks_total"]) == (2, 5, 5)
+    assert indexed_texts(index_path) == ["a1", "a2", "b1", "b2", "b3"]
+
+    # Sem mudanças: nada é embedado e a versão publicada é mantida
+    texts_before = embeddings.texts
+    again = ingest.run_ingestion(str(docs), index_path, embeddings)
+    assert again["version"] == first["version"] and again["files_unchanged"] == 2
+    assert embeddings.texts == texts_before
+
+    # b muda uma linha, a é removido e c é novo (repete um texto já indexado)
+    os.remove(docs / "a.pdf")
+    write_doc(docs, "b.pdf", ["b1", "b2-novo", "b3"])
+    write_doc(docs, "c.pdf", ["c1", "b1"])
+    third = ingest.run_ingestion(str(docs), index_path, embeddings)
+
+    assert (third["files_changed"], third["files_removed"], third["files_unchanged"]) == (2, 1, 0)
+    # Só "b2-novo" e "c1" vão para a API; os demais vetores são reaproveitados pelo hash do texto
+    assert third["chunks_embedded"] == 2 and third["chunks_reused"] == 3
+    assert embeddings.texts == texts_before + 2
+    assert indexed_texts(index_path) == ["b1", "b1", "b2-novo", "b3", "c1"]
+
+    with open(os.path.join(index_path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert sorted(manifest["files"]) == ["b.pdf", "c.pdf"]
+    with open(os.path.join(index_path, VERSION_FILE), "r", encoding="utf-8") as f:
+        assert f.read() == manifest["version"] == third["version"] != first["version"]
+
+
+def test_seeded_manifest_lets_a_legacy_index_update_incrementally(tmp_path):
+    docs, index_path = tmp_path / "docs", str(tmp_path / "faiss_index")
+    docs.mkdir()
+    write_doc(docs, "a.pdf", ["a1", "a2"])
+    write_doc(docs, "b.pdf", ["b1"])
+    embeddings = FakeLatencyEmbeddings(size=16, latency=0)
+    ingest.run_ingestion(str(docs), index_path, embeddings)
+    # Índice anterior ao manifest (como o faiss_index migrado do index.pkl)
+    os.remove(os.path.join(index_path, MANIFEST_FILE))
+    os.remove(os.path.join(index_path, VERSION_FILE))
+    os.remove(docs / "b.pdf")
+
+    report = ingest.seed_manifest(str(docs), index_path, embeddings.model)
+    assert (report["files"], report["files_missing"], report["chunks"]) == (2, ["b.pdf"], 3)
+    with open(os.path.join(index_path, VERSION_FILE), "r", encoding="utf-8") as f:
+        assert f.read() == report["version"]
+    with pytest.raises(FileExistsError):
+        ingest.seed_manifest(str(docs), index_path, embeddings.model)
+
+    # a.pdf não muda: nada é embedado e só os chunks do b.pdf removido saem
+    texts_before = embeddings.texts
+    updated = ingest.run_ingestion(str(docs), index_path, embeddings)
+    assert (updated["files_unchanged"], updated["files_removed"], updated["chunks_embedded"]) == (1, 1, 0)
+    assert embeddings.texts == texts_before
+    assert indexed_texts(index_path) == ["a1", "a2"]
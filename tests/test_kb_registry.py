@@ -0,0 +1,102 @@
+"""
+Registro de bases: um reload forçado não é absorvido por uma carga sem force
+que já estava em andamento; estatísticas de todas as bases registradas; e o
+orçamento de memória sem as páginas mapeadas do index.faiss.
+"""
+import os
+import threading
+from types import SimpleNamespace
+
+from benchmarks.fakes import FakeLatencyEmbeddings
+from rag_service.index_manager import IndexManager
+from rag_service.kb_registry import KnowledgeBaseRegistry
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "faiss_index")
+
+
+class BlockingManager:
+    """IndexManager falso: registra o 'force' de cada load; o primeiro espera 'release'."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.snapshot = None
+        self.forces = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def load(self, force: bool = False):
+        self.forces.append(force)
+        self.started.set()
+        if len(self.forces) == 1:
+            assert self.release.wait(5)
+        self.snapshot = SimpleNamespace(path=self.path, lexical_index=None, version=f"v{len(self.forces)}")
+        return self.snapshot
+
+    def unload(self) -> bool:
+        snapshot, self.snapshot = self.snapshot, None
+        return snapshot is not None
+
+
+def make_registry():
+    managers = {}
+
+    def factory(kb_id: str, path: str) -> BlockingManager:
+        managers[kb_id] = BlockingManager(path)
+        return managers[kb_id]
+
+    return KnowledgeBaseRegistry(factory, {"vida": "/nao/existe"}), managers
+
+
+def start_blocked_load(registry: KnowledgeBaseRegistry, managers: dict, force: bool):
+    """Dispara a primeira carga da base e espera ela começar (presa no 'release')."""
+    future = registry._load_future(registry._base("vida"), force=force)
+    assert managers["vida"].started.wait(5)
+    return future
+
+
+def test_forced_reload_runs_after_in_flight_unforced_load():
+    registry, managers = make_registry()
+    first = start_blocked_load(registry, managers, force=False)
+    forced = [registry._load_future(registry._base("vida"), force=True) for _ in range(2)]
+    assert forced[0] is forced[1] and forced[0] is not first
+    managers["vida"].release.set()
+    assert first.result(5).version == "v1"
+    assert forced[0].result(5).version == "v2"
+    # Uma carga sem force e um único force para os dois pedidos
+    assert managers["vida"].forces == [False, True]
+
+
+def test_unforced_acquire_coalesces_with_in_flight_forced_reload():
+    registry, managers = make_registry()
+    forced = start_blocked_load(registry, managers, force=True)
+    assert registry._load_future(registry._base("vida")) is forced
+    managers["vida"].release.set()
+    assert forced.result(5).version == "v1"
+    assert managers["vida"].forces == [True]
+
+
+def make_index_registry(mmap: bool) -> KnowledgeBaseRegistry:
+    def factory(kb_id: str, path: str) -> IndexManager:
+        return IndexManager(path, FakeLatencyEmbeddings(latency=0), poll_interval=0, mmap=mmap)
+
+    return KnowledgeBaseRegistry(factory, {"vida": INDEX_PATH, "saude": INDEX_PATH}, pinned=["vida"], poll_interval=0)
+
+
+def test_stats_report_every_registered_base():
+    registry = make_index_registry(mmap=True)
+    registry.acquire("vida")
+    bases = registry.stats()["knowledge_bases"]
+    assert sorted(bases) == ["saude", "vida"]
+    assert bases["vida"]["resident"] and bases["vida"]["index"]["vectors"] == bases["vida"]["vectors"] > 0
+    assert not bases["saude"]["resident"] and bases["saude"]["index"] is None
+    assert bases["saude"]["path"] == INDEX_PATH
+
+
+def test_memory_budget_counts_only_unmapped_index_bytes():
+    file_size = os.path.getsize(os.path.join(INDEX_PATH, "index.faiss"))
+    mapped, copied = make_index_registry(mmap=True), make_index_registry(mmap=False)
+    mapped.acquire("vida")
+    copied.acquire("vida")
+    # Sem mmap o index.faiss inteiro está no heap; com mmap só o que não é código de vetor (cabeçalho) e o lexical
+    assert copied.memory_bytes() > file_size
+    assert mapped.memory_bytes() < copied.memory_bytes() - file_size // 2
@@ -0,0 +1,138 @@
+"""
+Outbox do Supabase: idempotência por event_id, novas tentativas com backoff,
+'dead' após max_attempts (até um replay), lease entre processos e as rotas
+administrativas protegidas por token.
+"""
+import time
+
+from fastapi.testclient import TestClient
+
+import scheduler_service.main as scheduler
+from outbox import SupabaseOutbox
+
+
+def test_outbox_routes_require_admin_token(monkeypatch):
+    client = TestClient(scheduler.app)
+
+    # Sem token configurado as rotas ficam fechadas, mesmo com o header
+    monkeypatch.setattr(scheduler, "SCHEDULER_ADMIN_TOKEN", None)
+    assert client.get("/agendar/outbox/", headers={"X-Admin-Token": "x"}).status_code == 403
+    assert client.post("/agendar/outbox/replay/", json={}).status_code == 403
+
+    monkeypatch.setattr(scheduler, "SCHEDULER_ADMIN_TOKEN", "segredo")
+    assert client.get("/agendar/outbox/").status_code == 401
+    assert client.post("/agendar/outbox/replay/", json={}, headers={"X-Admin-Token": "errado"}).status_code == 401
+
+    response = client.get("/agendar/outbox/", headers={"X-Admin-Token": "segredo"})
+    assert response.status_code == 200, response.text
+    assert "stats" in response.json()
+    response = client.post("/agendar/outbox/replay/", json={"status": "dead"}, headers={"X-Admin-Token": "segredo"})
+    assert response.status_code == 200 and response.json()["requeued"] == 0
+
+
+class Writer:
+    """Escritor falso: grava as linhas recebidas; 'fail' recusa o lote inteiro, 'bad' recusa linhas específicas."""
+
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+        self.bad = set()
+
+    def __call__(self, rows):
+        if self.fail:
+            raise ConnectionError("Supabase indisponível")
+        if any(row["id"] in self.bad for row in rows):
+            raise ValueError("linha inválida")
+        self.batches.append([row["id"] for row in rows])
+
+    @property
+    def written(self):
+        return [row_id for batch in self.batches for row_id in batch]
+
+
+def make_outbox(path, writer, **options) -> SupabaseOutbox:
+    # flush_interval=0: sem worker em segundo plano, os envios acontecem só nos flush() do teste
+    return SupabaseOutbox(str(path), {"agendamentos": writer}, flush_interval=0, **options)
+
+
+def test_same_event_id_is_enqueued_and_written_once(tmp_path):
+    writer = Writer()
+    box = make_outbox(tmp_path / "outbox.sqlite", writer)
+    assert box.enqueue("agendamentos", "ev-1", {"id": 1})
+    assert not box.enqueue("agendamentos", "ev-1", {"id": 1})
+    assert box.enqueue_many("agendamentos", [("ev-1", {"id": 1}), ("ev-2", {"id": 2})]) == 1
+
+    assert box.flush() == {"flushed": 2, "failed": 0, "dead": 0}
+    # Já gravado: um novo enqueue do mesmo evento não volta à fila
+    assert not box.enqueue("agendamentos", "ev-2", {"id": 2})
+    assert box.flush()["flushed"] == 0
+    assert writer.batches == [[1, 2]]
+    assert box.counts() == {"pending": 0, "done": 2, "dead": 0}
+    assert box.stats()["duplicates"] == 3
+
+
+def test_failed_write_backs_off_and_stays_pending(tmp_path):
+    writer = Writer()
+    box = make_outbox(tmp_path / "outbox.sqlite", writer, base_backoff=10)
+    box.enqueue("agendamentos", "ev-1", {"id": 1})
+    writer.fail = True
+    before = time.time()
+    assert box.flush() == {"flushed": 0, "failed": 1, "dead": 0}
+
+    entry = box.entries()[0]
+    assert entry["status"] == "pending" and entry["attempts"] == 1
+    assert "indisponível" in entry["last_error"]
+    # Jitter entre 50% e 100% do backoff: a entrada só volta depois de pelo menos 5s
+    assert entry["next_attempt_at"] >= before + 5
+    writer.fail = False
+    assert box.flush()["flushed"] == 0
+    # O envio explícito (flush_events, usado por find_active_booking) ignora o backoff
+    assert box.flush_events("agendamentos", ["ev-1"])["flushed"] == 1
+    assert writer.written == [1]
+
+
+def test_entry_goes_dead_after_max_attempts_until_replay(tmp_path):
+    writer = Writer()
+    box = make_outbox(tmp_path / "outbox.sqlite", writer, max_attempts=3, base_backoff=0)
+    box.enqueue("agendamentos", "ev-1", {"id": 1})
+    writer.fail = True
+    # Sem backoff a entrada vence na hora: limit=1 faz uma tentativa por flush
+    results = [box.flush(limit=1) for _ in range(4)]
+    assert [r["failed"] for r in results] == [1, 1, 1, 0]
+    assert results[2]["dead"] == 1
+    assert box.counts()["dead"] == 1 and box.entries("dead")[0]["attempts"] == 3
+
+    writer.fail = False
+    assert box.flush()["flushed"] == 0
+    assert box.replay() == 1
+    assert box.entries()[0]["attempts"] == 0
+    assert box.flush()["flushed"] == 1
+    assert box.counts() == {"pending": 0, "done": 1, "dead": 0}
+
+
+def test_bad_row_does_not_hold_the_batch(tmp_path):
+    writer = Writer()
+    box = make_outbox(tmp_path / "outbox.sqlite", writer, base_backoff=10)
+    box.enqueue_many("agendamentos", [(f"ev-{i}", {"id": i}) for i in range(4)])
+    writer.bad = {2}
+    assert box.flush() == {"flushed": 3, "failed": 1, "dead": 0}
+    assert sorted(writer.written) == [0, 1, 3]
+    assert [e["event_id"] for e in box.entries("pending")] == ["ev-2"]
+
+
+def test_lease_keeps_other_processes_off_until_it_expires(tmp_path):
+    path = tmp_path / "outbox.sqlite"
+    first = make_outbox(path, Writer(), lease_seconds=0.2)
+    second_writer = Writer()
+    second = make_outbox(path, second_writer)
+    first.enqueue_many("agendamentos", [("ev-1", {"id": 1}), ("ev-2", {"id": 2})])
+
+    # O primeiro reservou o lote e "morreu" antes de enviar: o segundo não o pega durante o lease
+    assert len(first._claim(10)) == 2
+    assert second.flush()["flushed"] == 0
+    assert second.flush_events("agendamentos", ["ev-1"])["flushed"] == 0
+
+    time.sleep(0.25)
+    assert second.flush()["flushed"] == 2
+    assert sorted(second_writer.written) == [1, 2]
+    assert first.counts() == {"pending": 0, "done": 2, "dead": 0}
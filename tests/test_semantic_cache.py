@@ -0,0 +1,64 @@
+"""
+Cache semântico: paráfrases acima do limiar reaproveitam a resposta, mas
+entradas de outra versão do índice, vencidas pelo TTL ou de outro namespace
+nunca são servidas.
+"""
+import time
+
+import numpy as np
+
+from rag_service.semantic_cache import SemanticCache
+
+
+def vector(seed: int, noise: float = 0.0) -> list:
+    base = np.random.default_rng(seed).standard_normal(32)
+    if noise:
+        base = base + noise * np.random.default_rng(seed + 1000).standard_normal(32)
+    return base.astype("float32").tolist()
+
+
+def test_paraphrase_hits_only_on_the_same_index_version():
+    cache = SemanticCache(threshold=0.95)
+    cache.store("Qual a carência?", vector(1), "30 dias", index_version="v1")
+
+    hit = cache.lookup(vector(1, noise=0.01), "v1")
+    assert hit["answer"] == "30 dias" and hit["similarity"] >= 0.95
+    assert cache.lookup(vector(2), "v1") is None
+
+    # Outra versão do faiss_index: a entrada é descartada na própria consulta
+    assert cache.lookup(vector(1), "v2") is None
+    assert cache.stats()["entries"] == 0 and cache.stats()["expired"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = SemanticCache(ttl_seconds=0.05)
+    cache.store("Qual a carência?", vector(1), "30 dias", index_version="v1")
+    assert cache.lookup(vector(1), "v1") is not None
+    time.sleep(0.1)
+    assert cache.lookup(vector(1), "v1") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_namespaces_are_isolated_and_invalidated_by_prefix():
+    cache = SemanticCache()
+    cache.store("Qual a carência?", vector(1), "vida", index_version="v1", namespace="seguro-vida:dense")
+    cache.store("Qual a carência?", vector(1), "auto", index_version="a1", namespace="seguro-auto:dense")
+
+    assert cache.lookup(vector(1), "v1", namespace="seguro-vida:dense")["answer"] == "vida"
+    assert cache.lookup(vector(1), "a1", namespace="seguro-auto:dense")["answer"] == "auto"
+    assert cache.lookup(vector(1), "v1", namespace="seguro-vida:hybrid") is None
+
+    # Troca do índice de seguro-vida: só as entradas dele e de outras versões saem
+    assert cache.invalidate(keep_version="v2", namespace_prefix="seguro-vida:") == 1
+    assert cache.lookup(vector(1), "v1", namespace="seguro-vida:dense") is None
+    assert cache.lookup(vector(1), "a1", namespace="seguro-auto:dense")["answer"] == "auto"
+    assert cache.stats()["invalidated"] == 1
+
+
+def test_oldest_entries_are_evicted_past_max_entries():
+    cache = SemanticCache(max_entries=2)
+    for seed in (1, 2, 3):
+        cache.store(f"pergunta {seed}", vector(seed), f"resposta {seed}", index_version="v1")
+    assert cache.stats()["entries"] == 2
+    assert cache.lookup(vector(1), "v1") is None
+    assert cache.lookup(vector(3), "v1")["answer"] == "resposta 3"
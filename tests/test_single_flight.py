@@ -0,0 +1,58 @@
+"""
+Single-flight: requisições idênticas em andamento executam a computação uma
+vez; o cancelamento do líder não derruba os seguidores, e um erro chega a
+todos sem ficar preso no mapa.
+"""
+import asyncio
+
+import pytest
+
+from rag_service.single_flight import SingleFlight
+
+
+def test_followers_get_the_result_when_the_leader_is_cancelled():
+    flight = SingleFlight("teste")
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "resposta"
+
+    async def scenario():
+        leader = asyncio.create_task(flight.run("pergunta", compute))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flight.run("pergunta", compute)) for _ in range(3)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results
+
+    assert asyncio.run(scenario()) == [("resposta", True)] * 3
+    assert calls == [1]
+    stats = flight.stats()
+    assert (stats["leaders"], stats["coalesced"], stats["abandoned"], stats["in_flight"]) == (1, 3, 1, 0)
+    assert stats["max_followers"] == 3
+
+
+def test_errors_reach_every_waiter_and_the_key_is_released():
+    flight = SingleFlight("teste")
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("LLM indisponível")
+
+    async def ok():
+        return "resposta"
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.run("pergunta", failing) for _ in range(3)), return_exceptions=True)
+        # A chave saiu do mapa: a próxima requisição vira líder de uma nova computação
+        return results, await flight.run("pergunta", ok)
+
+    results, retry = asyncio.run(scenario())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert retry == ("resposta", False)
+    assert flight.stats()["errors"] == 1 and flight.stats()["leaders"] == 2
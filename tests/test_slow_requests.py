@@ -0,0 +1,46 @@
+"""
+Log de requisições lentas: /ask, /ask/stream e /ask/batch registram o tempo
+das etapas em todas as saídas, inclusive respostas do cache semântico.
+"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import rag
+from benchmarks.fakes import FakeLatencyEmbeddings, FakeLatencyLLM
+
+
+@pytest.fixture
+def client(monkeypatch: pytest.MonkeyPatch) -> TestClient:
+    monkeypatch.setattr(rag.llm_client, "_value", FakeLatencyLLM(latency=0, token_latency=0))
+    monkeypatch.setattr(rag.embedding_batcher, "underlying", FakeLatencyEmbeddings(latency=0))
+    # Qualquer requisição conta como lenta
+    monkeypatch.setattr(rag, "RAG_SLOW_REQUEST_SECONDS", 1e-9)
+    return TestClient(rag.app)
+
+
+def slow_logs(output: str) -> list:
+    lines = [json.loads(line) for line in output.splitlines() if line.startswith('{"event": "slow_request"')]
+    return [(line["route"], line["timings_ms"]) for line in lines]
+
+
+@pytest.mark.parametrize("route, body", [
+    ("/ask", {"question": "Qual a carência do seguro de vida?"}),
+    ("/ask/stream", {"question": "Quais coberturas tem o seguro de vida?"}),
+    ("/ask/batch", {"questions": ["Como funciona o resgate do seguro de vida?"]}),
+])
+def test_every_rag_route_logs_generated_and_cached_answers(client, capsys, route, body):
+    for expected_stages in (("embed", "search", "generate"), ("embed", "cache")):
+        capsys.readouterr()
+        assert client.post(route, json=body).status_code == 200
+        logs = slow_logs(capsys.readouterr().out)
+        assert [r for r, _ in logs] == [route]
+        assert set(expected_stages) <= set(logs[0][1]) and "total" in logs[0][1]
+    # A segunda chamada veio do cache semântico: sem busca nem geração
+    assert "generate" not in logs[0][1]
+
+
+def test_stream_logs_requests_rejected_before_streaming(client, capsys):
+    assert client.post("/ask/stream", json={"question": "x", "kb": "nao-existe"}).status_code == 404
+    assert [r for r, _ in slow_logs(capsys.readouterr().out)] == ["/ask/stream"]
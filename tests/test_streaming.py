@@ -0,0 +1,96 @@
+"""
+/ask/stream com um LLM falso em streaming: ordem dos eventos SSE
+(metadata, tokens, done) e interrupção da geração quando o cliente
+desconecta.
+"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import rag
+from benchmarks.fakes import FakeLatencyEmbeddings
+
+TOKENS = ["Pontos", " do", " contexto", " da", " apólice."]
+
+
+class FakeStreamingLLM:
+    """
+    astream devolve um iterador que conta os tokens entregues. Não é um
+    gerador assíncrono (que o loop fecharia sozinho ao ser coletado): só
+    fica 'closed' se quem consome chamar aclose().
+    """
+
+    def __init__(self, tokens):
+        self.tokens = list(tokens)
+        self.sent = 0
+        self.closed = False
+
+    def astream(self, prompt: str) -> "FakeStreamingLLM":
+        return self
+
+    def __aiter__(self) -> "FakeStreamingLLM":
+        return self
+
+    async def __anext__(self) -> str:
+        if self.closed or self.sent >= len(self.tokens):
+            raise StopAsyncIteration
+        self.sent += 1
+        return self.tokens[self.sent - 1]
+
+    async def aclose(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def llm(monkeypatch: pytest.MonkeyPatch) -> FakeStreamingLLM:
+    fake = FakeStreamingLLM(TOKENS)
+    monkeypatch.setattr(rag.llm_client, "_value", fake)
+    monkeypatch.setattr(rag.embedding_batcher, "underlying", FakeLatencyEmbeddings(latency=0))
+    # Sem cache semântico: toda pergunta passa pelo LLM
+    monkeypatch.setattr(rag.semantic_cache, "max_entries", 0)
+    return fake
+
+
+def parse_events(text: str) -> list:
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def ask_stream(question: str) -> list:
+    response = TestClient(rag.app).post("/ask/stream", json={"question": question})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/event-stream")
+    return parse_events(response.text)
+
+
+def test_events_arrive_as_metadata_tokens_done(llm):
+    events = ask_stream("Qual a carência da apólice de vida inteira?")
+
+    names = [name for name, _ in events]
+    assert names == ["metadata"] + ["token"] * len(TOKENS) + ["done"]
+    metadata = events[0][1]
+    assert metadata["cache_hit"] is False and metadata["kb"] == rag.RAG_DEFAULT_KB
+    assert [data["text"] for name, data in events if name == "token"] == TOKENS
+    assert events[-1][1]["message"] == "".join(TOKENS)
+    assert llm.sent == len(TOKENS) and llm.closed
+
+
+def test_client_disconnect_stops_tokens_and_closes_llm_stream(llm, monkeypatch):
+    checks = {"n": 0}
+
+    async def disconnects_on_third_token(self) -> bool:
+        checks["n"] += 1
+        return checks["n"] >= 3
+
+    monkeypatch.setattr(Request, "is_disconnected", disconnects_on_third_token)
+    events = ask_stream("Quais coberturas a apólice de vida inteira oferece?")
+
+    # Dois tokens entregues; o terceiro foi lido do LLM, mas o cliente já tinha saído
+    assert [name for name, _ in events] == ["metadata", "token", "token"]
+    assert llm.sent == 3 < len(TOKENS)
+    assert llm.closed